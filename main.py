@@ -1,16 +1,229 @@
 import customtkinter as ctk
-from tkinter import filedialog, messagebox
-import subprocess
+from tkinter import filedialog, messagebox, Menu, Canvas
 import threading
+import time
 import os
 import sys
 import json
 from datetime import datetime
 
+from pdfcompressor import core
+from pdfcompressor import ghostscript
+from pdfcompressor import preflight
+from pdfcompressor import presets
+from pdfcompressor import shard
+from pdfcompressor import walk
+from pdfcompressor.cache import ResultCache
+from pdfcompressor.control import BatchControl
+from pdfcompressor.dedupe import DuplicateFinder
+from pdfcompressor.journal import BatchJournal
+from pdfcompressor.memory import MemoryBudget
+from pdfcompressor.metrics import MetricsRecorder
+from pdfcompressor.pipeline import open_pipeline
+from pdfcompressor.schedule import CostModel, Scheduler, default_model_path
+from pdfcompressor.uibus import UpdateBus, pump
+
 # --- Pengaturan Tampilan ---
 ctk.set_appearance_mode("Dark")  # Set default to Dark mode
 ctk.set_default_color_theme("blue")
 
+# Files of a selected folder listed before compressing; the batch walks the whole folder itself
+FOLDER_PREVIEW = 1000
+
+class FileListView(ctk.CTkFrame):
+    """File list that only draws the rows in view.
+
+    Sizes are read by a background thread and reach the window in chunks,
+    so selecting thousands of files does not freeze it. Adding or removing
+    files only reads and totals the files that changed.
+    """
+
+    ROW_PADDING = 4
+    STAT_CHUNK = 500
+    STAT_INTERVAL = 0.1
+    WHEEL_ROWS = 3
+
+    def __init__(self, master, bus, height=80, on_change=None, **kwargs):
+        super().__init__(master, height=height, **kwargs)
+        theme = ctk.ThemeManager.theme["CTkTextbox"]
+        self.configure(fg_color=theme["fg_color"])
+        # Sizes read in the background reach the list through the app's update bus
+        self.bus = bus
+        self.on_change = on_change
+        self.paths = []
+        self.sizes = {}
+        self.total_size = 0
+        self.top = 0
+        self._listed = set()
+        self._unsized = set()
+        self._generation = 0
+        self._rows = []
+
+        self.font = ctk.CTkFont()
+        self.row_height = self.font.metrics("linespace") + self.ROW_PADDING
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        self.canvas = Canvas(self, height=self._apply_widget_scaling(height), highlightthickness=0, borderwidth=0)
+        self.canvas.grid(row=0, column=0, padx=(8, 0), pady=6, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, padx=(0, 3), pady=3, sticky="ns")
+        self.canvas.bind("<Configure>", lambda event: self.draw())
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(sequence, self._on_wheel)
+        self._apply_colors()
+
+    def _apply_colors(self):
+        theme = ctk.ThemeManager.theme["CTkTextbox"]
+        self.canvas.configure(bg=self._apply_appearance_mode(theme["fg_color"]))
+        self._text_color = self._apply_appearance_mode(theme["text_color"])
+        for item in self._rows:
+            self.canvas.itemconfigure(item, fill=self._text_color)
+
+    def _set_appearance_mode(self, mode_string):
+        super()._set_appearance_mode(mode_string)
+        if hasattr(self, "canvas"):
+            self._apply_colors()
+
+    # --- Contents ---
+
+    def set_paths(self, paths):
+        """Show ``paths``; sizes already known are kept, new files are read"""
+        paths = list(dict.fromkeys(paths))
+        wanted = set(paths)
+        self._forget([path for path in self.paths if path not in wanted])
+        added = [path for path in paths if path not in self._listed]
+        self.paths = paths
+        self._listed = wanted
+        self._stat(added)
+        self._changed()
+
+    def add_paths(self, paths):
+        """Append the files not listed yet"""
+        added = [path for path in dict.fromkeys(paths) if path not in self._listed]
+        self.paths.extend(added)
+        self._listed.update(added)
+        self._stat(added)
+        self._changed()
+
+    def remove_paths(self, paths):
+        """Drop ``paths`` from the list and the totals"""
+        removed = self._listed.intersection(paths)
+        if not removed:
+            return
+        self._forget(removed)
+        self._listed -= removed
+        self.paths = [path for path in self.paths if path not in removed]
+        self._changed()
+
+    def clear(self):
+        self._generation += 1
+        self.paths = []
+        self.sizes.clear()
+        self.total_size = 0
+        self.top = 0
+        self._listed = set()
+        self._unsized = set()
+        self._changed()
+
+    @property
+    def pending(self):
+        """Files whose size has not been read yet"""
+        return len(self._unsized)
+
+    def path_at(self, y):
+        """Path of the row at canvas height ``y``, or None"""
+        index = self.top + int(y // self.row_height)
+        return self.paths[index] if 0 <= index < len(self.paths) else None
+
+    def _forget(self, paths):
+        for path in paths:
+            self.total_size -= self.sizes.pop(path, 0)
+            self._unsized.discard(path)
+
+    def _changed(self):
+        self.draw()
+        if self.on_change is not None:
+            self.on_change(len(self.paths), self.total_size, self.pending)
+
+    # --- Background sizes ---
+
+    def _stat(self, paths):
+        if not paths:
+            return
+        self._unsized.update(paths)
+        threading.Thread(target=self._stat_worker, args=(paths, self._generation),
+                         daemon=True, name="pdfc-stat").start()
+
+    def _stat_worker(self, paths, generation):
+        chunk = []
+        last_sent = time.monotonic()
+        for path in paths:
+            if generation != self._generation:
+                # The list was cleared meanwhile
+                return
+            chunk.append((path, core.get_file_size(path)))
+            if len(chunk) >= self.STAT_CHUNK or time.monotonic() - last_sent >= self.STAT_INTERVAL:
+                self.bus.call(self._add_sizes, chunk, generation)
+                chunk = []
+                last_sent = time.monotonic()
+        if chunk:
+            self.bus.call(self._add_sizes, chunk, generation)
+
+    def _add_sizes(self, chunk, generation):
+        if generation != self._generation:
+            return
+        for path, size in chunk:
+            # Files removed while their size was being read are skipped
+            if path in self._unsized:
+                self._unsized.remove(path)
+                self.sizes[path] = size
+                self.total_size += size
+        self._changed()
+
+    # --- Drawing ---
+
+    def _visible_rows(self):
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def draw(self):
+        """Redraw the rows in view; costs the same for 10 or 10,000 files"""
+        visible = self._visible_rows()
+        # One more row for the partly visible one at the bottom
+        while len(self._rows) < visible + 1:
+            self._rows.append(self.canvas.create_text(0, 0, anchor="nw", font=self.font, fill=self._text_color))
+        while len(self._rows) > visible + 1:
+            self.canvas.delete(self._rows.pop())
+        self.top = max(0, min(self.top, len(self.paths) - visible))
+        for row, item in enumerate(self._rows):
+            index = self.top + row
+            text = self._row_text(self.paths[index]) if index < len(self.paths) else ""
+            self.canvas.itemconfigure(item, text=text)
+            self.canvas.coords(item, 0, row * self.row_height + self.ROW_PADDING // 2)
+        if self.paths:
+            self.scrollbar.set(self.top / len(self.paths), min(1.0, (self.top + visible) / len(self.paths)))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _row_text(self, path):
+        filename = os.path.basename(path)
+        if path in self.sizes:
+            return f"{filename} ({core.format_file_size(self.sizes[path])})"
+        return f"{filename} (...)"
+
+    def scroll_to(self, top):
+        self.top = top
+        self.draw()
+
+    def _on_scrollbar(self, command, *args):
+        if command == "moveto":
+            self.scroll_to(int(float(args[0]) * len(self.paths)))
+
+    def _on_wheel(self, event):
+        # <MouseWheel> on Windows and macOS, buttons 4 and 5 on X11
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.scroll_to(self.top + (-self.WHEEL_ROWS if up else self.WHEEL_ROWS))
+
+
 class PDFCompressorApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -18,6 +231,7 @@ class PDFCompressorApp(ctk.CTk):
         # --- Initialize Settings ---
         self.settings_file = "settings.json"
         self.recent_files_file = "recent_files.json"
+        self.journal_file = "batch_journal.jsonl"
         self.load_settings()
         self.load_recent_files()
 
@@ -29,6 +243,15 @@ class PDFCompressorApp(ctk.CTk):
 
         # --- Variabel ---
         self.input_file_paths = []
+        # Folder whose tree is mirrored under the output folder, and the current preview scan of it.
+        # Only the first FOLDER_PREVIEW files are listed; the batch walks the folder itself.
+        self.input_folder = None
+        self.folder_scan = 0
+        self.scanning_folder = False
+        self.folder_preview_full = False
+        self.folder_removed = set()
+        self.resume_batch = False
+        self.batch_control = None
         self.output_folder_path = ctk.StringVar()
         self.ghostscript_path = self.get_ghostscript_path()
         self.current_theme = ctk.StringVar(value=self.settings.get("theme", "Dark"))
@@ -38,33 +261,73 @@ class PDFCompressorApp(ctk.CTk):
         self.compressed_sizes = {}
 
         # --- Mapping Level Kompresi ---
-        self.compression_levels = {
-            "Ekstrem (Perkiraan kompresi 70-95%)": [
-                "-dPDFSETTINGS=/screen",
-                "-dColorImageResolution=72",
-                "-dGrayImageResolution=72", 
-                "-dMonoImageResolution=72",
-                "-dDownsampleColorImages=true",
-                "-dDownsampleGrayImages=true",
-                "-dDownsampleMonoImages=true",
-                "-dColorImageDownsampleType=/Bicubic",
-                "-dGrayImageDownsampleType=/Bicubic",
-                "-dMonoImageDownsampleType=/Bicubic",
-                "-dConvertCMYKImagesToRGB=true",
-                "-dDetectDuplicateImages=true",
-                "-dCompressFonts=true",
-                "-dSubsetFonts=true",
-                "-dOptimize=true"
-            ],
-            "Rendah (Kompresi Tinggi, ~60-85%)": "/screen",
-            "Sedang (Seimbang, ~40-70%)": "/ebook",
-            "Tinggi (Kualitas Cetak, ~10-30%)": "/printer",
-            "Sangat Tinggi (Prepress, ~0-15%)": "/prepress"
-        }
+        self.compression_levels = dict(core.COMPRESSION_LEVELS)
+        # Preset kustom dari settings.json; yang tidak valid dilewati
+        custom_presets, problems = presets.load_presets(self.settings.get(presets.SETTINGS_KEY, {}))
+        self.compression_levels.update(custom_presets)
+        # Aturan preset per jenis dokumen (nama file, ukuran, jumlah halaman)
+        self.preset_rules, rule_problems = presets.load_rules(self.settings, custom_presets)
+        self.preset_problems = problems + rule_problems
+
+        # Worker threads post UI state here; the newest values are applied 30 times a second
+        self.ui_bus = UpdateBus()
 
         # --- Membuat Widget GUI ---
         self.create_widgets()
         self.set_icon()
+        pump(self, self.ui_bus, {
+            "progress": self.progressbar.set,
+            "status": lambda text: self.status_label.configure(text=text),
+            "current_file": lambda text: self.current_file_label.configure(text=text),
+            "size_info": lambda text: self.size_info_label.configure(text=text),
+        })
+        if self.preset_problems:
+            self.after(200, self.show_preset_problems)
+        self.after(300, self.offer_resume)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        """Stop running Ghostscript processes before the window closes"""
+        if self.batch_control is not None:
+            if not messagebox.askyesno("Keluar", "Kompresi masih berjalan. Batalkan dan keluar?"):
+                return
+            self.batch_control.cancel()
+        self.destroy()
+
+    def show_preset_problems(self):
+        """Tell the user which presets and rules in settings.json were skipped"""
+        shown = "\n".join(f"• {problem}" for problem in self.preset_problems[:10])
+        more = len(self.preset_problems) - 10
+        if more > 0:
+            shown += f"\n• ... dan {more} lainnya"
+        messagebox.showwarning("Preset Diabaikan",
+                               f"Preset atau aturan berikut di settings.json tidak valid dan dilewati:\n\n{shown}")
+
+    def offer_resume(self):
+        """Offer to finish a batch that was interrupted last time"""
+        journal = BatchJournal(self.journal_file)
+        unfinished = [job for job in journal.unfinished() if os.path.exists(job[0])]
+        if not unfinished:
+            return
+        jobs = [job for job in journal.jobs() if os.path.exists(job[0])]
+        if not messagebox.askyesno("Lanjutkan Batch",
+                                   f"Batch sebelumnya belum selesai: {len(unfinished)} dari {len(jobs)} file "
+                                   f"belum berhasil dikompresi.\n\nLanjutkan batch tersebut?"):
+            # Declined: forget the batch so the question is not asked again
+            try:
+                os.remove(self.journal_file)
+            except OSError:
+                pass
+            return
+        self.input_file_paths = [input_path for input_path, _output in jobs]
+        self.update_file_display()
+        self.output_folder_path.set(os.path.dirname(jobs[0][1]))
+        level = (journal.settings or {}).get("level")
+        for label, quality_setting in self.compression_levels.items():
+            if quality_setting == level:
+                self.quality_menu.set(label)
+                break
+        self.resume_batch = True
 
     def load_settings(self):
         """Load user settings from JSON file"""
@@ -77,6 +340,16 @@ class PDFCompressorApp(ctk.CTk):
         except:
             self.settings = {"theme": "Dark"}
 
+    def get_max_workers(self):
+        """Number of Ghostscript processes allowed to run at the same time"""
+        try:
+            workers = int(self.settings.get("max_workers", 0))
+        except (TypeError, ValueError):
+            workers = 0
+        if workers <= 0:
+            workers = core.default_workers()
+        return workers
+
     def save_settings(self):
         """Save user settings to JSON file"""
         try:
@@ -146,20 +419,21 @@ class PDFCompressorApp(ctk.CTk):
             pass
 
     def get_ghostscript_path(self):
-        """Find Ghostscript executable path"""
-        if getattr(sys, 'frozen', False):
-            base_path = sys._MEIPASS
-        else:
-            base_path = os.path.dirname(os.path.abspath(__file__))
-        
-        gs_path = os.path.join(base_path, "gswin64c.exe")
-        
-        if not os.path.exists(gs_path):
-            messagebox.showerror("Error", "gswin64c.exe tidak ditemukan!\n\nPastikan file tersebut ada di folder yang sama dengan aplikasi.")
-            self.after(100, self.destroy)
-            return None
+        """Find Ghostscript: settings, PDFC_GHOSTSCRIPT, bundled, PATH or the usual install folders"""
+        gs_path = ghostscript.find_ghostscript(settings=self.settings)
+
+        if gs_path is None:
+            self.show_ghostscript_missing()
         return gs_path
 
+    def show_ghostscript_missing(self):
+        messagebox.showerror(
+            "Error",
+            "Ghostscript tidak ditemukan!\n\n"
+            "Pasang Ghostscript (gs / gswin64c.exe), letakkan di folder yang sama dengan aplikasi, "
+            f"atau isi \"{ghostscript.SETTINGS_KEY}\" di settings.json "
+            f"(atau variabel lingkungan {ghostscript.ENV_VAR}).")
+
     def create_widgets(self):
         """Create and layout all GUI elements"""
         self.grid_columnconfigure(0, weight=1)
@@ -203,14 +477,29 @@ class PDFCompressorApp(ctk.CTk):
         file_frame.grid(row=2, column=0, padx=10, pady=5, sticky="ew")
         file_frame.grid_columnconfigure(0, weight=1)
 
-        self.file_list_textbox = ctk.CTkTextbox(file_frame, height=80, state="disabled")
-        self.file_list_textbox.grid(row=0, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+        # Only the visible rows are drawn; sizes are read in the background
+        self.file_list = FileListView(file_frame, self.ui_bus, height=80, on_change=self.update_file_totals)
+        self.file_list.grid(row=0, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
+        self.original_sizes = self.file_list.sizes
+        # Right-click a file while compressing to cancel, pause or resume just that file
+        self.file_menu = Menu(self, tearoff=0)
+        self.file_menu.add_command(label="Batalkan file ini", command=lambda: self.control_file("cancel"))
+        self.file_menu.add_command(label="Jeda file ini", command=lambda: self.control_file("pause"))
+        self.file_menu.add_command(label="Lanjutkan file ini", command=lambda: self.control_file("resume"))
+        # ... or, before starting, to take it off the list
+        self.list_menu = Menu(self, tearoff=0)
+        self.list_menu.add_command(label="Hapus dari daftar", command=self.remove_menu_file)
+        self.menu_file_path = None
+        self.file_list.canvas.bind("<Button-3>", self.show_file_menu)
 
         self.browse_button = ctk.CTkButton(file_frame, text="Pilih File PDF... (Multi-select: Ctrl+Click)", command=self.browse_files)
         self.browse_button.grid(row=1, column=0, padx=(10,5), pady=(0,10), sticky="ew")
 
+        self.folder_button = ctk.CTkButton(file_frame, text="Pilih Folder...", width=110, command=self.browse_folder)
+        self.folder_button.grid(row=1, column=1, padx=5, pady=(0,10), sticky="ew")
+
         self.clear_button = ctk.CTkButton(file_frame, text="Bersihkan", command=self.clear_file_list, state="disabled")
-        self.clear_button.grid(row=1, column=1, padx=(5,10), pady=(0,10), sticky="ew")
+        self.clear_button.grid(row=1, column=2, padx=(5,10), pady=(0,10), sticky="ew")
 
         # --- Settings Frame ---
         settings_frame = ctk.CTkFrame(self)
@@ -225,7 +514,7 @@ class PDFCompressorApp(ctk.CTk):
 
         ctk.CTkLabel(settings_frame, text="Level Kompresi:").grid(row=2, column=0, columnspan=2, padx=10, pady=(5,0), sticky="w")
         self.quality_menu = ctk.CTkOptionMenu(settings_frame, values=list(self.compression_levels.keys()))
-        self.quality_menu.set("Sedang (Seimbang, ~40-70%)")
+        self.quality_menu.set(core.DEFAULT_LEVEL)
         self.quality_menu.grid(row=3, column=0, columnspan=2, padx=10, pady=(0,10), sticky="ew")
 
         # --- Action Frame ---
@@ -237,6 +526,13 @@ class PDFCompressorApp(ctk.CTk):
                                            font=ctk.CTkFont(size=14, weight="bold"), state="disabled")
         self.compress_button.grid(row=0, column=0, padx=10, pady=10, ipady=8, sticky="ew")
 
+        self.pause_button = ctk.CTkButton(action_frame, text="Jeda", width=90, command=self.toggle_pause,
+                                          state="disabled")
+        self.pause_button.grid(row=0, column=1, padx=(0, 5), pady=10, ipady=8)
+        self.cancel_button = ctk.CTkButton(action_frame, text="Batalkan", width=90, command=self.cancel_compression,
+                                           state="disabled", fg_color="#a83232", hover_color="#7f2626")
+        self.cancel_button.grid(row=0, column=2, padx=(0, 10), pady=10, ipady=8)
+
         # --- Enhanced Status Frame ---
         status_frame = ctk.CTkFrame(self)
         status_frame.grid(row=5, column=0, padx=10, pady=(5,10), sticky="ew")
@@ -260,6 +556,70 @@ class PDFCompressorApp(ctk.CTk):
         # Initialize recent files menu
         self.update_recent_files_menu()
 
+    def show_file_menu(self, event):
+        """Context menu for the file under the mouse"""
+        self.menu_file_path = self.file_list.path_at(event.y)
+        if self.menu_file_path is None:
+            return
+        if self.batch_control is not None:
+            self.file_menu.tk_popup(event.x_root, event.y_root)
+        elif self.browse_button.cget("state") == "normal":
+            self.list_menu.tk_popup(event.x_root, event.y_root)
+
+    def remove_menu_file(self):
+        """Take the file picked in the context menu off the list"""
+        if self.menu_file_path is None or self.batch_control is not None:
+            return
+        self.file_list.remove_paths([self.menu_file_path])
+        self.input_file_paths = self.file_list.paths
+        self.resume_batch = False
+        if self.input_folder is not None:
+            # The folder is walked again by the batch; leave this file out there too
+            self.folder_removed.add(self.menu_file_path)
+            if self.input_file_paths or self.scanning_folder or self.folder_preview_full:
+                return
+        if not self.input_file_paths:
+            self.clear_file_list()
+
+    def control_file(self, action):
+        """Cancel, pause or resume the file picked in the context menu"""
+        control = self.batch_control
+        if control is None or self.menu_file_path is None:
+            return
+        filename = os.path.basename(self.menu_file_path)
+        if action == "cancel":
+            control.cancel_job(self.menu_file_path)
+            self.current_file_label.configure(text=f"Dibatalkan: {filename}")
+        elif action == "pause":
+            control.pause_job(self.menu_file_path)
+            self.current_file_label.configure(text=f"Dijeda: {filename}")
+        else:
+            control.resume_job(self.menu_file_path)
+            self.current_file_label.configure(text=f"Dilanjutkan: {filename}")
+
+    def toggle_pause(self):
+        """Pause or resume the whole batch"""
+        control = self.batch_control
+        if control is None:
+            return
+        if control.paused:
+            control.resume()
+            self.pause_button.configure(text="Jeda")
+            self.status_label.configure(text="Dilanjutkan...")
+        else:
+            control.pause()
+            self.pause_button.configure(text="Lanjutkan")
+            self.status_label.configure(text="Dijeda. Klik \"Lanjutkan\" untuk meneruskan.")
+
+    def cancel_compression(self):
+        """Cancel the whole batch; running Ghostscript processes are killed"""
+        if self.batch_control is None:
+            return
+        self.batch_control.cancel()
+        self.pause_button.configure(state="disabled")
+        self.cancel_button.configure(state="disabled")
+        self.status_label.configure(text="Membatalkan...")
+
     def toggle_theme(self):
         """Toggle between Dark and Light theme"""
         current_theme = self.current_theme.get()
@@ -301,56 +661,45 @@ class PDFCompressorApp(ctk.CTk):
         for file_path in self.recent_files:
             if os.path.basename(file_path) == selection:
                 if os.path.exists(file_path):
+                    self.stop_folder_scan()
                     self.input_file_paths = [file_path]
                     self.update_file_display()
                     break
 
     def get_file_size(self, file_path):
         """Get file size in bytes"""
-        try:
-            return os.path.getsize(file_path)
-        except:
-            return 0
+        return core.get_file_size(file_path)
 
     def format_file_size(self, size_bytes):
         """Format file size to human readable format"""
-        if size_bytes == 0:
-            return "0 B"
-        
-        size_names = ["B", "KB", "MB", "GB"]
-        import math
-        i = int(math.floor(math.log(size_bytes, 1024)))
-        p = math.pow(1024, i)
-        s = round(size_bytes / p, 2)
-        return f"{s} {size_names[i]}"
+        return core.format_file_size(size_bytes)
 
     def update_file_display(self):
         """Update file list display and enable/disable buttons"""
         if self.input_file_paths:
-            self.file_list_textbox.configure(state="normal")
-            self.file_list_textbox.delete("1.0", "end")
-            
-            total_size = 0
-            for path in self.input_file_paths:
-                filename = os.path.basename(path)
-                file_size = self.get_file_size(path)
-                self.original_sizes[path] = file_size
-                total_size += file_size
-                size_str = self.format_file_size(file_size)
-                self.file_list_textbox.insert("end", f"{filename} ({size_str})\n")
-            
-            self.file_list_textbox.configure(state="disabled")
-            
-            # Update status
-            file_count = len(self.input_file_paths)
-            total_size_str = self.format_file_size(total_size)
-            self.status_label.configure(text=f"{file_count} file dipilih. Total ukuran: {total_size_str}")
-            
+            # Files already listed keep their size; the rest are read in the background
+            self.file_list.set_paths(self.input_file_paths)
+            self.input_file_paths = self.file_list.paths
+
             # Set default output folder and enable buttons
             self.output_folder_path.set(os.path.dirname(self.input_file_paths[0]))
             self.compress_button.configure(state="normal")
             self.clear_button.configure(state="normal")
 
+    def update_file_totals(self, file_count, total_size, pending):
+        """Status line for the file list; called again as sizes come in"""
+        if not file_count or self.batch_control is not None:
+            return
+        status_text = f"{file_count} file dipilih. Total ukuran: {self.format_file_size(total_size)}"
+        if self.folder_preview_full:
+            status_text = (f"Folder {os.path.basename(self.input_folder)}: lebih dari {file_count} file PDF "
+                           f"(sisanya dicari saat kompresi berjalan)")
+        elif self.scanning_folder:
+            status_text += " (mencari file PDF...)"
+        elif pending:
+            status_text += f" (menghitung ukuran {pending} file...)"
+        self.status_label.configure(text=status_text)
+
     def browse_files(self):
         """Open file dialog to select PDF files (supports multiple selection)"""
         file_paths = filedialog.askopenfilenames(
@@ -359,7 +708,9 @@ class PDFCompressorApp(ctk.CTk):
             multiple=True  # Explicitly enable multiple selection
         )
         if file_paths:
+            self.stop_folder_scan()
             self.input_file_paths = list(file_paths)
+            self.resume_batch = False
             self.update_file_display()
             self.add_to_recent_files(file_paths)
             
@@ -375,15 +726,88 @@ class PDFCompressorApp(ctk.CTk):
                               "• Gunakan Shift+Click untuk pilih range file\n"
                               "• Atau gunakan Ctrl+A untuk pilih semua")
 
+    def browse_folder(self):
+        """Select a folder; its PDF files are listed while it is being searched"""
+        folder = filedialog.askdirectory(title="Pilih Folder PDF")
+        if not folder:
+            return
+        self.clear_file_list()
+        self.input_folder = os.path.normpath(folder)
+        # The folder's tree is recreated next to it, e.g. Arsip -> Arsip_compressed
+        output_folder = self.input_folder + core.OUTPUT_SUFFIX
+        self.output_folder_path.set(output_folder)
+        self.scanning_folder = True
+        self.status_label.configure(text="Mencari file PDF...")
+        self.clear_button.configure(state="normal")
+        # The batch walks the folder itself, so it can start before the preview is done
+        self.compress_button.configure(state="normal")
+        threading.Thread(target=self._scan_folder, args=(self.input_folder, output_folder, self.folder_scan),
+                         daemon=True).start()
+
+    def iter_folder_pdfs(self, folder, output_folder):
+        """PDF files under ``folder`` as selected in settings.json, in walk order"""
+        return walk.iter_pdfs(folder, recursive=self.settings.get("folder_recursive", True),
+                              include=self.settings.get("folder_include", []),
+                              exclude=self.settings.get("folder_exclude", []),
+                              skip=[output_folder])
+
+    def _scan_folder(self, folder, output_folder, scan):
+        """List the first FOLDER_PREVIEW files of ``folder``, handed over in chunks"""
+        chunk = []
+        found = 0
+        last_sent = time.monotonic()
+        for path in self.iter_folder_pdfs(folder, output_folder):
+            if scan != self.folder_scan:
+                # Cleared or replaced meanwhile
+                return
+            if found == FOLDER_PREVIEW:
+                self.ui_bus.call(self.add_folder_files, chunk, scan, True, True)
+                return
+            found += 1
+            chunk.append(path)
+            if len(chunk) >= FileListView.STAT_CHUNK or time.monotonic() - last_sent >= FileListView.STAT_INTERVAL:
+                self.ui_bus.call(self.add_folder_files, chunk, scan)
+                chunk = []
+                last_sent = time.monotonic()
+        self.ui_bus.call(self.add_folder_files, chunk, scan, True)
+
+    def add_folder_files(self, paths, scan, done=False, more=False):
+        """Append a chunk of files found by the preview scan; ``more`` when it stopped early"""
+        if scan != self.folder_scan:
+            return
+        if done:
+            self.scanning_folder = False
+            self.folder_preview_full = more
+        if paths or done:
+            self.file_list.add_paths(paths)
+            self.input_file_paths = self.file_list.paths
+        if done and not self.input_file_paths:
+            self.compress_button.configure(state="disabled")
+            self.status_label.configure(text="Tidak ada file PDF di folder ini.")
+
+    def folder_jobs(self, folder, output_folder):
+        """(input, output) pairs for the batch, found while the folder is walked"""
+        removed = set(self.folder_removed)
+        for input_path in self.iter_folder_pdfs(folder, output_folder):
+            if input_path not in removed:
+                yield input_path, walk.mirrored_output_path(input_path, folder, output_folder)
+
+    def stop_folder_scan(self):
+        """Forget the selected folder and stop its scan if it still runs"""
+        self.input_folder = None
+        self.folder_scan += 1
+        self.scanning_folder = False
+        self.folder_preview_full = False
+        self.folder_removed = set()
+
     def clear_file_list(self):
         """Clear selected files list"""
         self.input_file_paths = []
-        self.original_sizes = {}
+        self.stop_folder_scan()
+        self.resume_batch = False
         self.compressed_sizes = {}
         
-        self.file_list_textbox.configure(state="normal")
-        self.file_list_textbox.delete("1.0", "end")
-        self.file_list_textbox.configure(state="disabled")
+        self.file_list.clear()
         
         self.output_folder_path.set("")
         self.status_label.configure(text="Daftar file dibersihkan.")
@@ -402,7 +826,7 @@ class PDFCompressorApp(ctk.CTk):
 
     def start_compression(self):
         """Validate input and start compression thread"""
-        if not self.input_file_paths:
+        if not self.input_file_paths and self.input_folder is None:
             messagebox.showwarning("Peringatan", "Silakan pilih file PDF terlebih dahulu.")
             return
         
@@ -411,6 +835,7 @@ class PDFCompressorApp(ctk.CTk):
             return
 
         if not self.ghostscript_path:
+            self.show_ghostscript_missing()
             return
 
         # Reset size tracking
@@ -419,106 +844,272 @@ class PDFCompressorApp(ctk.CTk):
 
         # Disable widgets and start compression
         self.toggle_widgets_state("disabled")
+        timeout = self.settings.get("file_timeout_s")
+        self.batch_control = BatchControl(timeout=float(timeout) if timeout else None)
+        self.pause_button.configure(state="normal", text="Jeda")
+        self.cancel_button.configure(state="normal")
         compression_thread = threading.Thread(target=self._compression_worker, daemon=True)
         compression_thread.start()
 
     def _compression_worker(self):
-        """Compression worker thread"""
+        """Compression worker thread (runs several Ghostscript jobs in parallel)"""
         selected_quality_text = self.quality_menu.get()
         quality_setting = self.compression_levels[selected_quality_text]
 
-        total_files = len(self.input_file_paths)
-        success_count = 0
-        total_original_size = 0
-        total_compressed_size = 0
-        
+        folder = self.input_folder
+        output_folder = self.output_folder_path.get()
+        if folder is None:
+            jobs = [(path, self.generate_output_path(path)) for path in self.input_file_paths]
+        else:
+            # Compressed while the folder is walked, so memory does not grow with the tree
+            jobs = self.folder_jobs(folder, output_folder)
+        # A resumable folder batch ("folder_journal") needs its whole list up front
+        streaming = folder is not None and not self.settings.get("folder_journal", False)
+        total_files = None if streaming else len(jobs) if isinstance(jobs, list) else None
+        max_workers = self.get_max_workers() if streaming else None
+        totals = {"original": 0, "compressed": 0}
+        tracker = core.ProgressTracker(total_files)
+        last_page_update = [0.0]
+
+        def show_progress():
+            fraction, eta = tracker.snapshot()
+            if fraction is None:
+                # The folder is still being walked, so the total is not known yet
+                self.ui_bus.post("status", f"Memproses: {tracker.completed} selesai (masih mencari file PDF...)")
+                return
+            self.ui_bus.post("progress", fraction)
+            status_text = f"Memproses: {tracker.completed}/{tracker.total_files} selesai ({fraction * 100:.0f}%)"
+            if eta is not None:
+                status_text += f" — sisa waktu ±{core.format_duration(eta)}"
+            self.ui_bus.post("status", status_text)
+
+        def on_progress(input_path, done_pages, total_pages):
+            # Called from the worker threads for every page; refresh the UI a few times a second
+            tracker.update(input_path, done_pages, total_pages)
+            now = time.monotonic()
+            if now - last_page_update[0] < 0.2 and done_pages < total_pages:
+                return
+            last_page_update[0] = now
+            filename = os.path.basename(input_path)
+            file_text = f"File saat ini: {filename} (halaman {done_pages}/{total_pages})"
+            self.ui_bus.post("current_file", file_text)
+            show_progress()
+
+        def on_result(result, completed, total):
+            # Files finish out of order; every total here is keyed by input path
+            if journal is not None and not result.extra.get("resumed"):
+                journal.record(result)
+            if recorder is not None and not result.extra.get("resumed"):
+                recorder.record(result)
+            filename = os.path.basename(result.input_path)
+            if total is not None and tracker.total_files is None:
+                # The walk has finished: from here on there is a percentage
+                tracker.total_files = max(1, total)
+            if result.ok:
+                if not streaming:
+                    self.compressed_sizes[result.input_path] = result.compressed_size
+                totals["original"] += self.original_sizes.get(result.input_path, result.original_size)
+                totals["compressed"] += result.compressed_size
+
+            tracker.finish(result.input_path)
+            self.ui_bus.post("current_file", f"File terakhir selesai: {filename}")
+            show_progress()
+
+            # Update size comparison
+            if totals["original"] > 0:
+                reduction = ((totals["original"] - totals["compressed"]) / totals["original"]) * 100
+                size_text = f"Original: {self.format_file_size(totals['original'])} → Compressed: {self.format_file_size(totals['compressed'])} (Penghematan: {reduction:.1f}%)"
+                self.ui_bus.post("size_info", size_text)
+
+        journal = None
+        recorder = None
         try:
-            for i, input_path in enumerate(self.input_file_paths):
-                filename = os.path.basename(input_path)
-                status_text = f"Memproses: {filename} ({i+1}/{total_files})"
-                self.after(0, lambda t=status_text: self.status_label.configure(text=t))
-                self.after(0, lambda f=filename: self.current_file_label.configure(text=f"File saat ini: {f}"))
-                
-                output_path = self.generate_output_path(input_path)
-                self.compress_pdf(input_path, output_path, quality_setting)
-                
-                # Track file sizes
-                original_size = self.original_sizes.get(input_path, 0)
-                compressed_size = self.get_file_size(output_path)
-                self.compressed_sizes[input_path] = compressed_size
-                
-                total_original_size += original_size
-                total_compressed_size += compressed_size
-                
-                success_count += 1
-                progress = (i + 1) / total_files
-                self.after(0, lambda p=progress: self.progressbar.set(p))
-                
-                # Update size comparison
-                if original_size > 0:
-                    reduction = ((original_size - compressed_size) / original_size) * 100
-                    size_text = f"Original: {self.format_file_size(total_original_size)} → Compressed: {self.format_file_size(total_compressed_size)} (Penghematan: {reduction:.1f}%)"
-                    self.after(0, lambda t=size_text: self.size_info_label.configure(text=t))
+            if not isinstance(jobs, list) and not streaming:
+                self.ui_bus.post("status", "Mencari file PDF...")
+                jobs = list(jobs)
+                total_files = len(jobs)
+                tracker.total_files = max(1, total_files)
+            if not streaming and not jobs:
+                self.ui_bus.post("status", "Tidak ada file PDF di folder ini.")
+                return
+            if max_workers is None:
+                max_workers = min(self.get_max_workers(), total_files)
+            if streaming:
+                status_text = f"Memproses file PDF di {os.path.basename(folder)} ({max_workers} proses paralel)..."
+            else:
+                status_text = f"Memproses {total_files} file ({max_workers} proses paralel)..."
+            self.ui_bus.post("status", status_text)
+
+            engine = self.settings.get("engine", "spawn")
+            cache = None
+            if self.settings.get("cache", False):
+                cache = ResultCache(self.settings.get("cache_dir") or None,
+                                    max_bytes=int(self.settings.get("cache_max_mb", 1024)) * 1024 * 1024)
+            split = None
+            if self.settings.get("split_large_files", False):
+                split = {
+                    "min_pages": int(self.settings.get("split_min_pages", shard.DEFAULT_MIN_PAGES)),
+                    "min_bytes": int(self.settings.get("split_min_mb", shard.DEFAULT_MIN_BYTES // (1024 * 1024))) * 1024 * 1024,
+                }
+            target_mb = self.settings.get("auto_target_mb")
+            auto = {
+                "min_dpi": int(self.settings.get("auto_min_dpi", 0)),
+                "target_ratio": self.settings.get("auto_target_ratio"),
+                "target_bytes": int(float(target_mb) * 1024 * 1024) if target_mb else None,
+            }
+            # Mode ukuran target: kualitas terbaik yang muat di bawah batas (mis. batas unggah 2 MB)
+            target = None
+            if quality_setting == core.TARGET_SETTING:
+                target = {
+                    "target_bytes": int(float(self.settings.get("target_size_mb", 2)) * 1024 * 1024),
+                    "min_dpi": auto["min_dpi"],
+                }
+            gate = None
+            use_preflight = self.settings.get("preflight", True)
+            if use_preflight:
+                text_page_kb = self.settings.get("preflight_text_page_kb", preflight.DEFAULT_MIN_TEXT_BYTES_PER_PAGE // 1024)
+                gate = {"min_text_bytes_per_page": int(text_page_kb) * 1024}
+
+            # Journal every job, so an interrupted batch can be resumed next time;
+            # a streamed folder is not journaled, as that needs the whole list
+            batch_settings = {"level": quality_setting, "auto": auto, "split": split, "preflight": gate}
+            if target is not None:
+                batch_settings["target"] = target
+            if self.preset_rules:
+                batch_settings["rules"] = self.preset_rules
+            resumed = []
+            if not streaming:
+                journal = BatchJournal(self.journal_file)
+                jobs, resumed = journal.begin(jobs, batch_settings, resume=self.resume_batch)
+            self.resume_batch = False
+            for result in resumed:
+                on_result(result, 0, total_files)
+            # Start the files expected to take longest first, so one big file does not finish the batch alone
+            scheduler = Scheduler(CostModel(self.settings.get("timings_file") or default_model_path()),
+                                  order=self.settings.get("schedule", "lpt"), scan=use_preflight,
+                                  rules=self.preset_rules)
+            selection_order = jobs
+            if not streaming:
+                self.ui_bus.post("status", "Memeriksa file PDF...")
+                jobs = scheduler.order_jobs(jobs, quality_setting)
+                self.ui_bus.post("status", status_text)
+            # Hold files back while the running ones would use up the memory budget
+            budget_mb = self.settings.get("memory_budget_mb")
+            job_memory_mb = self.settings.get("job_memory_limit_mb")
+            memory_budget = MemoryBudget(
+                budget_bytes=int(budget_mb) * 1024 * 1024 if budget_mb is not None else None,
+                process_limit=int(job_memory_mb) * 1024 * 1024 if job_memory_mb else None)
+            # Per-job timings; written to files only when settings.json asks for them
+            recorder = MetricsRecorder(self.settings.get("metrics_file") or None,
+                                       self.settings.get("prometheus_file") or None)
+            with open_pipeline(self.ghostscript_path, engine, workers=max_workers,
+                               cache=cache, split=split, auto=auto, target=target, preflight=gate,
+                               gs_args=memory_budget.gs_args() + ghostscript.tuned_args(self.ghostscript_path, max_workers, memory_budget),
+                               rules=self.preset_rules) as compress_func:
+                batch = core.compress_batch(self.ghostscript_path, jobs, quality_setting,
+                                            max_workers=max_workers, on_result=on_result,
+                                            compress_func=compress_func, on_progress=on_progress,
+                                            batch_control=self.batch_control, memory_budget=memory_budget,
+                                            duplicates=DuplicateFinder(self.preset_rules)
+                                            if self.settings.get("dedupe", True) and not streaming else None)
+            scheduler.record(batch, quality_setting)
+            try:
+                scheduler.model.save()
+            except OSError:
+                pass
+            schedule = None
+            if not streaming:
+                schedule = scheduler.makespan_report(batch, jobs, selection_order, max_workers)
+            batch.results[:0] = resumed
+            if streaming:
+                total_files = len(batch.results)
+                if not total_files and not batch.cancelled:
+                    self.ui_bus.post("status", "Tidak ada file PDF di folder ini.")
+                    return
 
             # Final summary
+            total_original_size = totals["original"]
+            total_compressed_size = totals["compressed"]
+            cancelled_files = batch.cancelled
+            failed_files = [r for r in batch.failed if not r.extra.get("cancelled")]
             total_reduction = ((total_original_size - total_compressed_size) / total_original_size) * 100 if total_original_size > 0 else 0
-            final_message = f"Kompresi selesai! Berhasil memproses {success_count} dari {total_files} file.\n\n"
+            final_message = f"Kompresi selesai! Berhasil memproses {batch.success_count} dari {total_files} file.\n\n"
             final_message += f"Total ukuran asli: {self.format_file_size(total_original_size)}\n"
             final_message += f"Total ukuran terkompresi: {self.format_file_size(total_compressed_size)}\n"
             final_message += f"Total penghematan: {self.format_file_size(total_original_size - total_compressed_size)} ({total_reduction:.1f}%)"
-            
-            self.after(0, lambda: messagebox.showinfo("Sukses", final_message))
-            self.after(0, self.clear_file_list)
-            self.after(0, lambda: self.status_label.configure(text="Selesai! Siap untuk tugas berikutnya."))
-            self.after(0, lambda: self.current_file_label.configure(text=""))
+            kept_original = sum(1 for r in batch.results if r.extra.get("auto_level") == "original")
+            if kept_original:
+                final_message += f"\nMode otomatis: {kept_original} file tidak bisa diperkecil, file asli disalin"
+            within_target = sum(1 for r in batch.results if r.extra.get("target") == "original")
+            if within_target:
+                final_message += (f"\nUkuran target {self.format_file_size(target['target_bytes'])}: "
+                                  f"{within_target} file sudah di bawah batas, file asli disalin")
+            if resumed:
+                final_message += f"\nDilanjutkan: {len(resumed)} file sudah selesai sebelumnya dan dilewati"
+            copied = sum(1 for r in batch.results if r.extra.get("preflight"))
+            if copied:
+                final_message += f"\nPemeriksaan awal: {copied} file teks tidak akan mengecil, file asli disalin"
+            if schedule is not None and schedule["order"] == "lpt" and schedule["improvement"] >= 1:
+                final_message += f"\nUrutan terbesar dulu: {schedule['improvement']:.0f}% lebih cepat dibanding urutan pilihan"
+            metrics = recorder.summary()
+            if metrics["latency_p50"] is not None:
+                final_message += (f"\nStatistik: p50 {metrics['latency_p50']:.1f} dtk, p95 {metrics['latency_p95']:.1f} dtk per file, "
+                                  f"{metrics['mb_per_s']:.1f} MB/dtk, {metrics['files_per_min']:.1f} file/menit")
+            if batch.deduplicated:
+                final_message += f"\nFile kembar: {len(batch.deduplicated)} file sama isinya hanya dikompresi sekali (hemat sekitar {batch.time_saved:.0f} detik)"
+            if batch.cache_hits or batch.cache_misses:
+                final_message += f"\nCache: {batch.cache_hits} file diambil dari cache, {batch.cache_misses} dikompresi ulang"
+            if cancelled_files:
+                final_message += f"\nDibatalkan: {len(cancelled_files)} file"
+                if not streaming:
+                    final_message += " (bisa dilanjutkan saat aplikasi dibuka lagi)"
+            if failed_files:
+                final_message += f"\n\nGagal ({len(failed_files)} file):\n"
+                final_message += "\n".join(f"• {os.path.basename(r.input_path)}: {r.error}" for r in failed_files[:10])
+
+            if cancelled_files and not failed_files:
+                self.ui_bus.call(messagebox.showinfo, "Dibatalkan", final_message)
+            elif failed_files:
+                self.ui_bus.call(messagebox.showwarning, "Selesai dengan kesalahan", final_message)
+            else:
+                self.ui_bus.call(messagebox.showinfo, "Sukses", final_message)
+            self.ui_bus.call(self.clear_file_list)
+            self.ui_bus.post("status", "Selesai! Siap untuk tugas berikutnya.")
+            self.ui_bus.post("current_file", "")
 
         except Exception as e:
             error_message = f"Terjadi kesalahan saat kompresi:\n{e}"
-            self.after(0, lambda: messagebox.showerror("Error", error_message))
-            self.after(0, lambda: self.status_label.configure(text="Gagal! Silakan coba lagi."))
-            self.after(0, lambda: self.current_file_label.configure(text=""))
+            self.ui_bus.call(messagebox.showerror, "Error", error_message)
+            self.ui_bus.post("status", "Gagal! Silakan coba lagi.")
+            self.ui_bus.post("current_file", "")
         finally:
-            self.after(0, lambda: self.toggle_widgets_state("normal"))
-            self.after(0, lambda: self.compress_button.configure(state="disabled"))
-            self.after(0, lambda: self.clear_button.configure(state="disabled"))
+            if journal is not None:
+                journal.close()
+            if recorder is not None:
+                recorder.close()
+            self.batch_control = None
+            self.ui_bus.call(self.pause_button.configure, state="disabled", text="Jeda")
+            self.ui_bus.call(self.cancel_button.configure, state="disabled")
+            self.ui_bus.call(self.toggle_widgets_state, "normal")
+            self.ui_bus.call(self.compress_button.configure, state="disabled")
+            self.ui_bus.call(self.clear_button.configure, state="disabled")
 
     def generate_output_path(self, input_path):
         """Generate unique output file path"""
-        output_dir = self.output_folder_path.get()
-        filename = os.path.basename(input_path)
-        name, ext = os.path.splitext(filename)
-        return os.path.join(output_dir, f"{name}_compressed{ext}")
+        output_folder = self.output_folder_path.get()
+        if self.input_folder and (os.path.dirname(input_path) + os.sep).startswith(self.input_folder + os.sep):
+            # Files from a selected folder keep their subfolder
+            return walk.mirrored_output_path(input_path, self.input_folder, output_folder)
+        return core.generate_output_path(input_path, output_folder)
 
     def compress_pdf(self, input_path, output_path, quality_setting):
         """Core PDF compression function using Ghostscript"""
-        base_command = [
-            self.ghostscript_path,
-            "-sDEVICE=pdfwrite",
-            "-dCompatibilityLevel=1.4",
-            "-dNOPAUSE",
-            "-dQUIET",
-            "-dBATCH",
-        ]
-
-        if isinstance(quality_setting, str):
-            quality_command = [f"-dPDFSETTINGS={quality_setting}"]
-        else:
-            quality_command = quality_setting
-
-        command = base_command + quality_command + [f"-sOutputFile={output_path}", input_path]
-
-        startupinfo = None
-        if os.name == 'nt':
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        
-        process = subprocess.run(command, check=True, capture_output=True, text=True, startupinfo=startupinfo)
-        if process.returncode != 0:
-            raise RuntimeError(f"Ghostscript error:\n{process.stderr}")
+        core.compress_pdf(self.ghostscript_path, input_path, output_path, quality_setting)
 
     def toggle_widgets_state(self, state="disabled"):
         """Enable or disable all interactive widgets"""
         self.browse_button.configure(state=state)
+        self.folder_button.configure(state=state)
         self.clear_button.configure(state=state)
         self.output_button.configure(state=state)
         self.quality_menu.configure(state=state)
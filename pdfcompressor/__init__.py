@@ -0,0 +1,24 @@
+"""Maximum PDF Compressor: GUI-free compression core and command line tools."""
+from .core import (
+    AUTO_LEVEL,
+    AUTO_SETTING,
+    COMPRESSION_LEVELS,
+    DEFAULT_LEVEL,
+    ENGINES,
+    LEVEL_ALIASES,
+    TARGET_LEVEL,
+    TARGET_SETTING,
+    BatchResult,
+    CompressionCancelled,
+    FileResult,
+    GhostscriptError,
+    build_command,
+    compress_batch,
+    compress_pdf,
+    format_file_size,
+    generate_output_path,
+    get_file_size,
+    get_ghostscript_path,
+    open_engine,
+    resolve_level,
+)
@@ -0,0 +1,184 @@
+"""Automatic level selection: race several presets and keep the best output.
+
+Which preset gives the smallest file depends on the document: "Ekstrem"
+is sometimes larger than /ebook, and an already optimised PDF grows under
+every preset. In auto mode the candidate presets run concurrently on the
+same input. As soon as one output meets the target (a size or a ratio of
+the original) the remaining runs are cancelled. The smallest valid output
+whose image resolution is not below the quality floor is kept; when
+nothing beats the original, the original is copied instead. Files the
+pre-flight scan finds no images in only try one preset, since the presets
+differ mostly in how they downsample images.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+from . import core
+from .control import JobControl
+from .pdfparse import PdfDocument, PdfError
+from .preflight import analyze_cached
+
+# Levels tried in auto mode, smallest expected output first, with the image
+# resolution (dpi) each one downsamples to
+CANDIDATES = [
+    ("Ekstrem (Perkiraan kompresi 70-95%)", 72),
+    ("Rendah (Kompresi Tinggi, ~60-85%)", 72),
+    ("Sedang (Seimbang, ~40-70%)", 150),
+    ("Tinggi (Kualitas Cetak, ~10-30%)", 300),
+    ("Sangat Tinggi (Prepress, ~0-15%)", 300),
+]
+ORIGINAL = "original"
+
+
+def candidate_levels(min_dpi=0):
+    """Levels auto mode may pick without going below ``min_dpi``"""
+    return [label for label, dpi in CANDIDATES if dpi >= (min_dpi or 0)]
+
+
+def count_pages(path):
+    try:
+        with PdfDocument(path) as doc:
+            return doc.page_count
+    except (PdfError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def is_valid_output(path, expected_pages):
+    """A candidate must be a PDF with the same number of pages as its input"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(5) != b"%PDF-":
+                return False
+    except OSError:
+        return False
+    if expected_pages is None:
+        return True
+    return count_pages(path) == expected_pages
+
+
+class AutoCompressor:
+    """``compress_func`` that handles ``core.AUTO_SETTING`` by racing presets.
+
+    Any other quality setting goes straight to ``compress_func``.
+    """
+
+    def __init__(self, compress_func, workers=None, min_dpi=0, target_ratio=None, target_bytes=None):
+        self.compress_func = compress_func
+        self.workers = max(1, workers or core.default_workers())
+        self.min_dpi = min_dpi or 0
+        self.target_ratio = target_ratio
+        self.target_bytes = target_bytes
+        self.candidates = candidate_levels(self.min_dpi)
+        if not self.candidates:
+            raise ValueError(f"No compression level keeps images at {self.min_dpi} dpi or more")
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def describe(self):
+        """Options that change the outcome; part of the result cache key"""
+        return {"auto_min_dpi": self.min_dpi, "auto_target_ratio": self.target_ratio,
+                "auto_target_bytes": self.target_bytes}
+
+    def meets_target(self, size, original_size):
+        if self.target_bytes and size <= self.target_bytes:
+            return True
+        if self.target_ratio and original_size and size <= original_size * self.target_ratio:
+            return True
+        return False
+
+    def candidates_for(self, input_path):
+        """Levels worth racing on this file"""
+        if analyze_cached(input_path).text_only:
+            return self.candidates[:1]
+        return self.candidates
+
+    def fan_out(self, input_path, quality_setting):
+        if quality_setting != core.AUTO_SETTING:
+            return core.fan_out(self.compress_func, input_path, quality_setting)
+        candidates = self.candidates_for(input_path)
+        racing = min(self.workers, len(candidates))
+        return racing * max(core.fan_out(self.compress_func, input_path, core.COMPRESSION_LEVELS[label])
+                            for label in candidates)
+
+    def _run_candidate(self, input_path, candidate_path, label, cancel, progress):
+        extra = core.call_compress(self.compress_func, input_path, candidate_path,
+                                   core.COMPRESSION_LEVELS[label], progress=progress, cancel=cancel)
+        return label, candidate_path, extra
+
+    def compress(self, input_path, output_path, quality_setting, progress=None, cancel=None):
+        if quality_setting != core.AUTO_SETTING:
+            return core.call_compress(self.compress_func, input_path, output_path, quality_setting,
+                                      progress=progress, cancel=cancel)
+
+        original_size = core.get_file_size(input_path)
+        expected_pages = analyze_cached(input_path).pages
+        # Cancelling the race stops every candidate; cancelling or pausing
+        # the job reaches the race too
+        race_cancel = JobControl.linked_to(cancel)
+
+        # Report the page count of whichever candidate is furthest along
+        leader = {"done": 0}
+        lock = threading.Lock()
+
+        def report(done, total):
+            with lock:
+                if done > leader["done"] or done == 0:
+                    leader["done"] = max(done, leader["done"])
+                    progress(leader["done"], total)
+
+        work_dir = tempfile.mkdtemp(prefix=".pdfc-auto-", dir=os.path.dirname(os.path.abspath(output_path)))
+        best = None
+        tried = 0
+        last_error = None
+        usages = []
+        try:
+            futures = [self._executor.submit(self._run_candidate, input_path,
+                                             os.path.join(work_dir, f"candidate-{i}.pdf"), label,
+                                             race_cancel, report if progress else None)
+                       for i, label in enumerate(self.candidates_for(input_path))]
+            for future in as_completed(futures):
+                try:
+                    label, path, extra = future.result()
+                except (core.CompressionCancelled, CancelledError):
+                    continue
+                except Exception as e:
+                    # A preset that fails on this document simply drops out
+                    last_error = e
+                    continue
+                tried += 1
+                usages.append(extra)
+                size = core.get_file_size(path)
+                if not is_valid_output(path, expected_pages):
+                    continue
+                if best is None or size < best[1]:
+                    best = (label, size, path)
+                if self.meets_target(size, original_size):
+                    race_cancel.set()
+                    for other in futures:
+                        other.cancel()
+            if cancel is not None and cancel.is_set():
+                raise core.CompressionCancelled()
+
+            if tried == 0 and last_error is not None:
+                raise last_error
+            # CPU time and peak memory of every candidate that finished
+            usage = core.merge_usage(usages) or {}
+            if best is None or best[1] >= original_size:
+                shutil.copyfile(input_path, output_path)
+                return dict(usage, auto_level=ORIGINAL, auto_tried=tried)
+            os.replace(best[2], output_path)
+            return dict(usage, auto_level=best[0], auto_tried=tried)
+        finally:
+            race_cancel.set()
+            shutil.rmtree(work_dir, ignore_errors=True)
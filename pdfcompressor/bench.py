@@ -0,0 +1,652 @@
+"""Benchmarks for the compression engines: ``python -m pdfcompressor.bench``"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from . import core
+from . import presets
+from . import synthetic
+from . import uibus
+from .cache import ghostscript_version
+from .cli import find_ghostscript
+from .metrics import percentile
+from .shard import ShardedCompressor
+
+SUITE_LEVELS = ("extreme", "screen", "ebook", "printer", "prepress")
+SUITE_FIELDS = ("file", "engine", "level", "run", "wall_time", "cpu_time", "peak_rss",
+                "original_size", "compressed_size", "ratio", "error")
+# A flag whose removal grows the output by less than this fraction is not worth keeping
+SIZE_NOISE = 0.005
+# How worker threads reach the Tk event loop in the ``ui`` stress test
+UI_MODES = ("after", "bus")
+
+
+def time_engine(gs_path, engine, inputs, quality_setting, workers, repeat=3):
+    """Run the whole input set ``repeat`` times and return per-run wall times"""
+    timings = []
+    out_dir = tempfile.mkdtemp(prefix=f"pdfc-bench-{engine}-")
+    try:
+        jobs = [(path, os.path.join(out_dir, f"{i}.pdf")) for i, path in enumerate(inputs)]
+        # Engine start-up (e.g. the interpreter pool warming up) counts
+        # towards the first run, exactly as it would for a real batch
+        with core.open_engine(gs_path, engine, workers=workers) as compress_func:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                batch = core.compress_batch(gs_path, jobs, quality_setting, max_workers=workers,
+                                            compress_func=compress_func)
+                timings.append(time.perf_counter() - start)
+                if batch.failed:
+                    raise RuntimeError(f"{engine}: {batch.failed[0].input_path}: {batch.failed[0].error}")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return timings
+
+
+def compare_engines(gs_path, inputs, quality_setting, workers, repeat=3, engines=core.ENGINES):
+    """Time every engine on the same inputs; returns {engine: [seconds, ...]}"""
+    return {engine: time_engine(gs_path, engine, inputs, quality_setting, workers, repeat)
+            for engine in engines}
+
+
+def print_engine_table(results, file_count):
+    baseline = statistics.median(results["spawn"]) if "spawn" in results else None
+    print(f"{'engine':<8} {'median s':>9} {'min s':>8} {'files/s':>8} {'speedup':>8}")
+    for engine, timings in results.items():
+        median = statistics.median(timings)
+        speedup = f"{baseline / median:.2f}x" if baseline else "-"
+        print(f"{engine:<8} {median:>9.3f} {min(timings):>8.3f} {file_count / median:>8.1f} {speedup:>8}")
+
+
+def compare_split(gs_path, input_path, quality_setting, workers, repeat=3, min_pages=1):
+    """Time one file compressed by a single process and split across workers"""
+    out_dir = tempfile.mkdtemp(prefix="pdfc-bench-split-")
+    output_path = os.path.join(out_dir, "out.pdf")
+    results = {"single": [], "split": []}
+    try:
+        with ShardedCompressor(gs_path, workers=workers, min_pages=min_pages, min_bytes=0) as sharded:
+            shards = 0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                core.compress_pdf(gs_path, input_path, output_path, quality_setting)
+                results["single"].append(time.perf_counter() - start)
+                single_size = core.get_file_size(output_path)
+
+                start = time.perf_counter()
+                extra = sharded.compress(input_path, output_path, quality_setting) or {}
+                results["split"].append(time.perf_counter() - start)
+                shards = extra.get("shards", 0)
+                split_size = core.get_file_size(output_path)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    results["shards"] = shards
+    results["sizes"] = {"single": single_size, "split": split_size}
+    return results
+
+
+def print_split_table(results):
+    single = statistics.median(results["single"])
+    split = statistics.median(results["split"])
+    if not results["shards"]:
+        print("note: the file was not split (too few pages or not splittable)")
+    print(f"{'mode':<8} {'median s':>9} {'min s':>8} {'size':>12}")
+    for mode in ("single", "split"):
+        timings = results[mode]
+        print(f"{mode:<8} {statistics.median(timings):>9.3f} {min(timings):>8.3f} "
+              f"{core.format_file_size(results['sizes'][mode]):>12}")
+    print(f"speedup: {single / split:.2f}x with {results['shards']} shards")
+
+
+def find_corpus(paths):
+    """PDF files given directly or found (non-recursively) in directories"""
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            inputs.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                 if name.lower().endswith(".pdf")))
+        else:
+            inputs.append(path)
+    return inputs
+
+
+def run_suite(gs_path, inputs, levels=SUITE_LEVELS, engines=core.ENGINES, workers=1, repeat=1):
+    """Compress every input at every level on every engine.
+
+    Returns one record per file and run, with the wall time, the CPU time
+    and peak RSS of the Ghostscript process (None where the platform does
+    not report them) and the output size.
+    """
+    records = []
+    out_dir = tempfile.mkdtemp(prefix="pdfc-bench-suite-")
+    try:
+        jobs = [(path, os.path.join(out_dir, f"{i}.pdf")) for i, path in enumerate(inputs)]
+        for engine in engines:
+            with core.open_engine(gs_path, engine, workers=workers) as compress_func:
+                for level in levels:
+                    quality_setting = core.resolve_level(level)
+                    for run in range(repeat):
+                        batch = core.compress_batch(gs_path, jobs, quality_setting, max_workers=workers,
+                                                    compress_func=compress_func)
+                        for result in batch.results:
+                            records.append({
+                                "file": os.path.basename(result.input_path),
+                                "engine": engine,
+                                "level": level,
+                                "run": run,
+                                "wall_time": round(result.elapsed, 4),
+                                "cpu_time": result.extra.get("cpu_time"),
+                                "peak_rss": result.extra.get("peak_rss"),
+                                "original_size": result.original_size,
+                                "compressed_size": result.compressed_size if result.ok else None,
+                                "ratio": (round(result.compressed_size / result.original_size, 4)
+                                          if result.ok and result.original_size else None),
+                                "error": result.error,
+                            })
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return records
+
+
+def summarize_suite(records):
+    """Per (engine, level) totals, averaged over runs"""
+    groups = {}
+    for record in records:
+        groups.setdefault((record["engine"], record["level"]), []).append(record)
+    summary = []
+    for (engine, level), group in groups.items():
+        ok = [r for r in group if r["error"] is None]
+        runs = max(r["run"] for r in group) + 1
+        cpu = [r["cpu_time"] for r in ok if r["cpu_time"] is not None]
+        rss = [r["peak_rss"] for r in ok if r["peak_rss"] is not None]
+        original = sum(r["original_size"] for r in ok)
+        summary.append({
+            "engine": engine,
+            "level": level,
+            "files": len({r["file"] for r in group}),
+            "failed": len(group) - len(ok),
+            "wall_time": sum(r["wall_time"] for r in group) / runs,
+            "cpu_time": sum(cpu) / runs if cpu else None,
+            "peak_rss": max(rss) if rss else None,
+            "original_size": original // runs,
+            "compressed_size": sum(r["compressed_size"] for r in ok) // runs,
+            "ratio": sum(r["compressed_size"] for r in ok) / original if original else None,
+        })
+    return summary
+
+
+def print_suite_table(summary):
+    print(f"{'engine':<8} {'level':<9} {'files':>5} {'fail':>4} {'wall s':>8} {'cpu s':>8} "
+          f"{'peak RSS':>10} {'output':>11} {'ratio':>6}")
+    for row in summary:
+        cpu = f"{row['cpu_time']:.2f}" if row["cpu_time"] is not None else "-"
+        rss = core.format_file_size(row["peak_rss"]) if row["peak_rss"] else "-"
+        ratio = f"{row['ratio']:.3f}" if row["ratio"] is not None else "-"
+        print(f"{row['engine']:<8} {row['level']:<9} {row['files']:>5} {row['failed']:>4} "
+              f"{row['wall_time']:>8.2f} {cpu:>8} {rss:>10} "
+              f"{core.format_file_size(row['compressed_size']):>11} {ratio:>6}")
+
+
+def write_suite_json(records, summary, path, gs_path):
+    data = {
+        "ghostscript": ghostscript_version(gs_path),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "summary": summary,
+        "records": records,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+
+def write_suite_csv(records, path):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUITE_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def flag_variants(quality_setting):
+    """(flag, variant, arguments) for each flag of a preset.
+
+    Boolean flags are flipped (``=true`` <-> ``=false``), any other flag is
+    left out so Ghostscript's default for the ``-dPDFSETTINGS`` base
+    applies. The ``-dPDFSETTINGS`` argument itself is the base and is kept;
+    a trailing ``-c`` PostScript segment counts as one flag.
+    """
+    variants = []
+    for index, arg in enumerate(quality_setting):
+        name, _, value = arg.partition("=")
+        if name == "-dPDFSETTINGS" or (index > 0 and quality_setting[index - 1] == "-c"):
+            continue
+        end = index + 1
+        if arg == "-c":
+            end = len(quality_setting)
+            arg = " ".join(quality_setting[index:])
+        if value in ("true", "false"):
+            replacement = [f"{name}={'false' if value == 'true' else 'true'}"]
+            label = "off" if value == "true" else "on"
+        else:
+            replacement = []
+            label = "dropped"
+        variants.append((arg, label, quality_setting[:index] + replacement + quality_setting[end:]))
+    return variants
+
+
+def run_flag_ablation(gs_path, inputs, quality_setting, workers=1, repeat=1):
+    """Compress the corpus with the preset and with each flag toggled.
+
+    The configurations run in interleaved rounds so drift (thermal, cache
+    warm-up) spreads over all of them. Returns one row per configuration,
+    baseline first, with the median wall and CPU time and the output size.
+    """
+    configs = [("(baseline)", "", list(quality_setting))] + flag_variants(quality_setting)
+    timings = {index: {"wall": [], "cpu": []} for index in range(len(configs))}
+    sizes = {}
+    errors = {}
+    out_dir = tempfile.mkdtemp(prefix="pdfc-bench-flags-")
+    try:
+        jobs = [(path, os.path.join(out_dir, f"{i}.pdf")) for i, path in enumerate(inputs)]
+        with core.open_engine(gs_path, "spawn", workers=workers) as compress_func:
+            for _ in range(repeat):
+                for index, (_flag, _label, setting) in enumerate(configs):
+                    start = time.perf_counter()
+                    batch = core.compress_batch(gs_path, jobs, setting, max_workers=workers,
+                                                compress_func=compress_func)
+                    timings[index]["wall"].append(time.perf_counter() - start)
+                    cpu = [r.extra["cpu_time"] for r in batch.results if r.extra.get("cpu_time") is not None]
+                    if cpu:
+                        timings[index]["cpu"].append(sum(cpu))
+                    sizes[index] = sum(r.compressed_size for r in batch.results if r.ok)
+                    if batch.failed:
+                        errors[index] = f"{batch.failed[0].input_path}: {batch.failed[0].error}"
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    rows = []
+    for index, (flag, label, setting) in enumerate(configs):
+        rows.append({
+            "flag": flag,
+            "variant": label,
+            "arguments": setting,
+            "wall_time": statistics.median(timings[index]["wall"]),
+            "cpu_time": statistics.median(timings[index]["cpu"]) if timings[index]["cpu"] else None,
+            "compressed_size": sizes[index],
+            "error": errors.get(index),
+        })
+    return rows
+
+
+def judge_flags(rows):
+    """Add time/size deltas against the baseline and a keep/drop verdict.
+
+    A positive ``size_delta`` is what the flag saves; a negative
+    ``time_delta`` is what toggling it saves. Flags whose toggle grows the
+    output by less than SIZE_NOISE are marked "drop".
+    """
+    baseline = rows[0]
+    for row in rows[1:]:
+        row["time_delta"] = row["wall_time"] - baseline["wall_time"]
+        row["cpu_delta"] = (row["cpu_time"] - baseline["cpu_time"]
+                            if row["cpu_time"] is not None and baseline["cpu_time"] is not None else None)
+        row["size_delta"] = row["compressed_size"] - baseline["compressed_size"]
+        size_fraction = row["size_delta"] / baseline["compressed_size"] if baseline["compressed_size"] else 0.0
+        if row["error"] or baseline["error"]:
+            row["verdict"] = "error"
+        else:
+            row["verdict"] = "drop" if size_fraction < SIZE_NOISE else "keep"
+    return rows
+
+
+def print_flag_table(rows):
+    baseline = rows[0]
+    print(f"baseline: {baseline['wall_time']:.3f}s wall, "
+          f"{core.format_file_size(baseline['compressed_size'])} output")
+    print(f"{'flag':<36} {'variant':<8} {'time Δ s':>9} {'time Δ':>7} {'size Δ':>11} {'size Δ':>7}  verdict")
+    for row in rows[1:]:
+        time_pct = 100 * row["time_delta"] / baseline["wall_time"] if baseline["wall_time"] else 0.0
+        size_pct = (100 * row["size_delta"] / baseline["compressed_size"]
+                    if baseline["compressed_size"] else 0.0)
+        size_delta = ("+" if row["size_delta"] >= 0 else "-") + core.format_file_size(abs(row["size_delta"]))
+        flag = row["flag"] if len(row["flag"]) <= 36 else row["flag"][:33] + "..."
+        print(f"{flag:<36} {row['variant']:<8} {row['time_delta']:>+9.3f} {time_pct:>+6.1f}% "
+              f"{size_delta:>11} {size_pct:>+6.1f}%  {row['verdict']}")
+    for row in rows:
+        if row["error"]:
+            print(f"{row['flag']}: {row['error']}", file=sys.stderr)
+
+
+def trimmed_preset(rows):
+    """The baseline arguments with every "drop" flag replaced by its measured variant"""
+    arguments = list(rows[0]["arguments"])
+    for row in rows[1:]:
+        if row["verdict"] != "drop":
+            continue
+        if row["flag"].startswith("-c "):
+            del arguments[arguments.index("-c"):]
+            continue
+        index = arguments.index(row["flag"])
+        name = row["flag"].partition("=")[0]
+        replacement = [arg for arg in row["arguments"] if arg.partition("=")[0] == name]
+        arguments[index:index + 1] = replacement
+    return arguments
+
+
+def preset_spec(arguments):
+    """``arguments`` as a preset ``settings.json`` accepts.
+
+    Presets cannot carry PostScript, so a trailing ``-c`` segment becomes
+    the named settings ``base``, ``args`` and ``distiller_params``.
+    """
+    if "-c" not in arguments:
+        return arguments
+    index = arguments.index("-c")
+    flags = arguments[:index]
+    spec = {"args": [arg for arg in flags if not arg.startswith("-dPDFSETTINGS=")]}
+    for arg in flags:
+        if arg.startswith("-dPDFSETTINGS="):
+            spec["base"] = arg.partition("=")[2]
+    params = presets.parse_distiller_arguments(arguments[index:])
+    if params:
+        spec["distiller_params"] = params
+    return spec
+
+
+def stress_ui(mode, files=10000, workers=4, job_time=0.0, fps=uibus.DEFAULT_FPS):
+    """Feed a Tk event loop the GUI's per-file updates for ``files`` fake jobs.
+
+    ``mode`` "after" schedules one ``after(0, ...)`` callback per update,
+    as the GUI used to; "bus" posts them to an ``UpdateBus``. Returns the
+    heartbeat latency of the event loop (how late a 10 ms timer fires),
+    and how long after the last job the UI showed it.
+    """
+    import tkinter
+
+    root = tkinter.Tk()
+    root.withdraw()
+    labels = {key: tkinter.Label(root) for key in ("status", "current_file", "size_info")}
+    state = {"progress": 0.0, "shown": None, "finished": None, "callbacks": 0}
+    lateness = []
+    heartbeat = 0.01
+
+    def show_progress(value):
+        state["progress"] = value
+        if value >= 1.0 and state["shown"] is None:
+            state["shown"] = time.perf_counter()
+
+    def counted(func):
+        def handler(value):
+            state["callbacks"] += 1
+            func(value)
+        return handler
+
+    handlers = {key: counted(lambda text, label=label: label.configure(text=text)) for key, label in labels.items()}
+    handlers["progress"] = counted(show_progress)
+    bus = uibus.UpdateBus()
+
+    if mode == "bus":
+        post = bus.post
+        uibus.pump(root, bus, handlers, fps)
+    else:
+        def post(key, value):
+            root.after(0, lambda: handlers[key](value))
+
+    remaining = iter(range(files))
+    lock = threading.Lock()
+    totals = {"completed": 0, "original": 0, "compressed": 0}
+
+    def worker():
+        # Mirrors the GUI's on_progress and on_result updates for a one-page file
+        while True:
+            with lock:
+                index = next(remaining, None)
+            if index is None:
+                return
+            if job_time:
+                time.sleep(job_time)
+            post("current_file", f"File saat ini: {index}.pdf (halaman 1/1)")
+            with lock:
+                totals["completed"] += 1
+                totals["original"] += 2048
+                totals["compressed"] += 1024
+                completed = totals["completed"]
+            post("current_file", f"File terakhir selesai: {index}.pdf")
+            post("progress", completed / files)
+            post("status", f"Memproses: {completed}/{files} selesai ({completed / files * 100:.0f}%)")
+            post("size_info", f"Original: {core.format_file_size(totals['original'])} → "
+                              f"Compressed: {core.format_file_size(totals['compressed'])}")
+
+    def beat(expected):
+        now = time.perf_counter()
+        lateness.append(max(0.0, now - expected))
+        root.after(int(heartbeat * 1000), beat, time.perf_counter() + heartbeat)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+
+    def check():
+        if state["finished"] is None and not any(thread.is_alive() for thread in threads):
+            state["finished"] = time.perf_counter()
+        if state["shown"] is not None and state["finished"] is not None:
+            root.quit()
+        else:
+            root.after(20, check)
+
+    start = time.perf_counter()
+    root.after(0, beat, start)
+    for thread in threads:
+        thread.start()
+    root.after(20, check)
+    root.mainloop()
+    root.destroy()
+    return {
+        "mode": mode,
+        "files": files,
+        "wall_time": state["shown"] - start,
+        "ui_lag": max(0.0, state["shown"] - state["finished"]),
+        "callbacks": state["callbacks"],
+        "heartbeat_p50": percentile(lateness, 0.5),
+        "heartbeat_p95": percentile(lateness, 0.95),
+        "heartbeat_max": max(lateness),
+    }
+
+
+def print_ui_table(rows):
+    print(f"{'mode':<6} {'files':>7} {'wall s':>8} {'UI lag s':>9} {'callbacks':>10} "
+          f"{'beat p50 ms':>12} {'beat p95 ms':>12} {'beat max ms':>12}")
+    for row in rows:
+        print(f"{row['mode']:<6} {row['files']:>7} {row['wall_time']:>8.2f} {row['ui_lag']:>9.3f} "
+              f"{row['callbacks']:>10} {row['heartbeat_p50'] * 1000:>12.1f} "
+              f"{row['heartbeat_p95'] * 1000:>12.1f} {row['heartbeat_max'] * 1000:>12.1f}")
+
+
+def run_ui_command(args):
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in UI_MODES]
+    if unknown:
+        print(f"error: unknown mode: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    try:
+        import tkinter
+    except ImportError:
+        print("error: tkinter is not available", file=sys.stderr)
+        return 2
+    try:
+        rows = [stress_ui(mode, args.files, args.jobs, args.job_time, args.fps) for mode in modes]
+    except tkinter.TclError as e:
+        # e.g. no display
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print_ui_table(rows)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pdfcompressor.bench", description=__doc__)
+    parser.add_argument("-l", "--level", default="ebook", help="compression level (default: ebook)")
+    parser.add_argument("-j", "--jobs", type=int, default=core.default_workers())
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--gs", help="path to the Ghostscript executable")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    engines = commands.add_parser("engines", help="spawn-per-file vs. interpreter pool")
+    engines.add_argument("inputs", nargs="+", help="PDF files to benchmark with")
+
+    split = commands.add_parser("split", help="single process vs. page-range shards")
+    split.add_argument("input", help="a large PDF file")
+
+    suite = commands.add_parser("suite", help="every level on every engine over a corpus")
+    suite.add_argument("corpus", nargs="*",
+                       help="PDF files or folders (default: the synthetic corpus only)")
+    suite.add_argument("--synthetic", action="store_true",
+                       help="add the generated synthetic corpus to the given files")
+    suite.add_argument("--synthetic-dir", default=os.path.join(tempfile.gettempdir(), "pdfc-synthetic"),
+                       help="where the synthetic corpus is generated (and reused)")
+    suite.add_argument("--scale", type=float, default=1.0, help="multiply synthetic page counts")
+    suite.add_argument("--levels", default=",".join(SUITE_LEVELS),
+                       help=f"comma-separated levels (default: {','.join(SUITE_LEVELS)})")
+    suite.add_argument("--engines", default=",".join(core.ENGINES),
+                       help=f"comma-separated engines (default: {','.join(core.ENGINES)})")
+    suite.add_argument("--json", metavar="FILE", help="write every measurement as JSON")
+    suite.add_argument("--csv", metavar="FILE", help="write every measurement as CSV")
+
+    flags = commands.add_parser("flags", help="time and size effect of each argument of a preset")
+    flags.add_argument("corpus", nargs="*",
+                       help="PDF files or folders (default: the synthetic corpus)")
+    flags.add_argument("--synthetic-dir", default=os.path.join(tempfile.gettempdir(), "pdfc-synthetic"),
+                       help="where the synthetic corpus is generated (and reused)")
+    flags.add_argument("--scale", type=float, default=1.0, help="multiply synthetic page counts")
+    flags.add_argument("-p", "--preset", default="extreme",
+                       help="level or custom preset whose flags are profiled (default: extreme)")
+    flags.add_argument("--presets", metavar="FILE", help="read custom presets (e.g. settings.json)")
+    flags.add_argument("--emit-preset", metavar="NAME",
+                       help="print a settings.json snippet with a preset NAME that leaves out "
+                            "the flags marked \"drop\"")
+    flags.add_argument("--json", metavar="FILE", help="write every measurement as JSON")
+
+    ui = commands.add_parser("ui", help="Tk event-loop latency under a flood of per-file updates "
+                                        "(no Ghostscript needed)")
+    ui.add_argument("-n", "--files", type=int, default=10000, help="fake jobs (default: 10000)")
+    ui.add_argument("--modes", default=",".join(UI_MODES),
+                    help=f"comma-separated: after (one callback per update), bus (coalesced) "
+                         f"(default: {','.join(UI_MODES)})")
+    ui.add_argument("--job-time", type=float, default=0.0, help="seconds each fake job takes (default: 0)")
+    ui.add_argument("--fps", type=int, default=uibus.DEFAULT_FPS, help="bus drains per second")
+    return parser
+
+
+def fixed_level(level):
+    """The quality setting of ``level``; KeyError for unknown levels and for
+    auto and target-size mode, which are searches rather than a setting"""
+    quality_setting = core.resolve_level(level)
+    if quality_setting in (core.AUTO_SETTING, core.TARGET_SETTING):
+        raise KeyError(f"not a fixed level: {level}")
+    return quality_setting
+
+
+def run_suite_command(args, gs_path):
+    levels = [level.strip() for level in args.levels.split(",") if level.strip()]
+    engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+    for level in levels:
+        try:
+            fixed_level(level)
+        except KeyError as e:
+            print(f"error: {e.args[0]}", file=sys.stderr)
+            return 2
+    unknown = [engine for engine in engines if engine not in core.ENGINES]
+    if unknown:
+        print(f"error: unknown engine: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    inputs = find_corpus(args.corpus)
+    if args.synthetic or not args.corpus:
+        inputs += synthetic.generate_corpus(args.synthetic_dir, args.scale)
+    if not inputs:
+        print("error: no PDF files found", file=sys.stderr)
+        return 2
+
+    records = run_suite(gs_path, inputs, levels, engines, workers=args.jobs, repeat=args.repeat)
+    summary = summarize_suite(records)
+    print_suite_table(summary)
+    if args.json:
+        write_suite_json(records, summary, args.json, gs_path)
+    if args.csv:
+        write_suite_csv(records, args.csv)
+    return 1 if any(record["error"] for record in records) else 0
+
+
+def run_flags_command(args, gs_path):
+    level = args.preset
+    custom_presets = {}
+    if args.presets:
+        try:
+            custom_presets, _rules, _problems = presets.read_presets(args.presets)
+        except (OSError, ValueError) as e:
+            print(f"error: cannot read presets: {e}", file=sys.stderr)
+            return 2
+    try:
+        quality_setting = core.resolve_level(level, custom_presets)
+    except KeyError as e:
+        print(f"error: {e.args[0]}", file=sys.stderr)
+        return 2
+    if not isinstance(quality_setting, list):
+        print(f"error: {level} is a plain -dPDFSETTINGS level without flags to profile", file=sys.stderr)
+        return 2
+    if args.emit_preset:
+        try:
+            presets.validate_preset(args.emit_preset, ["-dPDFSETTINGS=/screen"])
+        except presets.PresetError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+
+    inputs = find_corpus(args.corpus) or synthetic.generate_corpus(args.synthetic_dir, args.scale)
+    rows = judge_flags(run_flag_ablation(gs_path, inputs, quality_setting, workers=args.jobs,
+                                         repeat=args.repeat))
+    # The table goes to stderr when stdout carries the preset snippet
+    stream = sys.stderr if args.emit_preset else sys.stdout
+    with contextlib.redirect_stdout(stream):
+        print(f"{level}: {len(inputs)} file(s), {args.repeat} round(s) per variant")
+        print_flag_table(rows)
+    if args.emit_preset:
+        json.dump({presets.SETTINGS_KEY: {args.emit_preset: preset_spec(trimmed_preset(rows))}}, sys.stdout, indent=2)
+        print()
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"ghostscript": ghostscript_version(gs_path), "level": level,
+                       "files": inputs, "rows": rows}, f, indent=2)
+    return 1 if any(row["error"] for row in rows) else 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "ui":
+        return run_ui_command(args)
+
+    gs_path = find_ghostscript(args.gs)
+    if not gs_path:
+        print("error: Ghostscript not found (use --gs)", file=sys.stderr)
+        return 2
+    if args.command == "suite":
+        return run_suite_command(args, gs_path)
+    if args.command == "flags":
+        return run_flags_command(args, gs_path)
+    try:
+        quality_setting = fixed_level(args.level)
+    except KeyError as e:
+        print(f"error: {e.args[0]}", file=sys.stderr)
+        return 2
+    if args.command == "engines":
+        results = compare_engines(gs_path, args.inputs, quality_setting, args.jobs, args.repeat)
+        print_engine_table(results, len(args.inputs))
+    elif args.command == "split":
+        print_split_table(compare_split(gs_path, args.input, quality_setting, args.jobs, args.repeat))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Content-addressed cache of compressed outputs.
+
+Entries are keyed by the SHA-256 of the input bytes, the resolved
+Ghostscript arguments and the Ghostscript version, so a re-submitted file
+(or a copy under another name) is served from disk instead of being
+recompressed. The cache is bounded in bytes; the least recently used
+entries are evicted first, using each entry's mtime as its last-use time.
+
+Entries are private copies (reflinks where the filesystem supports them),
+never hardlinks of an output, so editing an output in place cannot change
+the cache or any other output served from it.
+"""
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from . import core
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+# ioctl that makes a copy-on-write clone of a file (Btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+
+def default_cache_dir():
+    """Per-user cache folder"""
+    if os.name == 'nt':
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "MaximumPDFCompressor", "cache")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pdfcompressor")
+
+
+def file_sha256(path):
+    """Hash a file in fixed-size chunks so memory use stays flat.
+
+    The digest is remembered while the file's size and mtime stay the
+    same, as a batch asks for it more than once (duplicates, cache, journal).
+    """
+    stat = os.stat(path)
+    return _sha256(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=4096)
+def _sha256(path, _size, _mtime_ns):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ghostscript_version(gs_path):
+    """``gs --version`` output, from the cached probe of the executable"""
+    # Imported here: the ghostscript module uses this module's cache folder
+    from .ghostscript import probe
+    return probe(gs_path).version or "unknown"
+
+
+def _reflink(source, destination):
+    if fcntl is None or not hasattr(os, "uname") or os.uname().sysname != "Linux":
+        raise OSError("reflinks are not supported here")
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def clone_or_copy(source, destination):
+    """Write a private copy of ``source`` to ``destination`` atomically;
+    a copy-on-write clone where the filesystem supports one"""
+    directory = os.path.dirname(os.path.abspath(destination))
+    fd, tmp_path = tempfile.mkstemp(prefix=".pdfc-", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        try:
+            _reflink(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ResultCache:
+    """Size-bounded LRU cache of Ghostscript outputs on disk"""
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # path -> (last use, size) of every entry, and their total size; read
+        # from disk once here and again only when the cache is over budget
+        self._index = {}
+        self._total = 0
+        self._rescan()
+
+    def make_key(self, gs_path, input_path, quality_setting, variant=None):
+        """Key for compressing ``input_path`` with ``quality_setting``.
+
+        ``variant`` holds any other options that change the output.
+        """
+        # Only the arguments that shape the output; the paths do not matter
+        arguments = core.build_command(gs_path, "", "", quality_setting)[1:-2]
+        material = json.dumps({
+            "input": file_sha256(input_path),
+            "arguments": arguments,
+            "ghostscript": ghostscript_version(gs_path),
+            "variant": variant,
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".pdf")
+
+    def fetch(self, key, output_path):
+        """Materialise a cached output; returns False on a miss"""
+        entry = self._entry_path(key)
+        try:
+            clone_or_copy(entry, output_path)
+            os.utime(entry)
+            size = os.path.getsize(entry)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+                self._forget(entry)
+            return False
+        with self._lock:
+            self.hits += 1
+            self._remember(entry, size)
+        return True
+
+    def store(self, key, output_path):
+        """Add a freshly compressed output and evict old entries if needed"""
+        entry = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        clone_or_copy(output_path, entry)
+        size = os.path.getsize(entry)
+        with self._lock:
+            self._remember(entry, size)
+            over_budget = self._total > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _remember(self, path, size):
+        self._forget(path)
+        self._index[path] = (time.time(), size)
+        self._total += size
+
+    def _forget(self, path):
+        _last_used, size = self._index.pop(path, (None, 0))
+        self._total -= size
+
+    def _entries(self):
+        for root, _dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".pdf"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _rescan(self):
+        # Other processes may share the folder, so the disk is the truth
+        self._index = {path: (mtime, size) for mtime, size, path in self._entries()}
+        self._total = sum(size for _mtime, size in self._index.values())
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits ``max_bytes``"""
+        with self._lock:
+            self._rescan()
+            if self._total <= self.max_bytes:
+                return
+            for path, (_last_used, _size) in sorted(self._index.items(), key=lambda item: item[1][0]):
+                if self._total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._forget(path)
+
+    def wrap(self, gs_path, compress_func, variant=None):
+        """Return a ``compress_func`` that consults the cache first"""
+        def cached_compress(input_path, output_path, quality_setting, **kwargs):
+            key = self.make_key(gs_path, input_path, quality_setting, variant)
+            if self.fetch(key, output_path):
+                return {"cache": "hit"}
+            extra = compress_func(input_path, output_path, quality_setting, **kwargs) or {}
+            self.store(key, output_path)
+            return dict(extra, cache="miss")
+        cached_compress.fan_out = functools.partial(core.fan_out, compress_func)
+        return cached_compress
@@ -0,0 +1,489 @@
+"""Headless command line interface: ``python -m pdfcompressor``"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+from . import core
+from . import ghostscript
+from . import preflight
+from . import presets
+from . import shard
+from . import walk
+from .auto import candidate_levels
+from .cache import ResultCache
+from .control import BatchControl
+from .dedupe import DuplicateFinder
+from .journal import BatchJournal
+from .memory import MemoryBudget
+from .metrics import MetricsRecorder
+from .pipeline import open_pipeline
+from .schedule import ORDERS, CostModel, Scheduler, default_model_path
+
+
+def find_ghostscript(explicit=None):
+    """Ghostscript given on the command line, in PDFC_GHOSTSCRIPT, bundled, or found on PATH"""
+    return ghostscript.find_ghostscript(explicit)
+
+
+def ghostscript_args(gs_path, args, memory_budget):
+    """Extra Ghostscript arguments: memory settings plus what this Ghostscript can speed up"""
+    return memory_budget.gs_args() + ghostscript.tuned_args(gs_path, args.jobs, memory_budget)
+
+
+def add_compression_arguments(parser):
+    """Options that shape how each file is compressed, shared with the watch mode"""
+    parser.add_argument("-l", "--level", default="ebook",
+                        help="compression level: " + ", ".join(core.LEVEL_ALIASES)
+                             + ", a full GUI label or a --presets name (default: ebook)")
+    parser.add_argument("--presets", metavar="FILE",
+                        help="read custom presets and preset rules from FILE (the GUI's settings.json, "
+                             "or a JSON object of preset name -> preset)")
+    parser.add_argument("--target-ratio", type=float, metavar="R",
+                        help="with --level auto, stop once an output is at most R times "
+                             "the original size (e.g. 0.5)")
+    parser.add_argument("--target-size", type=float, metavar="MB",
+                        help="with --level auto, stop once an output is at most MB megabytes; "
+                             "with --level target, the largest output size allowed")
+    parser.add_argument("--min-dpi", type=int, default=0,
+                        help="with --level auto or target, never downsample images below this")
+    parser.add_argument("-j", "--jobs", type=int, default=core.default_workers(),
+                        help="number of parallel Ghostscript processes (default: CPU count)")
+    parser.add_argument("--engine", choices=core.ENGINES, default="spawn",
+                        help="spawn one Ghostscript per file, reuse a pool of long-lived "
+                             "interpreters, or recompress images directly (default: spawn)")
+    parser.add_argument("--recycle-after", type=int, default=None, metavar="N",
+                        help="with --engine pool, restart an interpreter after N jobs")
+    parser.add_argument("--cache", nargs="?", const="", default=None, metavar="DIR",
+                        help="reuse results for inputs already compressed with the same "
+                             "settings (default DIR: per-user cache folder)")
+    parser.add_argument("--cache-size", type=int, default=1024, metavar="MB",
+                        help="maximum cache size in megabytes (default: 1024)")
+    parser.add_argument("--split", action="store_true",
+                        help="compress page ranges of large files in parallel and merge them")
+    parser.add_argument("--split-min-pages", type=int, default=shard.DEFAULT_MIN_PAGES, metavar="N",
+                        help=f"split files with at least N pages (default: {shard.DEFAULT_MIN_PAGES})")
+    parser.add_argument("--split-min-mb", type=int, default=shard.DEFAULT_MIN_BYTES // (1024 * 1024),
+                        metavar="MB", help="split files of at least MB megabytes "
+                                           f"(default: {shard.DEFAULT_MIN_BYTES // (1024 * 1024)})")
+    parser.add_argument("--no-preflight", dest="preflight", action="store_false",
+                        help="compress every file as given, without the pre-flight scan")
+    parser.add_argument("--text-page-kb", type=int, default=preflight.DEFAULT_MIN_TEXT_BYTES_PER_PAGE // 1024,
+                        metavar="KB", help="copy text-only files smaller than KB per page instead of compressing "
+                                           f"(default: {preflight.DEFAULT_MIN_TEXT_BYTES_PER_PAGE // 1024})")
+    parser.add_argument("--timeout", type=float, metavar="SECONDS",
+                        help="kill Ghostscript when one file takes longer than SECONDS")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="only start files while the running ones are expected to need at most MB "
+                             "megabytes in total (default: 3/4 of RAM; 0: no limit)")
+    parser.add_argument("--job-memory", type=int, metavar="MB",
+                        help="cap each Ghostscript process at MB megabytes of address space (Linux) "
+                             "and render large pages in bands")
+    parser.add_argument("--gs", help="path to the Ghostscript executable")
+
+
+def add_metrics_arguments(parser):
+    """Where per-job metrics go, shared with the watch mode and the service"""
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="append one JSON record per job (queue wait, Ghostscript time, memory, "
+                             "bytes in/out, status) to FILE")
+    parser.add_argument("--prometheus", metavar="FILE",
+                        help="keep a Prometheus text-format file of the aggregated metrics up to date")
+
+
+def open_metrics(args):
+    """``MetricsRecorder`` for the parsed options, or print the problem and return None"""
+    try:
+        return MetricsRecorder(args.metrics, args.prometheus)
+    except OSError as e:
+        print(f"error: cannot open the metrics log: {e}", file=sys.stderr)
+        return None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pdfcompressor",
+        description="Compress PDF files with Ghostscript without starting the GUI.")
+    parser.add_argument("inputs", nargs="*",
+                        help="PDF files or folders to compress (may be left out with --resume)")
+    parser.add_argument("-o", "--output-dir",
+                        help="output folder (default: next to each input file); the subfolders "
+                             "of a folder input are recreated under it")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="also compress the PDF files in the subfolders of folder inputs")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                        help="in folder inputs, only compress files matching GLOB (e.g. 'invoice-*' "
+                             "or 'scans/*'; may be repeated)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="in folder inputs, skip files and folders matching GLOB (may be repeated)")
+    add_compression_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument("--order", choices=ORDERS, default="lpt",
+                        help="lpt: start the files expected to take longest first (default); "
+                             "fifo: keep the given order. Folders are compressed in the order they are "
+                             "walked, while they are walked (except with --journal)")
+    parser.add_argument("--no-dedupe", dest="dedupe", action="store_false",
+                        help="compress identical input files separately instead of copying one output")
+    parser.add_argument("--timings", metavar="FILE",
+                        help="where past timings are kept to estimate file cost "
+                             f"(default: {default_model_path()})")
+    parser.add_argument("--journal", metavar="FILE",
+                        help="record the state of every job in FILE so the batch can be resumed")
+    parser.add_argument("--resume", action="store_true",
+                        help="with --journal, skip files that already finished with the same settings; "
+                             "without inputs, resume the journalled batch")
+    parser.add_argument("--report", metavar="FILE",
+                        help="write a JSON report to FILE ('-' for stdout)")
+    parser.add_argument("--progress", action="store_true",
+                        help="show page-level progress and an ETA on stderr")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print errors")
+    return parser
+
+
+def print_result(result, completed, total, stream=sys.stdout):
+    if result.ok:
+        chosen = ""
+        if "auto_level" in result.extra:
+            chosen = f" [{result.extra['auto_level']}]"
+        elif result.extra.get("target_runs"):
+            chosen = f" [{result.extra['target']}, {result.extra['target_runs']} runs]"
+        elif "target" in result.extra:
+            chosen = f" [{result.extra['target']}]"
+        elif result.extra.get("resumed"):
+            chosen = " [done earlier]"
+        elif "duplicate_of" in result.extra:
+            chosen = f" [same as {os.path.basename(result.extra['duplicate_of'])}]"
+        elif "preflight" in result.extra:
+            chosen = f" [{result.extra['preflight']}]"
+        elif "preset" in result.extra:
+            chosen = f" [{result.extra['preset']}]"
+        peak = ""
+        if result.extra.get("peak_rss"):
+            peak = f", peak {core.format_file_size(result.extra['peak_rss'])}"
+        print(f"[{completed}/{total or '?'}] {result.input_path}: "
+              f"{core.format_file_size(result.original_size)} -> "
+              f"{core.format_file_size(result.compressed_size)} ({result.elapsed:.1f}s{peak}){chosen}", file=stream)
+    else:
+        hint = " (over the --job-memory limit)" if result.extra.get("memory_limited") else ""
+        print(f"[{completed}/{total or '?'}] {result.input_path}: FAILED: {result.error}{hint}", file=sys.stderr)
+
+
+class ProgressLine:
+    """Single self-overwriting status line on stderr, refreshed at most 5x/s"""
+
+    def __init__(self, total_files, stream=sys.stderr):
+        self.tracker = core.ProgressTracker(total_files)
+        self.stream = stream
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def on_progress(self, input_path, done_pages, total_pages):
+        self.tracker.update(input_path, done_pages, total_pages)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last < 0.2:
+                return
+            self._last = now
+            fraction, eta = self.tracker.snapshot()
+            name = os.path.basename(input_path)[:40]
+            if fraction is None:
+                # Folders are still being walked
+                done = f"[{self.tracker.completed} done]"
+            else:
+                eta_text = core.format_duration(eta) if eta is not None else "--:--"
+                done = f"[{fraction * 100:5.1f}%] ETA {eta_text}"
+            self.stream.write(f"\r{done}  {name} page {done_pages}/{total_pages}\033[K")
+            self.stream.flush()
+
+    def finish(self, input_path, total=None):
+        if total is not None and self.tracker.total_files is None:
+            self.tracker.total_files = max(1, total)
+        self.tracker.finish(input_path)
+        with self._lock:
+            self.stream.write("\r\033[K")
+            self.stream.flush()
+
+
+def memory_report(batch, memory_budget):
+    peaks = [r.extra["peak_rss"] for r in batch.results if r.extra.get("peak_rss")]
+    return dict(memory_budget.report(), peak_rss=max(peaks) if peaks else None)
+
+
+def format_metrics(summary):
+    """One line of latency and throughput aggregates"""
+    if summary["latency_p50"] is None:
+        return None
+    line = (f"p50 {summary['latency_p50']:.1f}s, p95 {summary['latency_p95']:.1f}s per file, "
+            f"{summary['mb_per_s']:.1f} MB/s, {summary['files_per_min']:.1f} files/min")
+    if summary["gs_time"]:
+        line += (f"; Ghostscript {summary['gs_time']:.1f}s wall, {summary['user_time']:.1f}s user, "
+                 f"{summary['sys_time']:.1f}s system")
+    return line
+
+
+def print_summary(batch, schedule=None, memory=None, metrics=None):
+    print(f"{batch.success_count}/{len(batch.results)} files compressed in {batch.elapsed:.1f}s, "
+          f"{core.format_file_size(batch.total_original_size)} -> "
+          f"{core.format_file_size(batch.total_compressed_size)} "
+          f"({batch.reduction:.1f}% saved)")
+    if batch.cache_hits or batch.cache_misses:
+        print(f"cache: {batch.cache_hits} hit(s), {batch.cache_misses} miss(es)")
+    split_files = [r for r in batch.results if r.extra.get("shards")]
+    if split_files:
+        print(f"split: {len(split_files)} file(s) compressed in page-range shards")
+    if batch.cancelled:
+        print(f"cancelled: {len(batch.cancelled)} file(s) were not finished")
+    resumed = [r for r in batch.results if r.extra.get("resumed")]
+    if resumed:
+        print(f"resume: {len(resumed)} file(s) finished in an earlier run were skipped")
+    copied = [r for r in batch.results if r.extra.get("preflight")]
+    if copied:
+        print(f"pre-flight: {len(copied)} text-only file(s) copied unchanged")
+    if batch.deduplicated:
+        print(f"duplicates: {len(batch.deduplicated)} identical file(s) compressed once, "
+              f"about {batch.time_saved:.1f}s of compression saved")
+    if memory and memory["peak_rss"]:
+        budget = core.format_file_size(memory["budget"]) if memory["budget"] else "unlimited"
+        held = f", {memory['waits']} file(s) waited for memory" if memory["waits"] else ""
+        print(f"memory: largest Ghostscript peak {core.format_file_size(memory['peak_rss'])}, "
+              f"budget {budget}{held}")
+    if schedule and schedule["order"] == "lpt" and schedule["improvement"] >= 1:
+        print(f"schedule: longest-first makespan {schedule['makespan']:.1f}s vs. "
+              f"{schedule['fifo_makespan']:.1f}s in the given order ({schedule['improvement']:.0f}% shorter)")
+    line = format_metrics(metrics) if metrics else None
+    if line:
+        print(f"metrics: {line}")
+
+
+def write_report(batch, destination, schedule=None, memory=None, metrics=None):
+    data = batch.to_dict()
+    if schedule:
+        data["schedule"] = schedule
+    if memory:
+        data["memory"] = memory
+    if metrics:
+        data["metrics"] = metrics
+    report = json.dumps(data, indent=2)
+    if destination == "-":
+        print(report)
+    else:
+        with open(destination, 'w', encoding='utf-8') as f:
+            f.write(report)
+
+
+@contextlib.contextmanager
+def signal_handlers(batch_control):
+    """Ctrl+C and SIGTERM cancel the batch (a second Ctrl+C aborts at once);
+    Ctrl+Z pauses the Ghostscript processes along with this one (POSIX)"""
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def cancel(signum, frame):
+        print("\ncancelling...", file=sys.stderr)
+        batch_control.cancel()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    def suspend(signum, frame):
+        # Ghostscript runs in its own session, so the terminal's stop
+        # signal does not reach it; stop it, then stop ourselves
+        batch_control.pause()
+        signal.signal(signal.SIGTSTP, signal.SIG_DFL)
+        os.kill(os.getpid(), signal.SIGTSTP)
+
+    def resume(signum, frame):
+        signal.signal(signal.SIGTSTP, suspend)
+        batch_control.resume()
+
+    handlers = {signal.SIGINT: cancel, signal.SIGTERM: cancel}
+    if hasattr(signal, "SIGTSTP"):
+        handlers[signal.SIGTSTP] = suspend
+        handlers[signal.SIGCONT] = resume
+    previous = {signum: signal.signal(signum, handler) for signum, handler in handlers.items()}
+    try:
+        yield
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+def pipeline_options(args):
+    """``open_pipeline`` keyword arguments for the parsed compression options"""
+    engine_options = {}
+    if args.engine == "pool" and args.recycle_after:
+        engine_options["max_jobs"] = args.recycle_after
+    cache = None
+    if args.cache is not None:
+        cache = ResultCache(args.cache or None, max_bytes=args.cache_size * 1024 * 1024)
+    split = None
+    if args.split:
+        split = {"min_pages": args.split_min_pages, "min_bytes": args.split_min_mb * 1024 * 1024}
+    target_bytes = int(args.target_size * 1024 * 1024) if args.target_size else None
+    auto = {"min_dpi": args.min_dpi, "target_ratio": args.target_ratio, "target_bytes": target_bytes}
+    target = {"target_bytes": target_bytes, "min_dpi": args.min_dpi}
+    gate = None
+    if args.preflight:
+        gate = {"min_text_bytes_per_page": args.text_page_kb * 1024}
+    return {"engine": args.engine, "workers": args.jobs, "engine_options": engine_options,
+            "cache": cache, "split": split, "auto": auto, "target": target,
+            "preflight": gate, "rules": getattr(args, "rules", None)}
+
+
+def memory_budget_for(args):
+    return MemoryBudget(
+        budget_bytes=args.memory_budget * 1024 * 1024 if args.memory_budget is not None else None,
+        process_limit=args.job_memory * 1024 * 1024 if args.job_memory else None)
+
+
+def check_compression_arguments(args):
+    """(quality setting, Ghostscript path), or print the problem and return None"""
+    # Kept on args for pipeline_options() and the server's per-job levels
+    args.custom_presets, args.rules = {}, []
+    if args.presets:
+        try:
+            args.custom_presets, args.rules, problems = presets.read_presets(args.presets)
+        except (OSError, ValueError) as e:
+            print(f"error: cannot read presets: {e}", file=sys.stderr)
+            return None
+        for problem in problems:
+            print(f"warning: skipped: {problem}", file=sys.stderr)
+    custom_presets = args.custom_presets
+    try:
+        quality_setting = core.resolve_level(args.level, custom_presets)
+    except KeyError as e:
+        print(f"error: {e.args[0]}", file=sys.stderr)
+        return None
+    if quality_setting == core.TARGET_SETTING and not args.target_size:
+        print("error: --level target needs --target-size MB", file=sys.stderr)
+        return None
+    if not candidate_levels(args.min_dpi):
+        print(f"error: no compression level keeps images at {args.min_dpi} dpi or more", file=sys.stderr)
+        return None
+    gs_path = find_ghostscript(args.gs)
+    if not gs_path:
+        print(f"error: Ghostscript not found (use --gs or set {ghostscript.ENV_VAR})", file=sys.stderr)
+        return None
+    if not ghostscript.probe(gs_path).has_pdfwrite:
+        print(f"error: {gs_path} has no pdfwrite device", file=sys.stderr)
+        return None
+    return quality_setting, gs_path
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.resume and not args.journal:
+        print("error: --resume needs --journal FILE", file=sys.stderr)
+        return 2
+    journal = BatchJournal(args.journal) if args.journal else None
+    if args.inputs:
+        jobs = walk.iter_jobs(args.inputs, args.output_dir, args.recursive, args.include, args.exclude,
+                              onerror=lambda e: print(f"warning: cannot read folder: {e}", file=sys.stderr))
+        # Folders are compressed while they are walked, unless the journal
+        # has to know the whole batch before it starts
+        if journal is not None or not walk.has_folders(args.inputs):
+            jobs = list(jobs)
+            if not jobs:
+                print("error: no PDF files found", file=sys.stderr)
+                return 2
+    elif args.resume and journal.jobs():
+        jobs = journal.jobs()
+    else:
+        print("error: no input files", file=sys.stderr)
+        return 2
+    checked = check_compression_arguments(args)
+    if checked is None:
+        return 2
+    quality_setting, gs_path = checked
+    recorder = open_metrics(args)
+    if recorder is None:
+        return 2
+
+    on_result = None
+    if not args.quiet:
+        # Keep stdout clean for the JSON report when it is written there
+        stream = sys.stderr if args.report == "-" else sys.stdout
+        on_result = functools.partial(print_result, stream=stream)
+    on_progress = None
+    if args.progress:
+        progress_line = ProgressLine(len(jobs) if isinstance(jobs, list) else None)
+        on_progress = progress_line.on_progress
+        print_one = on_result
+
+        def on_result(result, completed, total):
+            progress_line.finish(result.input_path, total)
+            if print_one:
+                print_one(result, completed, total)
+    options = pipeline_options(args)
+    resumed = []
+    if journal is not None:
+        settings = {"level": quality_setting, "auto": options["auto"], "split": options["split"],
+                    "preflight": options["preflight"]}
+        if options["rules"]:
+            settings["rules"] = options["rules"]
+        jobs, resumed = journal.begin(jobs, settings, resume=args.resume)
+        if on_result is not None:
+            for i, result in enumerate(resumed, 1):
+                on_result(result, i, len(resumed))
+        print_one_result = on_result
+
+        def on_result(result, completed, total):
+            journal.record(result)
+            if print_one_result:
+                print_one_result(result, completed, total)
+    # Only jobs of this run are measured, not the ones the journal replays
+    print_measured = on_result
+
+    def on_result(result, completed, total):
+        recorder.record(result)
+        if print_measured:
+            print_measured(result, completed, total)
+    scheduler = Scheduler(CostModel(args.timings or default_model_path()), order=args.order,
+                          scan=args.preflight, rules=args.rules)
+    # Walked folders stay in walk order: sorting them would mean waiting for the whole tree
+    streaming = not isinstance(jobs, list)
+    selection_order = jobs
+    if not streaming:
+        jobs = scheduler.order_jobs(jobs, quality_setting)
+    batch_control = BatchControl(timeout=args.timeout)
+    memory_budget = memory_budget_for(args)
+    recorder.start_clock()
+    with signal_handlers(batch_control), \
+            open_pipeline(gs_path, gs_args=ghostscript_args(gs_path, args, memory_budget),
+                          **options) as compress_func:
+        batch = core.compress_batch(gs_path, jobs, quality_setting, max_workers=args.jobs,
+                                    on_result=on_result, compress_func=compress_func,
+                                    on_progress=on_progress, batch_control=batch_control,
+                                    memory_budget=memory_budget,
+                                    duplicates=DuplicateFinder(options["rules"]) if args.dedupe and not streaming else None)
+    scheduler.record(batch, quality_setting)
+    try:
+        scheduler.model.save()
+    except OSError as e:
+        print(f"warning: could not save timings: {e}", file=sys.stderr)
+    schedule = None if streaming else scheduler.makespan_report(batch, jobs, selection_order, args.jobs)
+    memory = memory_report(batch, memory_budget)
+    recorder.close()
+    metrics = recorder.summary()
+    if journal is not None:
+        journal.close()
+        batch.results[:0] = resumed
+
+    if streaming and not batch.results:
+        print("error: no PDF files found", file=sys.stderr)
+        return 2
+    if args.quiet:
+        for result in batch.failed:
+            print(f"{result.input_path}: FAILED: {result.error}", file=sys.stderr)
+    elif args.report != "-":
+        print_summary(batch, schedule, memory, metrics)
+    if args.report:
+        write_report(batch, args.report, schedule, memory, metrics)
+    if batch_control.cancelled:
+        return 130
+    return 1 if batch.failed else 0
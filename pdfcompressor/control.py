@@ -0,0 +1,323 @@
+"""Hard control over running Ghostscript processes.
+
+Every Ghostscript child runs in its own process group (its own session
+on POSIX), so it can be killed together with anything it starts and is
+not hit by the terminal's Ctrl+C or Ctrl+Z. A ``JobControl`` is the
+``cancel`` event handed to a ``compress_func``. Engines attach the
+processes they start to it. Setting it kills them at once; pausing it
+stops them with SIGSTOP and resuming continues them with SIGCONT
+(POSIX only; on Windows a pause only holds back jobs that have not
+started yet). A ``BatchControl`` hands out one ``JobControl`` per input,
+and cancels, pauses or times out single jobs or the whole batch.
+"""
+import atexit
+import functools
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+CAN_SUSPEND = hasattr(signal, "SIGSTOP")
+# Setting a resource limit on another process needs prlimit (Linux)
+CAN_LIMIT_MEMORY = resource is not None and hasattr(resource, "prlimit") and hasattr(resource, "RLIMIT_AS")
+
+# Every attached process, so none outlives the program
+_live_processes = set()
+_live_lock = threading.Lock()
+
+
+def popen_options():
+    """``subprocess.Popen`` keyword arguments for a new process group"""
+    if os.name == 'nt':
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+@functools.lru_cache(maxsize=None)
+def _prlimit_tool():
+    return shutil.which("prlimit") if os.name != 'nt' else None
+
+
+def limited_command(command, memory_limit):
+    """``command`` with its address space capped at ``memory_limit`` bytes
+    from the first instruction, through prlimit(1) where it is installed.
+
+    No Python runs in the child between fork and exec, which would not be
+    safe with other threads running. Without prlimit the command is
+    returned as is, and ``JobControl.attach`` caps the process as soon as
+    it has started.
+    """
+    if not memory_limit or not CAN_LIMIT_MEMORY or not _prlimit_tool():
+        return list(command)
+    try:
+        _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    except (OSError, ValueError):
+        return list(command)
+    if hard != resource.RLIM_INFINITY:
+        memory_limit = min(memory_limit, hard)
+    # Only the soft limit, as limit_memory() sets it
+    return [_prlimit_tool(), f"--as={int(memory_limit)}:", "--"] + list(command)
+
+
+def _signal_group(process, sig):
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        # Not a group leader (started without popen_options)
+        try:
+            os.kill(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+def kill_process(process):
+    """Kill ``process`` and its process group"""
+    if os.name == 'nt':
+        try:
+            process.kill()
+        except OSError:
+            pass
+        return
+    _signal_group(process, signal.SIGKILL)
+
+
+def suspend_process(process):
+    if CAN_SUSPEND:
+        _signal_group(process, signal.SIGSTOP)
+
+
+def resume_process(process):
+    if CAN_SUSPEND:
+        _signal_group(process, signal.SIGCONT)
+
+
+def limit_memory(process, limit):
+    """Cap the address space of ``process`` at ``limit`` bytes, where supported.
+
+    Only the soft limit is lowered, so a later job may set another cap on
+    the same (pooled) process. New processes get their cap before they
+    run through ``limited_command`` instead, where prlimit(1) is installed.
+    """
+    if not CAN_LIMIT_MEMORY or process.returncode is not None:
+        return False
+    try:
+        _soft, hard = resource.prlimit(process.pid, resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.prlimit(process.pid, resource.RLIMIT_AS, (limit, hard))
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+@atexit.register
+def kill_all():
+    """Kill every Ghostscript process still attached to a job"""
+    with _live_lock:
+        processes = list(_live_processes)
+        _live_processes.clear()
+    for process in processes:
+        kill_process(process)
+
+
+class JobControl(threading.Event):
+    """Cancel event of one job that also owns the job's processes.
+
+    ``set()`` cancels: attached processes are killed and child controls
+    (e.g. the presets auto mode races) are cancelled too.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.paused = False
+        self.timed_out = False
+        # Address space cap in bytes for every attached process, if any
+        self.memory_limit = None
+        self._processes = set()
+        self._children = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def linked_to(cls, cancel):
+        """A new control cancelled along with ``cancel`` (any Event or None)"""
+        if isinstance(cancel, JobControl):
+            return cancel.child()
+        control = cls()
+        if cancel is not None:
+            threading.Thread(target=_forward, args=(cancel, control), daemon=True).start()
+        return control
+
+    def attach(self, process):
+        with self._lock:
+            cancelled = self.is_set()
+            if not cancelled:
+                self._processes.add(process)
+                with _live_lock:
+                    _live_processes.add(process)
+                if self.memory_limit:
+                    limit_memory(process, self.memory_limit)
+                if self.paused:
+                    suspend_process(process)
+        if cancelled:
+            kill_process(process)
+
+    def detach(self, process):
+        with self._lock:
+            self._processes.discard(process)
+        with _live_lock:
+            _live_processes.discard(process)
+
+    def set(self):
+        with self._lock:
+            super().set()
+            processes = list(self._processes)
+            children = list(self._children)
+        for process in processes:
+            kill_process(process)
+        for child in children:
+            child.set()
+
+    def expire(self):
+        """Cancel because the job ran out of time"""
+        self.timed_out = True
+        self.set()
+
+    def pause(self):
+        with self._lock:
+            self.paused = True
+            processes = list(self._processes)
+            children = list(self._children)
+        for process in processes:
+            suspend_process(process)
+        for child in children:
+            child.pause()
+
+    def resume(self):
+        with self._lock:
+            self.paused = False
+            processes = list(self._processes)
+            children = list(self._children)
+        for process in processes:
+            resume_process(process)
+        for child in children:
+            child.resume()
+
+    def child(self):
+        child = JobControl()
+        child.memory_limit = self.memory_limit
+        with self._lock:
+            self._children.append(child)
+            paused = self.paused
+            cancelled = self.is_set()
+        if paused:
+            child.pause()
+        if cancelled:
+            child.set()
+        return child
+
+    def wait_while_paused(self):
+        """Block while paused; returns False if the job was cancelled"""
+        while self.paused and not self.is_set():
+            self.wait(0.1)
+        return not self.is_set()
+
+
+def _forward(source, target):
+    """Set ``target`` when ``source`` is set; returns once ``target`` is set"""
+    while not target.is_set():
+        if source.wait(0.1):
+            target.set()
+
+
+class BatchControl:
+    """Cancel, pause and time out the jobs of a batch, keyed by input path.
+
+    ``timeout`` is the most seconds one file may run, not counting time
+    spent paused.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.cancelled = False
+        self.paused = False
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def job(self, input_path):
+        with self._lock:
+            job = self._jobs.get(input_path)
+            if job is not None:
+                return job
+            job = self._jobs[input_path] = JobControl()
+            cancelled, paused = self.cancelled, self.paused
+        if paused:
+            job.pause()
+        if cancelled:
+            job.set()
+        return job
+
+    def forget(self, input_path):
+        """Drop a finished job's control (for long-running batches)"""
+        with self._lock:
+            self._jobs.pop(input_path, None)
+
+    def _all_jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self):
+        self.cancelled = True
+        for job in self._all_jobs():
+            job.set()
+
+    def pause(self):
+        self.paused = True
+        for job in self._all_jobs():
+            job.pause()
+
+    def resume(self):
+        self.paused = False
+        for job in self._all_jobs():
+            job.resume()
+
+    def cancel_job(self, input_path):
+        self.job(input_path).set()
+
+    def pause_job(self, input_path):
+        self.job(input_path).pause()
+
+    def resume_job(self, input_path):
+        self.job(input_path).resume()
+
+    def start(self, job):
+        """Start the timeout clock of a job that is about to run.
+
+        Returns an event to set once the job is over, which stops the clock.
+        """
+        done = threading.Event()
+        if self.timeout:
+            threading.Thread(target=self._watchdog, args=(job, done), daemon=True).start()
+        return done
+
+    def _watchdog(self, job, done):
+        used = 0.0
+        last = time.monotonic()
+        while not done.wait(0.2) and not job.is_set():
+            now = time.monotonic()
+            if not job.paused:
+                # A much longer gap means this process itself was stopped
+                # (Ctrl+Z); that time does not count either
+                used += min(now - last, 1.0)
+            last = now
+            if used >= self.timeout:
+                job.expire()
+                return
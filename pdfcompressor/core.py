@@ -0,0 +1,691 @@
+"""GUI-free PDF compression core built on Ghostscript.
+
+Nothing in this module imports Tk, so it can be used from the CLI, from
+batch servers without a display, or from the CustomTkinter front-end.
+"""
+import contextlib
+import functools
+import math
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
+
+from . import control
+
+# Quality setting of the automatic level; handled by auto.AutoCompressor,
+# which races the other levels and keeps the smallest acceptable output
+AUTO_SETTING = "auto"
+AUTO_LEVEL = "Otomatis (Coba semua level, ambil yang terkecil)"
+
+# Quality setting of target-size mode; handled by target.TargetSizeCompressor,
+# which searches resolution and JPEG quality for a maximum output size
+TARGET_SETTING = "target"
+TARGET_LEVEL = "Ukuran Target (Kualitas terbaik di bawah batas ukuran)"
+
+# --- Mapping Level Kompresi ---
+COMPRESSION_LEVELS = {
+    "Ekstrem (Perkiraan kompresi 70-95%)": [
+        "-dPDFSETTINGS=/screen",
+        "-dColorImageResolution=72",
+        "-dGrayImageResolution=72",
+        "-dMonoImageResolution=72",
+        "-dDownsampleColorImages=true",
+        "-dDownsampleGrayImages=true",
+        "-dDownsampleMonoImages=true",
+        "-dColorImageDownsampleType=/Bicubic",
+        "-dGrayImageDownsampleType=/Bicubic",
+        "-dMonoImageDownsampleType=/Bicubic",
+        "-dConvertCMYKImagesToRGB=true",
+        "-dDetectDuplicateImages=true",
+        "-dCompressFonts=true",
+        "-dSubsetFonts=true",
+        "-dOptimize=true"
+    ],
+    "Rendah (Kompresi Tinggi, ~60-85%)": "/screen",
+    "Sedang (Seimbang, ~40-70%)": "/ebook",
+    "Tinggi (Kualitas Cetak, ~10-30%)": "/printer",
+    "Sangat Tinggi (Prepress, ~0-15%)": "/prepress",
+    AUTO_LEVEL: AUTO_SETTING,
+    TARGET_LEVEL: TARGET_SETTING,
+}
+
+DEFAULT_LEVEL = "Sedang (Seimbang, ~40-70%)"
+
+# Short names for scripts and the command line
+LEVEL_ALIASES = {
+    "extreme": "Ekstrem (Perkiraan kompresi 70-95%)",
+    "screen": "Rendah (Kompresi Tinggi, ~60-85%)",
+    "ebook": "Sedang (Seimbang, ~40-70%)",
+    "printer": "Tinggi (Kualitas Cetak, ~10-30%)",
+    "prepress": "Sangat Tinggi (Prepress, ~0-15%)",
+    "auto": AUTO_LEVEL,
+    "target": TARGET_LEVEL,
+}
+
+OUTPUT_SUFFIX = "_compressed"
+
+# Ghostscript shipped next to the application (or inside its bundle)
+BUNDLED_GHOSTSCRIPT = ("gswin64c.exe",) if os.name == 'nt' else ("gs", os.path.join("bin", "gs"))
+
+# "spawn" starts one Ghostscript process per file, "pool" reuses long-lived
+# interpreters (see gspool), "direct" recompresses only the images without
+# Ghostscript where it can (see direct)
+ENGINES = ("spawn", "pool", "direct")
+
+# Lines Ghostscript prints per page when -dQUIET is off
+PAGES_LINE = re.compile(r"^Processing pages (\d+) through (\d+)")
+PAGE_LINE = re.compile(r"^Page (\d+)\s*$")
+# How much Ghostscript output is kept for error messages
+OUTPUT_TAIL_LINES = 200
+# Jobs queued per worker when a batch pulls its jobs from an iterator
+SUBMIT_AHEAD = 4
+
+
+class GhostscriptError(RuntimeError):
+    """Raised when Ghostscript exits with a non-zero status"""
+
+    def __init__(self, returncode, stderr=""):
+        self.returncode = returncode
+        self.stderr = stderr or ""
+        message = f"Ghostscript error (exit code {returncode})"
+        if self.stderr.strip():
+            message += f":\n{self.stderr.strip()}"
+        super().__init__(message)
+
+
+class CompressionCancelled(Exception):
+    """Raised when a running compression is stopped on request"""
+
+    def __init__(self, message="Compression cancelled"):
+        super().__init__(message)
+
+
+@dataclass
+class FileResult:
+    """Outcome of compressing a single input file"""
+    input_path: str
+    output_path: str
+    original_size: int = 0
+    compressed_size: int = 0
+    elapsed: float = 0.0
+    error: str = None
+    extra: dict = field(default_factory=dict)
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self):
+        return {
+            "input": self.input_path,
+            "output": self.output_path,
+            "original_size": self.original_size,
+            "compressed_size": self.compressed_size,
+            "elapsed": round(self.elapsed, 3),
+            "error": self.error,
+            **self.extra,
+        }
+
+
+@dataclass
+class BatchResult:
+    """Aggregated outcome of a batch; results are kept in completion order"""
+    results: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def success_count(self):
+        return sum(1 for r in self.results if r.ok)
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def total_original_size(self):
+        return sum(r.original_size for r in self.results if r.ok)
+
+    @property
+    def total_compressed_size(self):
+        return sum(r.compressed_size for r in self.results if r.ok)
+
+    @property
+    def reduction(self):
+        original = self.total_original_size
+        if original <= 0:
+            return 0.0
+        return (original - self.total_compressed_size) / original * 100
+
+    @property
+    def cancelled(self):
+        return [r for r in self.results if r.extra.get("cancelled")]
+
+    @property
+    def cache_hits(self):
+        return sum(1 for r in self.results if r.extra.get("cache") == "hit")
+
+    @property
+    def cache_misses(self):
+        return sum(1 for r in self.results if r.extra.get("cache") == "miss")
+
+    @property
+    def deduplicated(self):
+        """Results copied from an identical input of the same batch"""
+        return [r for r in self.results if r.ok and "duplicate_of" in r.extra]
+
+    @property
+    def time_saved(self):
+        """Compression time the copies of identical inputs did not need"""
+        return sum(r.extra.get("time_saved", 0.0) for r in self.deduplicated)
+
+    def to_dict(self):
+        return {
+            "files": len(self.results),
+            "succeeded": self.success_count,
+            "failed": len(self.failed),
+            "total_original_size": self.total_original_size,
+            "total_compressed_size": self.total_compressed_size,
+            "reduction_percent": round(self.reduction, 2),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "deduplicated": len(self.deduplicated),
+            "time_saved": round(self.time_saved, 3),
+            "elapsed": round(self.elapsed, 3),
+            "results": [r.to_dict() for r in self.results],
+        }
+
+
+def get_base_path():
+    """Folder holding bundled resources (PyInstaller bundle or project root)"""
+    if getattr(sys, 'frozen', False):
+        return sys._MEIPASS
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_ghostscript_path():
+    """Ghostscript bundled with the application, or None when there is none
+    (see ``ghostscript.find_ghostscript`` for the full search)"""
+    for name in BUNDLED_GHOSTSCRIPT:
+        gs_path = os.path.join(get_base_path(), name)
+        if os.path.isfile(gs_path):
+            return gs_path
+    return None
+
+
+def resolve_level(name, presets=None):
+    """Return the quality setting for a level label, short alias or custom preset"""
+    if presets and name in presets:
+        return presets[name]
+    if name in COMPRESSION_LEVELS:
+        return COMPRESSION_LEVELS[name]
+    key = LEVEL_ALIASES.get(str(name).lower())
+    if key is None:
+        raise KeyError(f"Unknown compression level: {name}")
+    return COMPRESSION_LEVELS[key]
+
+
+def get_file_size(file_path):
+    """Get file size in bytes"""
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def format_file_size(size_bytes):
+    """Format file size to human readable format"""
+    if size_bytes <= 0:
+        return "0 B"
+
+    size_names = ["B", "KB", "MB", "GB", "TB"]
+    i = min(int(math.floor(math.log(size_bytes, 1024))), len(size_names) - 1)
+    p = math.pow(1024, i)
+    s = round(size_bytes / p, 2)
+    return f"{s} {size_names[i]}"
+
+
+def generate_output_path(input_path, output_dir=None):
+    """Generate output file path (next to the input when no folder is given)"""
+    if not output_dir:
+        output_dir = os.path.dirname(input_path)
+    filename = os.path.basename(input_path)
+    name, ext = os.path.splitext(filename)
+    return os.path.join(output_dir, f"{name}{OUTPUT_SUFFIX}{ext}")
+
+
+def build_command(gs_path, input_path, output_path, quality_setting, extra_args=()):
+    """Build the Ghostscript argument list for one file.
+
+    ``extra_args`` go before the quality settings, e.g. memory settings
+    that do not change the output. A ``-c`` segment at the end of the
+    quality settings (PostScript such as distiller parameters) is moved
+    after the output file and closed with ``-f``, as Ghostscript needs.
+    """
+    base_command = [
+        gs_path,
+        "-sDEVICE=pdfwrite",
+        "-dCompatibilityLevel=1.4",
+        "-dNOPAUSE",
+        "-dQUIET",
+        "-dBATCH",
+    ]
+
+    if isinstance(quality_setting, str):
+        quality_command = [f"-dPDFSETTINGS={quality_setting}"]
+    else:
+        quality_command = list(quality_setting)
+    postscript = []
+    if "-c" in quality_command:
+        index = quality_command.index("-c")
+        quality_command, postscript = quality_command[:index], quality_command[index:] + ["-f"]
+
+    return (base_command + list(extra_args) + quality_command + [f"-sOutputFile={output_path}"]
+            + postscript + [input_path])
+
+
+def _startupinfo():
+    """Hide the console window Ghostscript would open on Windows"""
+    if os.name != 'nt':
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return startupinfo
+
+
+class PageProgressParser:
+    """Turn Ghostscript's page messages into ``progress(done, total)`` calls"""
+
+    def __init__(self, progress):
+        self.progress = progress
+        self.first = 1
+        self.total = None
+
+    def feed(self, line):
+        match = PAGES_LINE.match(line)
+        if match:
+            self.first, last = int(match.group(1)), int(match.group(2))
+            self.total = last - self.first + 1
+            self.progress(0, self.total)
+            return
+        match = PAGE_LINE.match(line)
+        if match and self.total:
+            self.progress(min(int(match.group(1)) - self.first + 1, self.total), self.total)
+
+
+def _drain(stream, tail):
+    for line in stream:
+        tail.append(line.rstrip("\r\n"))
+
+
+def _kill_when_cancelled(process, cancel):
+    while process.poll() is None:
+        if cancel.wait(0.1):
+            control.kill_process(process)
+            return
+
+
+def _reap(process):
+    """Wait for ``process``; returns (returncode, resource usage or None).
+
+    On POSIX the child is reaped with wait4, which reports its CPU time
+    and peak resident set size.
+    """
+    if not hasattr(os, "wait4"):
+        return process.wait(), None
+    try:
+        _pid, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # Already reaped by a concurrent poll()
+        return process.wait(), None
+    returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    process.returncode = returncode
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return returncode, {"cpu_time": rusage.ru_utime + rusage.ru_stime,
+                        "user_time": rusage.ru_utime, "sys_time": rusage.ru_stime,
+                        "peak_rss": rusage.ru_maxrss * scale}
+
+
+def run_ghostscript(command, progress=None, cancel=None):
+    """Run a Ghostscript command line, raising GhostscriptError on failure.
+
+    With ``progress``, -dQUIET is dropped and the per-page messages are
+    parsed as they are printed; ``progress(done_pages, total_pages)`` is
+    called for each page. Only the last lines of output are kept. Setting
+    the ``cancel`` event kills the process and raises CompressionCancelled;
+    a ``control.JobControl`` can also pause it. Returns the process's wall
+    time (``gs_time``) and, where the platform reports it, the child's
+    resource usage (``cpu_time``, ``user_time``, ``sys_time`` in seconds and
+    ``peak_rss`` in bytes).
+    """
+    if progress is not None:
+        command = [arg for arg in command if arg != "-dQUIET"]
+    start = time.perf_counter()
+    # A capped job's process is capped from its first instruction, not once attached
+    memory_limit = cancel.memory_limit if isinstance(cancel, control.JobControl) else None
+    process = subprocess.Popen(control.limited_command(command, memory_limit),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True, errors="replace", startupinfo=_startupinfo(),
+                               **control.popen_options())
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    stderr_thread = threading.Thread(target=_drain, args=(process.stderr, tail), daemon=True)
+    stderr_thread.start()
+    if isinstance(cancel, control.JobControl):
+        cancel.attach(process)
+    elif cancel is not None:
+        threading.Thread(target=_kill_when_cancelled, args=(process, cancel), daemon=True).start()
+    try:
+        parser = PageProgressParser(progress) if progress else None
+        for line in process.stdout:
+            line = line.rstrip("\r\n")
+            if parser:
+                parser.feed(line)
+            if not PAGE_LINE.match(line):
+                tail.append(line)
+        returncode, usage = _reap(process)
+        wall = time.perf_counter() - start
+    finally:
+        if isinstance(cancel, control.JobControl):
+            cancel.detach(process)
+    stderr_thread.join()
+    process.stdout.close()
+    process.stderr.close()
+    if cancel is not None and cancel.is_set():
+        raise CompressionCancelled()
+    if returncode != 0:
+        raise GhostscriptError(returncode, "\n".join(tail))
+    return dict(usage or {}, gs_time=wall)
+
+
+def compress_pdf(gs_path, input_path, output_path, quality_setting, progress=None, cancel=None, gs_args=()):
+    """Core PDF compression function using Ghostscript.
+
+    Returns the Ghostscript process's resource usage, if known, so it is
+    recorded on the batch ``FileResult``.
+    """
+    command = build_command(gs_path, input_path, output_path, quality_setting, gs_args)
+    return run_ghostscript(command, progress, cancel)
+
+
+def merge_usage(usages):
+    """Resource usage of a job that ran several Ghostscript processes:
+    total CPU and process time and the largest peak RSS of any one of them"""
+    usages = [u for u in usages if u]
+    if not usages:
+        return None
+    cpu = [u["cpu_time"] for u in usages if u.get("cpu_time") is not None]
+    rss = [u["peak_rss"] for u in usages if u.get("peak_rss") is not None]
+    merged = {"cpu_time": sum(cpu) if cpu else None, "peak_rss": max(rss) if rss else None}
+    for key in ("user_time", "sys_time", "gs_time"):
+        values = [u[key] for u in usages if u.get(key) is not None]
+        if values:
+            merged[key] = sum(values)
+    return merged
+
+
+@contextlib.contextmanager
+def open_engine(gs_path, engine="spawn", workers=None, **options):
+    """Yield a ``compress_func`` for the named engine, shutting it down afterwards"""
+    if engine == "spawn":
+        yield functools.partial(compress_pdf, gs_path, **options)
+    elif engine == "pool":
+        from .gspool import InterpreterPool
+        with InterpreterPool(gs_path, size=workers, **options) as pool:
+            yield pool.compress
+    elif engine == "direct":
+        from .direct import DirectCompressor
+        with DirectCompressor(functools.partial(compress_pdf, gs_path, **options), workers=workers,
+                              always=True) as direct:
+            yield direct.compress
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+
+def default_workers():
+    """Default concurrency: one Ghostscript process per CPU core"""
+    return os.cpu_count() or 1
+
+
+class ProgressTracker:
+    """Batch progress that counts partially compressed files by page.
+
+    Thread-safe; ``snapshot()`` returns (fraction done, ETA in seconds or
+    None while there is not enough data yet). While the number of files is
+    not known yet (``total_files`` None), both are None.
+    """
+
+    def __init__(self, total_files):
+        self.total_files = max(1, total_files) if total_files is not None else None
+        self.completed = 0
+        self.start = time.monotonic()
+        self._partial = {}
+        self._lock = threading.Lock()
+
+    def update(self, input_path, done, total):
+        with self._lock:
+            if total:
+                self._partial[input_path] = min(1.0, done / total)
+
+    def finish(self, input_path):
+        with self._lock:
+            self._partial.pop(input_path, None)
+            self.completed += 1
+
+    def snapshot(self):
+        if self.total_files is None:
+            return None, None
+        with self._lock:
+            fraction = (self.completed + sum(self._partial.values())) / self.total_files
+        elapsed = time.monotonic() - self.start
+        if fraction <= 0 or elapsed < 1:
+            return fraction, None
+        return fraction, elapsed * (1 - fraction) / fraction
+
+
+def format_duration(seconds):
+    """Format an ETA such as 1:05:09 or 4:12"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def unshare_output(output_path):
+    """Remove an existing output that is hardlinked elsewhere (e.g. into the
+    result cache) so Ghostscript never writes through a shared inode"""
+    try:
+        if os.stat(output_path).st_nlink > 1:
+            os.remove(output_path)
+    except OSError:
+        pass
+
+
+def fan_out(compress_func, input_path, quality_setting):
+    """How many Ghostscript processes ``compress_func`` may run at once on
+    one file. Layers that run several (auto mode, target-size mode,
+    splitting) define a ``fan_out`` method; anything else counts as one."""
+    owner = getattr(compress_func, "__self__", compress_func)
+    method = getattr(owner, "fan_out", None)
+    if method is None:
+        return 1
+    return max(1, method(input_path, quality_setting))
+
+
+def call_compress(compress_func, input_path, output_path, quality_setting, **options):
+    """Call a ``compress_func``, passing only the keyword options that are set"""
+    options = {k: v for k, v in options.items() if v is not None}
+    return compress_func(input_path, output_path, quality_setting, **options)
+
+
+def _run_job(compress_func, input_path, output_path, quality_setting, on_progress=None, batch_control=None,
+             memory_budget=None, duplicates=None, queued_at=None):
+    if queued_at is None:
+        queued_at = time.perf_counter()
+    result = FileResult(input_path, output_path, original_size=get_file_size(input_path))
+    job = batch_control.job(input_path) if batch_control is not None else None
+    if job is None and memory_budget is not None and memory_budget.process_limit:
+        # The per-process cap is applied through the job's control
+        job = control.JobControl()
+    cancelled = job is not None and not job.wait_while_paused()
+    if not cancelled and duplicates is not None and not duplicates.claim(result, job):
+        return result
+    need = 0
+    if memory_budget is not None:
+        # Auto mode, target-size mode and splitting run several processes per file
+        need = memory_budget.estimate(input_path, fan_out(compress_func, input_path, quality_setting))
+    if not cancelled and memory_budget is not None:
+        cancelled = not memory_budget.acquire(need, job)
+    if cancelled:
+        result.error = str(CompressionCancelled())
+        result.extra["cancelled"] = True
+        return result
+    if memory_budget is not None:
+        memory_budget.limit(job)
+    done = batch_control.start(job) if batch_control is not None else None
+    start = time.perf_counter()
+    # Time spent waiting for a worker, a pause or memory
+    result.extra["queue_wait"] = round(start - queued_at, 3)
+    try:
+        unshare_output(output_path)
+        progress = functools.partial(on_progress, input_path) if on_progress else None
+        extra = call_compress(compress_func, input_path, output_path, quality_setting,
+                              progress=progress, cancel=job)
+        if extra:
+            result.extra.update(extra)
+        result.compressed_size = get_file_size(output_path)
+    except CompressionCancelled as e:
+        # Never leave a half-written PDF behind
+        with contextlib.suppress(OSError):
+            os.remove(output_path)
+        if job is not None and job.timed_out:
+            result.error = f"Timed out after {batch_control.timeout:g}s"
+            result.extra["timed_out"] = True
+        else:
+            result.error = str(e)
+            result.extra["cancelled"] = True
+    except Exception as e:
+        result.error = str(e)
+        if isinstance(e, GhostscriptError):
+            result.extra["exit_status"] = e.returncode
+        if memory_budget is not None and memory_budget.process_limit and "VMerror" in result.error:
+            result.extra["memory_limited"] = True
+    finally:
+        if done is not None:
+            done.set()
+        if memory_budget is not None:
+            memory_budget.release(need)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _stream_jobs(submit, jobs, running, window, batch_control, counts):
+    """Futures of the jobs from an iterator in completion order, with at
+    most ``window`` submitted and not finished at a time"""
+    pending = iter(jobs)
+    submitted = 0
+    while True:
+        while pending is not None and len(running) < window:
+            job = None
+            if batch_control is None or not batch_control.cancelled:
+                job = next(pending, None)
+            if job is None:
+                pending = None
+                counts["total"] = submitted
+                break
+            # Queue wait counts from when the job was found
+            running.add(submit(job, time.perf_counter()))
+            submitted += 1
+        if not running:
+            return
+        done, _not_done = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            running.discard(future)
+            yield future
+
+
+def compress_batch(gs_path, jobs, quality_setting, max_workers=None, on_result=None,
+                   compress_func=None, on_progress=None, batch_control=None, memory_budget=None,
+                   duplicates=None):
+    """Compress (input_path, output_path) pairs on a bounded worker pool.
+
+    ``on_result(result, completed, total)`` is called from the calling
+    thread as each file finishes, in completion order. ``compress_func``
+    replaces the spawn-per-file engine; it is called as
+    ``compress_func(input_path, output_path, quality_setting)`` and may
+    return a dict of extra fields to record on the ``FileResult``.
+    ``on_progress(input_path, done_pages, total_pages)`` is called from
+    the worker threads while a file is being compressed; it is passed on
+    to ``compress_func`` as its ``progress`` keyword argument.
+    ``batch_control`` (a ``control.BatchControl``) cancels, pauses and
+    times out jobs; each job's control is passed as ``cancel``.
+    ``memory_budget`` (a ``memory.MemoryBudget``) holds jobs back while
+    the running ones are expected to use up the budget, and caps the
+    memory of every Ghostscript process. ``duplicates`` (a
+    ``dedupe.DuplicateFinder``) compresses identical inputs once and
+    copies the output to the other output paths.
+
+    ``jobs`` may also be an iterator, e.g. ``walk.iter_jobs`` over a
+    folder tree. Jobs are then pulled only as workers free up, so
+    compression starts while the iterator is still producing jobs and
+    only a few are queued at a time. ``total`` is None until the iterator
+    is exhausted, it is not read any further once the batch is cancelled,
+    and ``duplicates`` is not used, as it needs every input up front.
+    """
+    if compress_func is None:
+        compress_func = functools.partial(compress_pdf, gs_path)
+    batch = BatchResult()
+    streaming = not isinstance(jobs, (list, tuple))
+    if streaming:
+        workers = max(1, max_workers or default_workers())
+        duplicates = None
+    elif not jobs:
+        return batch
+    else:
+        workers = max(1, min(max_workers or default_workers(), len(jobs)))
+    counts = {"total": None if streaming else len(jobs)}
+
+    start = time.perf_counter()
+    if duplicates is not None:
+        duplicates.start(jobs)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit(job, queued_at):
+            input_path, output_path = job
+            return executor.submit(_run_job, compress_func, input_path, output_path, quality_setting,
+                                   on_progress, batch_control, memory_budget, duplicates, queued_at)
+
+        if streaming:
+            futures = set()
+            completed = _stream_jobs(submit, jobs, futures, workers * SUBMIT_AHEAD, batch_control, counts)
+        else:
+            futures = [submit(job, start) for job in jobs]
+            completed = as_completed(futures)
+        try:
+            for future in completed:
+                finished = [future.result()]
+                if duplicates is not None:
+                    finished = duplicates.finish(finished[0])
+                for result in finished:
+                    batch.results.append(result)
+                    if on_result:
+                        on_result(result, len(batch.results), counts["total"])
+        except BaseException:
+            # E.g. Ctrl+C: stop the running Ghostscript processes before the
+            # executor waits for its workers
+            if batch_control is not None:
+                batch_control.cancel()
+            for future in list(futures):
+                future.cancel()
+            raise
+        finally:
+            if duplicates is not None:
+                duplicates.stop()
+    batch.elapsed = time.perf_counter() - start
+    return batch
@@ -0,0 +1,192 @@
+"""Compress identical inputs of a batch only once.
+
+Batches often hold the same PDF under several names ("scan.pdf",
+"scan (1).pdf", ...). A ``DuplicateFinder`` hashes the inputs while the
+first files are already being compressed; only files that share their
+size with another input are hashed at all. The first file of each group of
+identical inputs is compressed as usual. The others wait, without holding
+a worker, and their outputs are made from the original's output: a
+reflink copy where the filesystem supports it, else a hardlink, else a
+plain copy.
+"""
+import contextlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from . import core
+from .cache import file_sha256
+from .presets import select_rule
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Linux ioctl that makes a file share another file's extents copy-on-write (Btrfs, XFS)
+FICLONE = 0x40049409
+
+
+def _reflink(source, destination):
+    if fcntl is None:
+        raise OSError("reflinks are not supported here")
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def clone_file(source, destination):
+    """Make ``destination`` a copy of ``source`` as cheaply as possible.
+
+    Returns how: "reflink", "hardlink" or "copy".
+    """
+    directory = os.path.dirname(os.path.abspath(destination))
+    fd, tmp_path = tempfile.mkstemp(prefix=".pdfc-", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        try:
+            _reflink(source, tmp_path)
+            method = "reflink"
+        except OSError:
+            os.remove(tmp_path)
+            try:
+                os.link(source, tmp_path)
+                method = "hardlink"
+            except OSError:
+                shutil.copyfile(source, tmp_path)
+                method = "copy"
+        os.replace(tmp_path, destination)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    return method
+
+
+class _Group:
+    """Jobs with the same input bytes and settings"""
+
+    def __init__(self, original):
+        self.original = original
+        self.finished = False
+        self.waiting = []
+
+
+class DuplicateFinder:
+    """Batch planner that runs each distinct input once.
+
+    ``rules`` are the batch's ``presets.load_rules`` rules: identical
+    inputs that the rules give different presets (e.g. by file name) are
+    compressed separately.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = list(rules or [])
+        self._lock = threading.Lock()
+        self._path_locks = {}
+        self._digests = {}
+        self._candidates = set()
+        self._groups = {}
+        self._group_of = {}
+        self._deferred = set()
+        self._stopped = threading.Event()
+
+    def start(self, jobs):
+        """Hash the inputs that might be duplicates in the background"""
+        sizes = {}
+        for input_path, _output_path in jobs:
+            with contextlib.suppress(OSError):
+                sizes[input_path] = os.path.getsize(input_path)
+        counts = Counter(sizes.values())
+        ordered = list(dict.fromkeys(path for path, _output in jobs if counts[sizes.get(path)] > 1))
+        self._candidates = set(ordered)
+        if ordered:
+            threading.Thread(target=self._hash_all, args=(ordered,), daemon=True,
+                             name="pdfc-dedupe").start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _hash_all(self, paths):
+        for path in paths:
+            if self._stopped.is_set():
+                return
+            self._digest(path)
+
+    def _digest(self, path):
+        """SHA-256 of ``path``, computed once whichever thread asks first"""
+        with self._lock:
+            path_lock = self._path_locks.setdefault(path, threading.Lock())
+        with path_lock:
+            if path not in self._digests:
+                try:
+                    self._digests[path] = file_sha256(path)
+                except OSError:
+                    # The job itself reports the unreadable file
+                    self._digests[path] = None
+            return self._digests[path]
+
+    def claim(self, result, job=None):
+        """Called when a job is about to start.
+
+        Returns True when ``result``'s file has to be compressed. Otherwise
+        it is a duplicate: ``result`` is either filled in from the finished
+        original right away, or held back until ``finish`` sees the original.
+        """
+        if result.input_path not in self._candidates:
+            return True
+        digest = self._digest(result.input_path)
+        if digest is None:
+            return True
+        rule = select_rule(self.rules, result.input_path)
+        key = (digest, rule["preset"] if rule else None)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = _Group(result)
+                self._group_of[id(result)] = group
+                return True
+            if not group.finished:
+                group.waiting.append((result, job))
+                self._deferred.add(id(result))
+                return False
+        self._copy(group.original, result, job)
+        return False
+
+    def finish(self, result):
+        """Results to report now that ``result``'s job has returned"""
+        with self._lock:
+            if id(result) in self._deferred:
+                # Reported together with its original
+                return []
+            group = self._group_of.pop(id(result), None)
+            if group is None:
+                return [result]
+            group.finished = True
+            waiting, group.waiting = group.waiting, []
+        for copy, job in waiting:
+            self._copy(result, copy, job)
+        return [result] + [copy for copy, _job in waiting]
+
+    def _copy(self, original, result, job):
+        start = time.perf_counter()
+        result.extra["duplicate_of"] = original.input_path
+        if job is not None and job.is_set():
+            result.error = str(core.CompressionCancelled())
+            result.extra["cancelled"] = True
+        elif not original.ok:
+            result.error = original.error
+            for flag in ("cancelled", "timed_out", "memory_limited"):
+                if original.extra.get(flag):
+                    result.extra[flag] = True
+        else:
+            try:
+                if os.path.abspath(result.output_path) != os.path.abspath(original.output_path):
+                    result.extra["link"] = clone_file(original.output_path, result.output_path)
+                result.compressed_size = original.compressed_size
+                result.extra["time_saved"] = round(original.elapsed, 3)
+            except OSError as e:
+                result.error = f"Could not copy the output of {os.path.basename(original.input_path)}: {e}"
+        result.elapsed = time.perf_counter() - start
@@ -0,0 +1,499 @@
+"""Direct image recompression: shrink scans without a Ghostscript re-render.
+
+In a scanned document almost every byte is image data, yet ``pdfwrite``
+re-interprets and rewrites the whole file. This engine parses the PDF
+with ``pdfparse`` and copies every object byte for byte except the image
+XObjects, which are recompressed independently and in parallel:
+
+* colour and grey images are downsampled to the preset's resolution and
+  re-encoded as JPEG at its quality (needs Pillow), or with Flate;
+* bilevel images are re-encoded as CCITT Group 4 where Pillow has
+  libtiff, otherwise with Flate;
+* identical images are stored once.
+
+A recompressed image is only used when it is smaller than the original.
+Resolution is estimated from the largest page an image is drawn on,
+assuming it covers at most the whole page, so no image ends up below the
+target resolution. Files this engine cannot rewrite (encrypted or
+unreadable files, or files without images) go to the Ghostscript
+fallback.
+"""
+import hashlib
+import io
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import control
+from . import core
+from .pdfparse import DECODERS, PdfDocument, PdfError, PdfName, PdfRef, PdfStream, serialize
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+# Ghostscript ignores -d names it does not know, so presets can carry this
+# to pick the engine and it still works when a file falls back
+ENGINE_FLAG = "-dPDFCImageEngine=direct"
+
+# Image defaults of each -dPDFSETTINGS, as Ghostscript documents them:
+# (downsample, resolution) per image kind, downsample type, and the JPEG
+# quality matching its QFactor
+PDFSETTINGS_IMAGES = {
+    "/screen": ({"Color": (True, 72), "Gray": (True, 72), "Mono": (True, 300)}, "/Average", 62),
+    "/ebook": ({"Color": (True, 150), "Gray": (True, 150), "Mono": (True, 300)}, "/Bicubic", 62),
+    "/printer": ({"Color": (False, 300), "Gray": (False, 300), "Mono": (False, 1200)}, "/Bicubic", 80),
+    "/prepress": ({"Color": (False, 300), "Gray": (False, 300), "Mono": (False, 1200)}, "/Bicubic", 92),
+    "/default": ({"Color": (False, 72), "Gray": (False, 72), "Mono": (False, 300)}, "/Subsample", 80),
+}
+DEFAULT_THRESHOLD = 1.5
+IMAGE_KINDS = ("Color", "Gray", "Mono")
+COMPONENTS = {"DeviceGray": 1, "G": 1, "DeviceRGB": 3, "RGB": 3, "DeviceCMYK": 4, "CMYK": 4}
+# An image stored losslessly only becomes a JPEG when that at least halves it
+LOSSY_GAIN = 0.5
+FLATE_LEVEL = 9
+
+if Image is not None:
+    _resampling = getattr(Image, "Resampling", Image)
+    RESAMPLING = {"/Bicubic": _resampling.BICUBIC, "/Average": _resampling.BOX,
+                  "/Subsample": _resampling.NEAREST}
+    CAN_CCITT = features.check("libtiff")
+else:
+    RESAMPLING = {}
+    CAN_CCITT = False
+
+
+class DirectUnsupported(Exception):
+    """Raised for files the direct engine leaves to Ghostscript"""
+
+
+def uses_direct(quality_setting):
+    return isinstance(quality_setting, list) and ENGINE_FLAG in quality_setting
+
+
+def without_flag(quality_setting):
+    if not uses_direct(quality_setting):
+        return quality_setting
+    return [arg for arg in quality_setting if arg != ENGINE_FLAG]
+
+
+def jpeg_quality(qfactor):
+    """IJG-style quality (1-95) for a pdfwrite QFactor, the inverse of ``presets.jpeg_qfactor``"""
+    scale = qfactor * 100
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return int(max(1, min(95, round(quality))))
+
+
+def image_settings(quality_setting):
+    """What a quality setting asks of images.
+
+    Returns ({kind: {"downsample", "dpi", "threshold", "type"}}, JPEG
+    quality), from the ``-dPDFSETTINGS`` defaults and any image
+    arguments the setting overrides them with.
+    """
+    arguments = [] if isinstance(quality_setting, str) else list(quality_setting)
+    base = quality_setting if isinstance(quality_setting, str) else "/default"
+    for arg in arguments:
+        if arg.startswith("-dPDFSETTINGS="):
+            base = arg.split("=", 1)[1]
+    defaults, downsample_type, quality = PDFSETTINGS_IMAGES.get(base, PDFSETTINGS_IMAGES["/default"])
+    settings = {kind: {"downsample": downsample, "dpi": dpi, "threshold": DEFAULT_THRESHOLD,
+                       "type": downsample_type}
+                for kind, (downsample, dpi) in defaults.items()}
+    for arg in arguments:
+        name, _, value = arg.partition("=")
+        for kind in IMAGE_KINDS:
+            try:
+                if name == f"-dDownsample{kind}Images":
+                    settings[kind]["downsample"] = value == "true"
+                elif name == f"-d{kind}ImageResolution":
+                    settings[kind]["dpi"] = float(value)
+                elif name == f"-d{kind}ImageDownsampleThreshold":
+                    settings[kind]["threshold"] = float(value)
+                elif name == f"-d{kind}ImageDownsampleType":
+                    settings[kind]["type"] = value
+            except ValueError:
+                continue
+    match = re.search(r"/QFactor\s+([0-9.]+)", " ".join(arguments))
+    if match:
+        quality = jpeg_quality(float(match.group(1)))
+    return settings, quality
+
+
+# --- Finding images ---
+
+def _components(doc, colorspace):
+    colorspace = doc.resolve(colorspace)
+    if isinstance(colorspace, PdfName):
+        return COMPONENTS.get(colorspace)
+    if isinstance(colorspace, list) and colorspace and doc.resolve(colorspace[0]) == "ICCBased":
+        profile = doc.resolve(colorspace[1]) if len(colorspace) > 1 else None
+        if isinstance(profile, PdfStream):
+            components = doc.resolve(profile.get("N"))
+            return components if components in (1, 3, 4) else None
+    # Indexed, Separation, DeviceN, Lab...: samples are not plain intensities
+    return None
+
+
+def _image_info(doc, num, stream, inches):
+    """Everything a worker needs about one image, resolved up front"""
+    d = stream.dict
+    filters = [(doc.resolve(name), doc.resolve(params) or {}) for name, params in stream.filters()]
+    components = _components(doc, d.get("ColorSpace"))
+    bpc = doc.resolve(d.get("BitsPerComponent"))
+    kind = None
+    # Stencil masks and colour-key masking depend on exact sample values
+    masked = doc.resolve(d.get("ImageMask")) is True or isinstance(doc.resolve(d.get("Mask")), list)
+    if masked:
+        components = None
+    elif components == 1 and bpc == 1:
+        kind = "Mono"
+    elif components in (1, 3, 4) and bpc == 8:
+        kind = "Gray" if components == 1 else "Color"
+    smask = doc.resolve(d.get("SMask"))
+    if isinstance(smask, PdfStream) and "Matte" in smask.dict:
+        # A pre-multiplied soft mask must keep its image's size
+        inches = None
+    return {
+        "num": num,
+        "width": doc.resolve(d.get("Width")),
+        "height": doc.resolve(d.get("Height")),
+        "bpc": bpc,
+        "components": components,
+        "kind": kind,
+        "filters": filters,
+        "inches": inches,
+    }
+
+
+def find_images(doc):
+    """{object number: (generation, image stream, largest page side in inches or None)}"""
+    images = {}
+    for num in doc.object_numbers():
+        kind, _offset, generation = doc.xref[num]
+        if kind != 1:
+            # Objects in object streams are never streams
+            continue
+        obj = doc.get(PdfRef(num, generation))
+        if isinstance(obj, PdfStream) and doc.resolve(obj.get("Subtype")) == "Image":
+            images[num] = [generation, obj, None]
+    for _ref, page in doc.pages():
+        box = doc.resolve(page.get("MediaBox")) or [0, 0, 612, 792]
+        box = [doc.resolve(v) for v in box]
+        unit = doc.resolve(page.get("UserUnit")) or 1
+        inches = max(abs(box[2] - box[0]), abs(box[3] - box[1])) * unit / 72
+        stack = [doc.resolve(page.get("Resources"))]
+        visited = set()
+        while stack:
+            resources = stack.pop()
+            xobjects = doc.resolve(resources.get("XObject")) if isinstance(resources, dict) else None
+            if not isinstance(xobjects, dict):
+                continue
+            for ref in xobjects.values():
+                if not isinstance(ref, PdfRef) or ref in visited:
+                    continue
+                visited.add(ref)
+                if ref.num in images:
+                    images[ref.num][2] = max(images[ref.num][2] or 0, inches)
+                    continue
+                form = doc.get(ref)
+                if isinstance(form, PdfStream) and doc.resolve(form.get("Subtype")) == "Form":
+                    stack.append(doc.resolve(form.get("Resources")))
+    return images
+
+
+# --- Recompressing one image ---
+
+def _decode(info, raw):
+    """("samples", data) or ("jpeg", data), or None when the data cannot be decoded here"""
+    data = bytes(raw)
+    filters = info["filters"]
+    last = filters[-1][0] if filters else None
+    if last == "DCTDecode":
+        filters = filters[:-1]
+    for name, params in filters:
+        if name not in DECODERS or (isinstance(params, dict) and params.get("Predictor", 1) == 2):
+            return None
+        data = DECODERS[name](data, params)
+    if last == "DCTDecode":
+        return "jpeg", data
+    expected = (info["width"] * info["components"] * info["bpc"] + 7) // 8 * info["height"]
+    if len(data) < expected:
+        return None
+    return "samples", data[:expected]
+
+
+def target_size(info, settings):
+    """(width, height) after downsampling to the kind's resolution"""
+    width, height = info["width"], info["height"]
+    kind = settings.get(info["kind"])
+    if not info["inches"] or not kind or not kind["downsample"]:
+        return width, height
+    dpi = max(width, height) / info["inches"]
+    if dpi <= kind["dpi"] * kind["threshold"]:
+        return width, height
+    scale = kind["dpi"] / dpi
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def subsample(data, width, height, components, factor):
+    """Keep every ``factor``-th pixel of every ``factor``-th row (no Pillow needed)"""
+    new_width, new_height = width // factor, height // factor
+    row_bytes = width * components
+    out_row = new_width * components
+    out = bytearray(out_row * new_height)
+    view = memoryview(data)
+    for y in range(new_height):
+        row = view[y * factor * row_bytes:(y * factor + 1) * row_bytes]
+        for c in range(components):
+            out[y * out_row + c:(y + 1) * out_row:components] = row[c::factor * components][:new_width]
+    return bytes(out), new_width, new_height
+
+
+def _flate(data, width, height):
+    return {"Filter": PdfName("FlateDecode"), "Width": width, "Height": height}, zlib.compress(data, FLATE_LEVEL)
+
+
+def _continuous_tone(info, form, data, settings, quality):
+    width, height = target_size(info, settings)
+    components = info["components"]
+    if Image is None:
+        if form != "samples":
+            return []
+        factor = info["width"] // width
+        if factor > 1:
+            data, width, height = subsample(data, info["width"], info["height"], components, factor)
+        return [_flate(data, width, height)]
+    mode = {1: "L", 3: "RGB", 4: "CMYK"}[components]
+    if form == "jpeg":
+        if components == 4:
+            # Adobe CMYK JPEGs are stored inverted; leave them alone
+            return []
+        image = Image.open(io.BytesIO(data))
+        if image.mode != mode:
+            return []
+        image.load()
+    else:
+        image = Image.frombytes(mode, (info["width"], info["height"]), data)
+    if (width, height) != image.size:
+        image = image.resize((width, height), RESAMPLING.get(settings[info["kind"]]["type"],
+                                                             RESAMPLING["/Bicubic"]))
+    candidates = []
+    if form == "samples" or image.size != (info["width"], info["height"]):
+        candidates.append(_flate(image.tobytes(), width, height))
+    if components in (1, 3):
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=quality, optimize=True)
+        jpeg = buffer.getvalue()
+        if form == "jpeg" or len(jpeg) <= LOSSY_GAIN * len(candidates[0][1]):
+            candidates.append(({"Filter": PdfName("DCTDecode"), "Width": width, "Height": height}, jpeg))
+    return candidates
+
+
+def _group4(data, width, height):
+    """CCITT Group 4 data for 1-bit samples, through Pillow's libtiff"""
+    # Inverted, so the samples' 0 bits are fax black runs (BlackIs1 false)
+    inverted = bytes(b ^ 0xFF for b in data)
+    image = Image.frombytes("1", (width, height), inverted)
+    buffer = io.BytesIO()
+    image.save(buffer, "TIFF", compression="group4", tiffinfo={278: height})
+    buffer.seek(0)
+    tiff = Image.open(buffer)
+    offsets, counts = tiff.tag_v2.get(273), tiff.tag_v2.get(279)
+    if not offsets or len(offsets) != 1:
+        return None
+    encoded = buffer.getvalue()[offsets[0]:offsets[0] + counts[0]]
+    params = {"K": -1, "Columns": width, "Rows": height, "BlackIs1": False}
+    return {"Filter": PdfName("CCITTFaxDecode"), "DecodeParms": params, "Width": width, "Height": height}, encoded
+
+
+def recompress(info, raw, settings, quality):
+    """(dictionary entries, data) for a smaller version of the image, or None"""
+    decoded = _decode(info, raw) if info["width"] and info["height"] and info["components"] else None
+    if decoded is None:
+        return None
+    form, data = decoded
+    candidates = []
+    if info["kind"] in ("Color", "Gray"):
+        candidates = _continuous_tone(info, form, data, settings, quality)
+    elif info["kind"] == "Mono" and form == "samples":
+        candidates = [_flate(data, info["width"], info["height"])]
+        if CAN_CCITT:
+            group4 = _group4(data, info["width"], info["height"])
+            if group4 is not None:
+                candidates.append(group4)
+    elif form == "samples":
+        candidates = [_flate(data, info["width"], info["height"])]
+    if not candidates:
+        return None
+    best = min(candidates, key=lambda candidate: len(candidate[1]))
+    return best if len(best[1]) < len(raw) else None
+
+
+# --- Writing ---
+
+def _remap(obj, remap):
+    if isinstance(obj, PdfRef):
+        return remap.get(obj.num, obj)
+    if isinstance(obj, dict):
+        return {key: _remap(value, remap) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_remap(value, remap) for value in obj]
+    return obj
+
+
+def write_document(doc, output_path, replaced, remap):
+    """Copy ``doc`` to ``output_path`` with images replaced and duplicates merged.
+
+    ``replaced`` maps object numbers to (dictionary entries, data);
+    ``remap`` maps duplicate object numbers to the reference kept.
+    Object and xref streams are not copied: their objects are written
+    out one by one and a classic xref table is written at the end.
+    """
+    offsets = {}
+    with open(output_path, 'wb') as f:
+        f.write(f"%PDF-{doc.version or '1.4'}\n".encode() + b"%\xe2\xe3\xcf\xd3\n")
+        for num in doc.object_numbers():
+            if num in remap:
+                continue
+            kind, _offset, generation = doc.xref[num]
+            if kind == 2:
+                generation = 0
+            obj = doc.get(PdfRef(num, generation))
+            if isinstance(obj, PdfStream) and doc.resolve(obj.get("Type")) in ("ObjStm", "XRef"):
+                continue
+            if isinstance(obj, dict) and "Linearized" in obj:
+                # The hint tables would no longer match
+                continue
+            offsets[num] = (f.tell(), generation)
+            f.write(f"{num} {generation} obj\n".encode())
+            if isinstance(obj, PdfStream):
+                dictionary = _remap(obj.dict, remap)
+                data = obj.raw
+                if num in replaced:
+                    entries, data = replaced[num]
+                    for key in ("Filter", "DecodeParms", "DL"):
+                        dictionary.pop(key, None)
+                    dictionary.update(entries)
+                dictionary["Length"] = len(data)
+                f.write(serialize(dictionary) + b"\nstream\n")
+                f.write(data)
+                f.write(b"\nendstream\nendobj\n")
+            else:
+                f.write(serialize(_remap(obj, remap)) + b"\nendobj\n")
+        size = max(offsets, default=0) + 1
+        xref_offset = f.tell()
+        lines = [f"xref\n0 {size}\n".encode(), b"0000000000 65535 f \n"]
+        for num in range(1, size):
+            if num in offsets:
+                offset, generation = offsets[num]
+                lines.append(f"{offset:010d} {generation:05d} n \n".encode())
+            else:
+                lines.append(b"0000000000 00000 f \n")
+        f.write(b"".join(lines))
+        trailer = {"Size": size}
+        for key in ("Root", "Info", "ID"):
+            if key in doc.trailer:
+                trailer[key] = _remap(doc.trailer[key], remap)
+        f.write(b"trailer\n" + serialize(trailer) + f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+
+class DirectCompressor:
+    """``compress_func`` that recompresses the images of a PDF in place.
+
+    With ``always`` every file goes through this engine; otherwise only
+    quality settings carrying ``ENGINE_FLAG`` do, and everything else is
+    passed to ``fallback`` unchanged. Files the engine cannot rewrite go
+    to ``fallback`` too.
+    """
+
+    def __init__(self, fallback, workers=None, always=False):
+        self.fallback = fallback
+        self.workers = max(1, workers or core.default_workers())
+        self.always = always
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def compress(self, input_path, output_path, quality_setting, progress=None, cancel=None):
+        if not (self.always or uses_direct(quality_setting)):
+            return core.call_compress(self.fallback, input_path, output_path, quality_setting,
+                                      progress=progress, cancel=cancel)
+        try:
+            return self.rewrite(input_path, output_path, quality_setting, progress, cancel)
+        except (DirectUnsupported, PdfError, ValueError, KeyError, TypeError, IndexError) as e:
+            extra = core.call_compress(self.fallback, input_path, output_path, without_flag(quality_setting),
+                                       progress=progress, cancel=cancel)
+            return dict(extra or {}, direct=f"fallback: {e}")
+
+    def fan_out(self, input_path, quality_setting):
+        # Files this engine rewrites itself run no Ghostscript, but may fall back
+        return core.fan_out(self.fallback, input_path, without_flag(quality_setting))
+
+    def rewrite(self, input_path, output_path, quality_setting, progress=None, cancel=None):
+        settings, quality = image_settings(without_flag(quality_setting))
+        with PdfDocument(input_path) as doc:
+            if doc.encrypted:
+                raise DirectUnsupported("encrypted")
+            page_count = doc.page_count
+            images = find_images(doc)
+            if not images:
+                raise DirectUnsupported("no images")
+            # Identical images (same dictionary and data) are kept once
+            remap = {}
+            unique = {}
+            for num, (generation, stream, inches) in images.items():
+                digest = hashlib.sha256(serialize({k: stream.dict[k] for k in sorted(stream.dict) if k != "Length"}))
+                digest.update(stream.raw)
+                key = digest.digest()
+                if key in unique:
+                    remap[num] = PdfRef(unique[key], images[unique[key]][0])
+                    other = images[unique[key]]
+                    other[2] = max(other[2] or 0, inches or 0) or None
+                else:
+                    unique[key] = num
+            futures = {}
+            for num in unique.values():
+                generation, stream, inches = images[num]
+                info = _image_info(doc, num, stream, inches)
+                futures[self._executor.submit(_recompress_safely, info, stream, settings, quality)] = num
+            replaced = {}
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    if cancel is not None and cancel.is_set():
+                        raise core.CompressionCancelled()
+                    if isinstance(cancel, control.JobControl):
+                        cancel.wait_while_paused()
+                    result = future.result()
+                    if result is not None:
+                        replaced[futures[future]] = result
+                    if progress:
+                        progress(done, len(futures))
+            finally:
+                for future in futures:
+                    future.cancel()
+            if cancel is not None and cancel.is_set():
+                raise core.CompressionCancelled()
+            if not replaced and not remap:
+                raise DirectUnsupported("no image could be made smaller")
+            write_document(doc, output_path, replaced, remap)
+        with PdfDocument(output_path) as written:
+            if written.page_count != page_count:
+                raise DirectUnsupported(f"rewritten file has {written.page_count} of {page_count} pages")
+        return {"direct_images": len(replaced), "deduplicated": len(remap)}
+
+
+def _recompress_safely(info, stream, settings, quality):
+    # A broken or unusual image is kept as it is rather than failing the file
+    try:
+        return recompress(info, stream.raw, settings, quality)
+    except (OSError, ValueError, zlib.error, PdfError, KeyError, TypeError, MemoryError):
+        return None
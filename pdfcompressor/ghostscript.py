@@ -0,0 +1,251 @@
+"""Finding Ghostscript and what it can do.
+
+``find_ghostscript`` looks, in order, at an explicit path, the
+``PDFC_GHOSTSCRIPT`` environment variable, ``"ghostscript_path"`` in the
+GUI's settings, a binary bundled with the application, ``PATH`` (``gs``,
+``gsc``, ``gswin64c``, ...) and the usual install folders. ``probe``
+asks a binary for its version and output devices once; the answer is
+kept in a per-user file keyed by the binary's real path, size and mtime,
+so later launches skip the probe and an upgraded binary is probed again.
+``tuned_args`` turns the capabilities
+into extra arguments that make Ghostscript faster without changing its
+output.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from dataclasses import asdict, dataclass, field
+
+from . import core
+from .cache import default_cache_dir
+
+ENV_VAR = "PDFC_GHOSTSCRIPT"
+SETTINGS_KEY = "ghostscript_path"
+PROBE_TIMEOUT = 30
+
+if os.name == 'nt':
+    NAMES = ("gswin64c.exe", "gswin32c.exe", "gs.exe")
+    INSTALL_GLOBS = (r"C:\Program Files\gs\gs*\bin\gswin64c.exe",
+                     r"C:\Program Files (x86)\gs\gs*\bin\gswin32c.exe")
+else:
+    # gsc is what some distributions call the command-line binary
+    NAMES = ("gs", "gsc")
+    # Not always on PATH, e.g. for an app started from the macOS Finder
+    INSTALL_GLOBS = ("/opt/homebrew/bin/gs", "/usr/local/bin/gs", "/opt/local/bin/gs", "/usr/bin/gs")
+
+# Oldest Ghostscript that renders bands in several threads
+THREADS_VERSION = (8, 64)
+
+_lock = threading.Lock()
+# Successful probes of this session, by (gs_path, probe_path)
+_probed = {}
+
+
+def default_probe_path():
+    """Per-user file the probe results are kept in"""
+    return os.path.join(default_cache_dir(), "ghostscript.json")
+
+
+def find_ghostscript(explicit=None, settings=None):
+    """Path of the Ghostscript to use, or None when there is none.
+
+    ``settings`` is the GUI's settings dict. An explicit path, the
+    environment variable or the setting is used as given, even when it
+    does not exist, so a typo shows up as an error instead of silently
+    picking another Ghostscript.
+    """
+    for configured in (explicit, os.environ.get(ENV_VAR), (settings or {}).get(SETTINGS_KEY)):
+        if configured:
+            return shutil.which(configured) or configured
+    bundled = core.get_ghostscript_path()
+    if bundled:
+        return bundled
+    for name in NAMES:
+        found = shutil.which(name)
+        if found:
+            return found
+    for pattern in INSTALL_GLOBS:
+        # The newest installed version sorts last
+        matches = sorted(glob.glob(pattern), key=_version_in_path)
+        if matches and os.access(matches[-1], os.X_OK):
+            return matches[-1]
+    return None
+
+
+def _version_in_path(path):
+    return tuple(int(n) for n in re.findall(r"\d+", path))
+
+
+def parse_version(text):
+    """(major, minor, patch) from ``gs --version`` output, or None"""
+    match = re.search(r"(\d+)\.(\d+)(?:\.(\d+))?", text or "")
+    if not match:
+        return None
+    return tuple(int(part or 0) for part in match.groups())
+
+
+def parse_devices(help_text):
+    """Output devices listed by ``gs -h``"""
+    match = re.search(r"Available devices:\s*\n(.*?)(?:\n\S|\Z)", help_text or "", re.S)
+    return sorted(set(match.group(1).split())) if match else []
+
+
+@dataclass
+class GhostscriptInfo:
+    """What a Ghostscript binary reported about itself"""
+    path: str
+    version: str = None
+    devices: list = field(default_factory=list)
+
+    @property
+    def version_tuple(self):
+        return parse_version(self.version)
+
+    def at_least(self, version):
+        own = self.version_tuple
+        return own is not None and own >= tuple(version)
+
+    @property
+    def has_pdfwrite(self):
+        """False only when the device list was read and pdfwrite is not in it"""
+        return not self.devices or "pdfwrite" in self.devices
+
+
+def _run(gs_path, *args):
+    try:
+        process = subprocess.run([gs_path, *args], capture_output=True, text=True, errors="replace",
+                                 timeout=PROBE_TIMEOUT, startupinfo=core._startupinfo())
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return process.stdout
+
+
+def _probe_now(gs_path):
+    version = _run(gs_path, "--version")
+    help_text = _run(gs_path, "-h") if version else None
+    return GhostscriptInfo(gs_path, version.strip() if version and version.strip() else None,
+                           parse_devices(help_text))
+
+
+def _signature(gs_path):
+    real = os.path.realpath(shutil.which(gs_path) or gs_path)
+    stat = os.stat(real)
+    return real, [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_probes(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_probes(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".ghostscript-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def probe(gs_path, probe_path=None):
+    """``GhostscriptInfo`` for ``gs_path``, probed once per binary version"""
+    probe_path = probe_path or default_probe_path()
+    with _lock:
+        info = _probed.get((gs_path, probe_path))
+    if info is not None:
+        return info
+    try:
+        real, signature = _signature(gs_path)
+    except OSError:
+        return _probe_now(gs_path)
+    with _lock:
+        probes = _read_probes(probe_path)
+        known = probes.get(real)
+        if isinstance(known, dict) and known.get("signature") == signature:
+            info = GhostscriptInfo(gs_path, known.get("version"), known.get("devices") or [])
+            _probed[(gs_path, probe_path)] = info
+            return info
+    info = _probe_now(gs_path)
+    if info.version is None:
+        # Not cached: it may work once it is set up properly
+        return info
+    with _lock:
+        _probed[(gs_path, probe_path)] = info
+        probes = _read_probes(probe_path)
+        probes[real] = dict(asdict(info), path=real, signature=signature)
+        try:
+            _write_probes(probe_path, probes)
+        except OSError:
+            pass
+    return info
+
+
+def rendering_threads(workers=None):
+    """Threads each Ghostscript process can use while ``workers`` run at once"""
+    cpus = os.cpu_count() or 1
+    return max(1, cpus // max(1, workers or core.default_workers()))
+
+
+def tuned_args(gs_path, workers=None, memory_budget=None):
+    """Arguments that speed Ghostscript up without changing its output.
+
+    Multi-threaded band rendering is enabled when there are CPUs to spare
+    per process and no per-process memory cap, as every thread needs its
+    own band buffer.
+    """
+    info = probe(gs_path)
+    args = []
+    threads = rendering_threads(workers)
+    capped = memory_budget is not None and memory_budget.process_limit
+    if threads > 1 and not capped and info.at_least(THREADS_VERSION):
+        args.append(f"-dNumRenderingThreads={threads}")
+    return args
+
+
+def describe(info):
+    """One line about a probed Ghostscript, for logs and the GUI"""
+    devices = f", {len(info.devices)} devices" if info.devices else ""
+    return f"Ghostscript {info.version or 'unknown version'} ({info.path}{devices})"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pdfcompressor.ghostscript",
+        description="Show which Ghostscript would be used and what it supports.")
+    parser.add_argument("--gs", help="path to the Ghostscript executable")
+    parser.add_argument("-j", "--jobs", type=int, default=core.default_workers(),
+                        help="parallel Ghostscript processes the extra arguments are tuned for")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    gs_path = find_ghostscript(args.gs)
+    if not gs_path:
+        print(f"error: Ghostscript not found (use --gs or set {ENV_VAR})", file=sys.stderr)
+        return 1
+    info = probe(gs_path)
+    print(describe(info))
+    print("pdfwrite: " + ("yes" if info.has_pdfwrite else "no"))
+    print("extra arguments: " + (" ".join(tuned_args(gs_path, args.jobs)) or "none"))
+    return 0 if info.version else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
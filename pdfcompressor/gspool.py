@@ -0,0 +1,346 @@
+"""Pool of long-lived Ghostscript interpreters.
+
+Starting Ghostscript and initialising its fonts and resources costs more
+than compressing a short letter. An interpreter in this pool stays alive
+and reads PostScript jobs from stdin. Each job switches the pdfwrite
+``OutputFile``, which finalises the previous document and starts a new
+one, runs the input PDF and then prints a sentinel line so the caller
+knows the job is done. Idle interpreters are kept per quality setting,
+so auto mode and preset rules, which alternate settings, still reuse
+them; once more than ``max_idle`` (default: the pool size) are idle, the
+least recently used one is closed. Workers are recycled after
+``max_jobs`` jobs, on any error, and when a job needs other file
+permissions.
+"""
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from . import control
+from . import core
+from .schedule import setting_key
+
+SENTINEL = "%%PDFC-DONE"
+READY = "%%PDFC-READY"
+DEFAULT_MAX_JOBS = 50
+STARTUP_TIMEOUT = 30
+
+
+def ps_string(value):
+    """Encode ``value`` as a PostScript string literal"""
+    out = []
+    for byte in os.fsencode(value):
+        ch = chr(byte)
+        if ch in "()\\":
+            out.append("\\" + ch)
+        elif 32 <= byte < 127:
+            out.append(ch)
+        else:
+            out.append(f"\\{byte:03o}")
+    return "(" + "".join(out) + ")"
+
+
+def _proc_usage(pid):
+    """(user CPU seconds, system CPU seconds, peak RSS bytes) of a live process, from Linux /proc"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the command name, which may itself contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        user_time, sys_time = int(fields[11]) / ticks, int(fields[12]) / ticks
+        peak_rss = None
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak_rss = int(line.split()[1]) * 1024
+                    break
+        return user_time, sys_time, peak_rss
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _reset_peak_rss(pid):
+    """Restart the peak RSS count, so it covers the next job only"""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _directory(path):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), "")
+
+
+class GhostscriptInterpreter:
+    """One persistent Ghostscript process running the pdfwrite device"""
+
+    def __init__(self, gs_path, quality_setting, read_dirs=(), write_dirs=(), scratch_dir=None, gs_args=()):
+        self.gs_path = gs_path
+        self.quality_setting = quality_setting
+        self.gs_args = tuple(gs_args)
+        self.read_dirs = frozenset(read_dirs)
+        self.write_dirs = frozenset(write_dirs)
+        self.scratch_dir = scratch_dir or tempfile.gettempdir()
+        self.scratch_path = os.path.join(self.scratch_dir, f"pdfc-{uuid.uuid4().hex}.pdf")
+        self.jobs_done = 0
+        self.process = None
+        self._lines = queue.Queue()
+        self._job_id = 0
+
+    def _command(self):
+        # Same arguments as the spawn-per-file command, minus -dBATCH and the
+        # input file: "-" makes Ghostscript read the job loop from stdin
+        command = core.build_command(self.gs_path, "-", self.scratch_path, self.quality_setting, self.gs_args)
+        command.remove("-dBATCH")
+        # Not quiet, so the per-page messages can drive progress reporting
+        command.remove("-dQUIET")
+        permits = [f"--permit-file-read={d}" for d in sorted(self.read_dirs)]
+        permits += [f"--permit-file-write={d}" for d in sorted(self.write_dirs | {_directory(self.scratch_path)})]
+        return command[:1] + permits + command[1:]
+
+    def _read_output(self):
+        for line in self.process.stdout:
+            self._lines.put(line.rstrip("\r\n"))
+        self._lines.put(None)
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self._command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="latin-1",
+            startupinfo=core._startupinfo(),
+            **control.popen_options(),
+        )
+        threading.Thread(target=self._read_output, daemon=True).start()
+        self._send(f"({READY}\\n) print flush\n")
+        self._wait_for(READY, STARTUP_TIMEOUT)
+
+    def _send(self, text):
+        try:
+            self.process.stdin.write(text)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise core.GhostscriptError(self.process.poll() or -1, f"interpreter is gone: {e}")
+
+    def _wait_for(self, marker, timeout, parser=None):
+        """Collect output lines until ``marker`` appears; return the last other lines"""
+        messages = deque(maxlen=core.OUTPUT_TAIL_LINES)
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                raise core.GhostscriptError(-1, "\n".join(list(messages) + ["timed out waiting for Ghostscript"]))
+            if line is None:
+                raise core.GhostscriptError(self.process.wait(), "\n".join(messages))
+            if line.startswith(marker):
+                return line, list(messages)
+            if parser is not None:
+                parser.feed(line)
+            if not core.PAGE_LINE.match(line):
+                messages.append(line)
+
+    def accepts(self, input_path, output_path, quality_setting):
+        """Whether this interpreter can run the job without a restart"""
+        return (self.quality_setting == quality_setting
+                and _directory(input_path) in self.read_dirs
+                and _directory(output_path) in self.write_dirs)
+
+    def _watch(self, cancel, finished):
+        while not finished.is_set():
+            if cancel.wait(0.1):
+                if not finished.is_set() and self.process is not None:
+                    control.kill_process(self.process)
+                return
+
+    def run_job(self, input_path, output_path, timeout=None, progress=None, cancel=None):
+        """Compress one file; raises GhostscriptError on failure.
+
+        Setting ``cancel`` kills the interpreter, which the pool then
+        replaces, and raises CompressionCancelled. Returns the job's wall
+        time, plus its CPU time and peak RSS where /proc reports them.
+        """
+        if cancel is not None:
+            if cancel.is_set():
+                raise core.CompressionCancelled()
+            finished = threading.Event()
+            if isinstance(cancel, control.JobControl):
+                # Lets the job's control kill or pause this interpreter
+                cancel.attach(self.process)
+            else:
+                threading.Thread(target=self._watch, args=(cancel, finished), daemon=True).start()
+            try:
+                return self.run_job(input_path, output_path, timeout, progress)
+            except core.GhostscriptError:
+                if cancel.is_set():
+                    raise core.CompressionCancelled()
+                raise
+            finally:
+                finished.set()
+                if isinstance(cancel, control.JobControl):
+                    cancel.detach(self.process)
+        self._job_id += 1
+        marker = f"{SENTINEL} {self._job_id}"
+        _reset_peak_rss(self.process.pid)
+        before = _proc_usage(self.process.pid)
+        start = time.perf_counter()
+        # Point pdfwrite at the real output, run the input, then switch back to
+        # the scratch file so the output is closed and complete on disk
+        self._send(
+            f"<< /OutputFile {ps_string(output_path)} >> setpagedevice\n"
+            f"{{ {ps_string(input_path)} run }} stopped\n"
+            f"<< /OutputFile {ps_string(self.scratch_path)} >> setpagedevice\n"
+            f"{{ ({marker} ERROR\\n) }} {{ ({marker} OK\\n) }} ifelse print flush\n"
+        )
+        parser = core.PageProgressParser(progress) if progress else None
+        line, messages = self._wait_for(marker, timeout, parser)
+        self.jobs_done += 1
+        if not line.endswith(" OK"):
+            raise core.GhostscriptError(1, "\n".join(messages))
+        with open(output_path, 'rb') as f:
+            if f.read(5) != b"%PDF-":
+                raise core.GhostscriptError(1, "\n".join(messages + ["output is not a PDF"]))
+        after = _proc_usage(self.process.pid)
+        usage = {"gs_time": time.perf_counter() - start}
+        if before is not None and after is not None:
+            user_time, sys_time = after[0] - before[0], after[1] - before[1]
+            usage.update(cpu_time=user_time + sys_time, user_time=user_time, sys_time=sys_time,
+                         peak_rss=after[2])
+        return usage
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.close()
+                self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        finally:
+            self.process = None
+            try:
+                os.remove(self.scratch_path)
+            except OSError:
+                pass
+
+
+class InterpreterPool:
+    """Thread-safe pool of persistent interpreters.
+
+    ``compress`` has the same shape as ``core.compress_pdf`` minus the
+    Ghostscript path, so it can be handed to ``core.compress_batch`` as
+    its ``compress_func``.
+    """
+
+    def __init__(self, gs_path, size=None, max_jobs=DEFAULT_MAX_JOBS, timeout=None, gs_args=(), max_idle=None):
+        self.gs_path = gs_path
+        self.gs_args = tuple(gs_args)
+        self.size = max(1, size or core.default_workers())
+        # Idle interpreters kept across all settings
+        self.max_idle = max(1, max_idle or self.size)
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        # setting_key -> idle interpreters (last returned at the end); least recently used setting first
+        self._idle = OrderedDict()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._scratch_dir = tempfile.mkdtemp(prefix="pdfc-pool-")
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _take_idle(self, input_path, output_path, quality_setting):
+        """An idle interpreter with this setting, preferring one that accepts the job"""
+        key = setting_key(quality_setting)
+        stack = self._idle.get(key)
+        if not stack:
+            return None
+        interpreter = next((i for i in reversed(stack) if i.accepts(input_path, output_path, quality_setting)),
+                           stack[-1])
+        stack.remove(interpreter)
+        if not stack:
+            del self._idle[key]
+        return interpreter
+
+    def _make_room(self):
+        """Least recently used idle interpreters to close, so one more fits in ``max_idle``"""
+        evicted = []
+        while self._idle and sum(map(len, self._idle.values())) >= self.max_idle:
+            key, stack = next(iter(self._idle.items()))
+            evicted.append(stack.pop(0))
+            if not stack:
+                del self._idle[key]
+        return evicted
+
+    def _checkout(self, input_path, output_path, quality_setting):
+        with self._lock:
+            interpreter = self._take_idle(input_path, output_path, quality_setting)
+        if interpreter is not None and interpreter.accepts(input_path, output_path, quality_setting):
+            return interpreter
+
+        read_dirs = {_directory(input_path)}
+        write_dirs = {_directory(output_path)}
+        if interpreter is not None:
+            # Same setting, other folders: keep what it was already allowed to touch
+            read_dirs |= interpreter.read_dirs
+            write_dirs |= interpreter.write_dirs
+            interpreter.close()
+        interpreter = GhostscriptInterpreter(self.gs_path, quality_setting, read_dirs, write_dirs,
+                                             scratch_dir=self._scratch_dir, gs_args=self.gs_args)
+        interpreter.start()
+        return interpreter
+
+    def _checkin(self, interpreter):
+        """Hand ``interpreter`` back, closing the least recently used idle ones over ``max_idle``"""
+        key = setting_key(interpreter.quality_setting)
+        with self._lock:
+            evicted = self._make_room()
+            self._idle.setdefault(key, []).append(interpreter)
+            self._idle.move_to_end(key)
+        for other in evicted:
+            other.close()
+
+    def compress(self, input_path, output_path, quality_setting, progress=None, cancel=None):
+        """Compress one file on a pooled interpreter"""
+        if self._closed:
+            raise RuntimeError("interpreter pool is closed")
+        with self._slots:
+            interpreter = None
+            try:
+                interpreter = self._checkout(input_path, output_path, quality_setting)
+                usage = interpreter.run_job(input_path, output_path, timeout=self.timeout,
+                                            progress=progress, cancel=cancel)
+            except Exception:
+                if interpreter is not None:
+                    interpreter.close()
+                raise
+            if interpreter.jobs_done >= self.max_jobs or (cancel is not None and cancel.is_set()):
+                # A late cancel may already have killed it; never hand it out again
+                interpreter.close()
+            else:
+                self._checkin(interpreter)
+            return usage
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            idle = [interpreter for stack in self._idle.values() for interpreter in stack]
+            self._idle.clear()
+        for interpreter in idle:
+            interpreter.close()
+        shutil.rmtree(self._scratch_dir, ignore_errors=True)
@@ -0,0 +1,220 @@
+"""Batch journal, so an interrupted batch can be resumed.
+
+The journal is a JSON-lines file. The first line describes the batch;
+every other line is the latest known state of one job. New states are
+appended as jobs finish by a background thread, which hashes the inputs
+and flushes whatever has queued up to disk with one fsync, so recording
+never holds up the batch. After a crash only the states not written yet
+are lost; a line cut short is ignored when the journal is read.
+Starting a batch rewrites the whole journal atomically through a
+temporary file and ``os.replace``.
+
+A finished job is only skipped on resume when its settings are the
+same, its input is unchanged (same size and mtime, or else the same
+SHA-256) and its output still exists with the recorded size.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from . import core
+from .cache import file_sha256
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def settings_key(settings):
+    """Short fingerprint of everything that shapes a batch's outputs"""
+    material = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+def _json_safe(extra):
+    return {k: v for k, v in extra.items() if isinstance(v, (str, int, float, bool, type(None)))}
+
+
+class BatchJournal:
+    """Per-job state of one batch, kept in a JSON-lines file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.header = {}
+        self.entries = {}
+        self._file = None
+        self._lock = threading.Lock()
+        # Entries waiting for the writer thread
+        self._queued = []
+        self._wakeup = threading.Condition(self._lock)
+        self._writer = None
+        self._closing = False
+        self._error = None
+        self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load(self):
+        self.header = {}
+        self.entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            if record.get("type") == "batch":
+                self.header = record
+            elif record.get("type") == "job" and "input" in record:
+                self.entries[record["input"]] = record
+
+    @property
+    def settings(self):
+        return self.header.get("settings")
+
+    def unfinished(self):
+        """Jobs of the journalled batch that are pending or failed, in order"""
+        return [(e["input"], e["output"]) for e in self.entries.values() if e.get("status") != DONE]
+
+    def jobs(self):
+        return [(e["input"], e["output"]) for e in self.entries.values()]
+
+    def is_complete(self, entry, output_path, key):
+        """Whether a journalled job can be skipped instead of redone"""
+        if entry.get("status") != DONE or entry.get("settings") != key or entry.get("output") != output_path:
+            return False
+        if not os.path.exists(output_path) or core.get_file_size(output_path) != entry.get("compressed_size"):
+            return False
+        try:
+            stat = os.stat(entry["input"])
+        except OSError:
+            return False
+        if stat.st_size == entry.get("input_size") and stat.st_mtime_ns == entry.get("input_mtime_ns"):
+            return True
+        return stat.st_size == entry.get("input_size") and file_sha256(entry["input"]) == entry.get("sha256")
+
+    def begin(self, jobs, settings, resume=False):
+        """Start journalling ``jobs``; returns (jobs to run, results of skipped jobs).
+
+        Without ``resume`` every job is run again.
+        """
+        key = settings_key(settings)
+        pending = []
+        resumed = []
+        entries = {}
+        for input_path, output_path in jobs:
+            entry = self.entries.get(input_path)
+            if resume and entry is not None and self.is_complete(entry, output_path, key):
+                entries[input_path] = entry
+                resumed.append(core.FileResult(input_path, output_path,
+                                               original_size=entry.get("original_size", 0),
+                                               compressed_size=entry.get("compressed_size", 0),
+                                               elapsed=entry.get("elapsed", 0.0),
+                                               extra=dict(entry.get("extra") or {}, resumed=True)))
+            else:
+                entries[input_path] = {"type": "job", "input": input_path, "output": output_path,
+                                       "settings": key, "status": PENDING}
+                pending.append((input_path, output_path))
+        header = {"type": "batch", "settings": settings, "settings_key": key, "started": time.time()}
+        self.close()
+        with self._lock:
+            self._rewrite(header, entries)
+            self.header = header
+            self.entries = entries
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._closing = False
+            self._writer = threading.Thread(target=self._write_loop, daemon=True, name="pdfc-journal")
+            self._writer.start()
+        return pending, resumed
+
+    def _rewrite(self, header, entries):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".journal-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(header, default=str) + "\n")
+                for entry in entries.values():
+                    f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def record(self, result):
+        """Queue the outcome of one job for the writer thread"""
+        with self._lock:
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+            entry = dict(self.entries.get(result.input_path) or
+                         {"type": "job", "input": result.input_path, "settings": self.header.get("settings_key")})
+            entry.update(output=result.output_path, original_size=result.original_size,
+                         elapsed=round(result.elapsed, 3))
+            if result.ok:
+                entry.update(status=DONE, compressed_size=result.compressed_size, error=None,
+                             extra=_json_safe(result.extra))
+            else:
+                entry.update(status=FAILED, error=result.error)
+            self.entries[result.input_path] = entry
+            if self._writer is not None:
+                self._queued.append(entry)
+                self._wakeup.notify()
+
+    def _write_loop(self):
+        while True:
+            with self._lock:
+                while not self._queued and not self._closing:
+                    self._wakeup.wait()
+                entries, self._queued = self._queued, []
+                if not entries and self._closing:
+                    return
+            fingerprints = [_input_fingerprint(entry["input"]) if entry["status"] == DONE else {}
+                            for entry in entries]
+            with self._lock:
+                for entry, fingerprint in zip(entries, fingerprints):
+                    entry.update(fingerprint)
+            try:
+                self._file.write("".join(json.dumps(entry) + "\n" for entry in entries))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except (OSError, ValueError) as e:
+                with self._lock:
+                    self._error = self._error or e
+
+    def close(self):
+        with self._lock:
+            writer, self._writer = self._writer, None
+            self._closing = True
+            self._wakeup.notify()
+        if writer is not None:
+            writer.join()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _input_fingerprint(path):
+    """The input's size, mtime and SHA-256, which resume compares"""
+    try:
+        stat = os.stat(path)
+        return {"input_size": stat.st_size, "input_mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(path)}
+    except OSError:
+        # Input gone; the entry can never be resumed, which is fine
+        return {}
@@ -0,0 +1,160 @@
+"""Load test for the HTTP service: ``python -m pdfcompressor.loadtest``
+
+Client threads upload PDFs to a running ``pdfcompressor.server``, poll
+each job until it is finished, download the result and delete the job.
+Uploads refused because the queue is full are retried after the
+server's Retry-After delay. At the end it prints throughput, latency
+percentiles and the server's own metrics.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+from . import synthetic
+from .metrics import percentile
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+POLL_INTERVAL = 0.1
+
+
+class Client:
+    """One HTTP connection per request, as the service closes them anyway"""
+
+    def __init__(self, url, timeout=60):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, headers=None, sink=None):
+        """(status, headers, JSON body or byte count when ``sink`` is set)"""
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            if sink:
+                size = 0
+                while True:
+                    chunk = response.read(64 * 1024)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                return response.status, dict(response.getheaders()), size
+            data = response.read()
+            return response.status, dict(response.getheaders()), json.loads(data) if data else None
+        finally:
+            connection.close()
+
+
+def run_one(client, path, level, stats, lock):
+    """Upload, wait for and download one file; returns a measurement dict"""
+    size = os.path.getsize(path)
+    query = f"/jobs?name={quote(os.path.basename(path))}"
+    if level:
+        query += f"&level={quote(level)}"
+    start = time.perf_counter()
+    while True:
+        with open(path, 'rb') as f:
+            status, headers, job = client.request("POST", query, body=f,
+                                                  headers={"Content-Length": str(size),
+                                                           "Content-Type": "application/pdf"})
+        if status != 503:
+            break
+        with lock:
+            stats["rejected"] += 1
+        time.sleep(float(headers.get("Retry-After", 1)))
+    uploaded = time.perf_counter()
+    if status != 202:
+        return {"file": path, "error": f"upload: HTTP {status}: {(job or {}).get('error')}"}
+    while job["status"] in ("queued", "running"):
+        time.sleep(POLL_INTERVAL)
+        status, _, job = client.request("GET", f"/jobs/{job['id']}")
+    finished = time.perf_counter()
+    record = {"file": path, "size": size, "status": job["status"], "upload": uploaded - start,
+              "turnaround": finished - start, "error": job.get("error")}
+    if job["status"] == "done":
+        status, _, received = client.request("GET", job["result"], sink=True)
+        record["download"] = time.perf_counter() - finished
+        record["compressed_size"] = received
+        if status != 200:
+            record["error"] = f"download: HTTP {status}"
+    client.request("DELETE", f"/jobs/{job['id']}")
+    return record
+
+
+def run_load(url, files, requests, concurrency, level=None):
+    client = Client(url)
+    stats = {"rejected": 0}
+    lock = threading.Lock()
+    work = [files[i % len(files)] for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        records = list(executor.map(lambda path: run_one(client, path, level, stats, lock), work))
+    wall = time.perf_counter() - start
+    _, _, metrics = client.request("GET", "/metrics")
+    return records, stats, wall, metrics
+
+
+def print_report(records, stats, wall, metrics):
+    ok = [r for r in records if r.get("status") == "done" and not r.get("error")]
+    turnaround = [r["turnaround"] for r in ok]
+    upload = [r["upload"] for r in ok]
+    sent = sum(r["size"] for r in ok)
+    print(f"{len(ok)}/{len(records)} jobs done in {wall:.2f}s: {len(ok) / wall:.2f} files/s, "
+          f"{sent / wall / (1024 * 1024):.2f} MB/s uploaded; {stats['rejected']} upload(s) refused "
+          f"with 503 and retried")
+    for name, values in (("turnaround", turnaround), ("upload", upload)):
+        if values:
+            print(f"{name:<10} p50 {percentile(values, 0.5):.3f}s  p95 {percentile(values, 0.95):.3f}s  "
+                  f"max {max(values):.3f}s")
+    for record in records:
+        if record.get("error"):
+            print(f"{record['file']}: {record['error']}", file=sys.stderr)
+    print("server: " + ", ".join(f"{key}={metrics[key]}" for key in
+                                 ("accepted", "done", "failed", "rejected_full", "rejected_size",
+                                  "queue_depth", "running")))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pdfcompressor.loadtest",
+        description="Load test a running pdfcompressor.server on this machine.")
+    parser.add_argument("files", nargs="*", help="PDF files to upload (default: the synthetic corpus)")
+    parser.add_argument("--url", default=DEFAULT_URL, help=f"service address (default: {DEFAULT_URL})")
+    parser.add_argument("-n", "--requests", type=int, help="jobs to submit (default: one per file)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="client threads (default: 4)")
+    parser.add_argument("-l", "--level", help="compression level sent with every job (default: the server's)")
+    parser.add_argument("--synthetic-dir", default=os.path.join(tempfile.gettempdir(), "pdfc-synthetic"),
+                        help="where the synthetic corpus is generated")
+    parser.add_argument("--scale", type=float, default=0.25,
+                        help="page count multiplier for the synthetic corpus (default: 0.25)")
+    parser.add_argument("--json", metavar="FILE", help="write every measurement as JSON")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    files = args.files or synthetic.generate_corpus(args.synthetic_dir, args.scale)
+    try:
+        records, stats, wall, metrics = run_load(args.url, files, args.requests or len(files),
+                                                 max(1, args.concurrency), args.level)
+    except OSError as e:
+        print(f"error: cannot reach {args.url}: {e}", file=sys.stderr)
+        return 2
+    print_report(records, stats, wall, metrics)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"wall_time": wall, "rejected": stats["rejected"], "server": metrics,
+                       "records": records}, f, indent=2)
+    return 1 if any(r.get("error") for r in records) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
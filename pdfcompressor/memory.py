@@ -0,0 +1,145 @@
+"""Memory-bounded batches.
+
+Several Ghostscript processes working on large scans at once can use
+more RAM than the machine has. A ``MemoryBudget`` estimates each job's
+memory need from its file size and page count, times the number of
+Ghostscript processes it may run at once. A job only starts while
+the estimates of all running jobs fit in the budget; one job always runs,
+even when its estimate alone is over budget. A per-process limit can also
+be set. It caps every Ghostscript process of a job (RLIMIT_AS, Linux only),
+and tuned band and buffer settings keep Ghostscript's raster memory under
+that cap. A process that hits the limit fails with a VMerror instead of
+pushing the machine into swap.
+"""
+import os
+import threading
+
+from . import control
+from .preflight import analyze_cached
+
+MB = 1024 * 1024
+# Interpreter, fonts and pdfwrite state, before any page is read
+BASE_BYTES = 64 * MB
+# Resources held per page (fonts, images, the page tree)
+PAGE_BYTES = 256 * 1024
+# Share of the input kept in memory while it is rewritten
+INPUT_FACTOR = 0.5
+# Share of physical memory used when no budget is given
+DEFAULT_BUDGET_FRACTION = 0.75
+DEFAULT_BAND_BYTES = 16 * MB
+
+
+def physical_memory():
+    """Installed RAM in bytes, or None when it cannot be found"""
+    if os.name == 'nt':
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(status)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullTotalPhys
+        return None
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_budget():
+    total = physical_memory()
+    return int(total * DEFAULT_BUDGET_FRACTION) if total else None
+
+
+def ghostscript_args(process_limit=None):
+    """Band and buffer settings that keep Ghostscript's rasters small.
+
+    pdfwrite only rasterises for things like patterns and flattened
+    transparency, but a full-page bitmap at high resolution can take
+    hundreds of megabytes. With these settings larger pages are rendered
+    in bands instead.
+    """
+    band = DEFAULT_BAND_BYTES
+    if process_limit:
+        band = max(MB, min(band, process_limit // 16))
+    return [f"-dBufferSpace={band}", f"-dMaxBitmap={band * 2}", f"-dMaxPatternBitmap={band}"]
+
+
+def estimate(input_path):
+    """Memory one Ghostscript process is expected to need for ``input_path``"""
+    try:
+        size = os.path.getsize(input_path)
+    except OSError:
+        size = 0
+    pages = analyze_cached(input_path).pages or 0
+    return BASE_BYTES + DEFAULT_BAND_BYTES + int(size * INPUT_FACTOR) + pages * PAGE_BYTES
+
+
+class MemoryBudget:
+    """Admission control for the jobs of a batch.
+
+    ``budget_bytes`` bounds the total estimated memory of running jobs
+    (default: three quarters of physical memory; 0 for no bound).
+    ``process_limit`` caps each Ghostscript process in bytes (default:
+    no cap).
+    """
+
+    def __init__(self, budget_bytes=None, process_limit=None):
+        self.budget_bytes = default_budget() if budget_bytes is None else budget_bytes
+        self.process_limit = process_limit
+        self.in_use = 0
+        self.running = 0
+        self.peak_in_use = 0
+        self.waits = 0
+        self._condition = threading.Condition()
+
+    def gs_args(self):
+        """Extra Ghostscript arguments for the batch (only with a process limit)"""
+        return ghostscript_args(self.process_limit) if self.process_limit else []
+
+    def estimate(self, input_path, processes=1):
+        """Memory a job needs while running ``processes`` Ghostscript processes"""
+        need = estimate(input_path)
+        if self.process_limit:
+            # The cap bounds what each process can take
+            need = min(need, self.process_limit)
+        return need * processes
+
+    def acquire(self, need, cancel=None):
+        """Wait until a job needing ``need`` bytes fits; False if cancelled meanwhile"""
+        with self._condition:
+            waited = False
+            while self.budget_bytes and self.running and self.in_use + need > self.budget_bytes:
+                if cancel is not None and cancel.is_set():
+                    return False
+                waited = True
+                self._condition.wait(0.1)
+            if cancel is not None and cancel.is_set():
+                return False
+            self.waits += waited
+            self.in_use += need
+            self.running += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            return True
+
+    def release(self, need):
+        with self._condition:
+            self.in_use -= need
+            self.running -= 1
+            self._condition.notify_all()
+
+    def limit(self, job):
+        """Apply the per-process cap to every process ``job`` (a JobControl) runs"""
+        if self.process_limit:
+            job.memory_limit = self.process_limit
+
+    def report(self):
+        return {"budget": self.budget_bytes, "process_limit": self.process_limit,
+                "peak_estimated": self.peak_in_use, "waits": self.waits,
+                "can_limit": control.CAN_LIMIT_MEMORY}
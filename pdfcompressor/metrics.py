@@ -0,0 +1,216 @@
+"""Per-job metrics.
+
+Every finished job becomes one flat record: where its time went (queue
+wait, pre-flight scan, Ghostscript wall, user and system time), the
+Ghostscript child's peak memory, bytes in and out, and how it ended. A
+``MetricsRecorder`` appends the records to a JSONL log, keeps aggregates
+(latency percentiles, throughput) for the summaries of the CLI and GUI,
+and can keep a Prometheus text-format file up to date, e.g. for
+node_exporter's textfile collector. The HTTP service serves the same
+text on ``/metrics?format=prometheus``.
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+
+# Timings kept for the percentiles; long-running watchers and services
+# report on the most recent jobs
+WINDOW = 10000
+# Extra fields copied into a record when a job has them
+TAGS = ("cache", "auto_level", "target", "preset", "preflight", "duplicate_of", "direct", "shards")
+TIMINGS = ("queue_wait", "preflight_time", "gs_time", "user_time", "sys_time", "cpu_time")
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values`` (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def job_status(result):
+    if result.ok:
+        return "ok"
+    if result.extra.get("timed_out"):
+        return "timed_out"
+    if result.extra.get("cancelled"):
+        return "cancelled"
+    return "failed"
+
+
+def job_record(result):
+    """Flat, JSON-ready record of one ``core.FileResult``"""
+    extra = result.extra
+    record = {
+        "time": round(time.time(), 3),
+        "input": result.input_path,
+        "output": result.output_path,
+        "status": job_status(result),
+        "exit_status": 0 if result.ok else extra.get("exit_status"),
+        "bytes_in": result.original_size,
+        "bytes_out": result.compressed_size,
+        "elapsed": round(result.elapsed, 3),
+    }
+    for key in TIMINGS:
+        value = extra.get(key)
+        record[key] = round(value, 3) if value is not None else None
+    record["peak_rss"] = extra.get("peak_rss")
+    for key in TAGS:
+        if key in extra:
+            record[key] = extra[key]
+    if result.error:
+        record["error"] = result.error
+    return record
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".pdfc-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class MetricsRecorder:
+    """Collects job records; thread-safe, so it can be fed from worker threads.
+
+    ``log_path`` is a JSONL file records are appended to, ``prometheus_path``
+    a text-format file rewritten after every job (both optional).
+    """
+
+    def __init__(self, log_path=None, prometheus_path=None, window=WINDOW):
+        self.log_path = log_path
+        self.prometheus_path = prometheus_path
+        self.started = time.time()
+        self.last = None
+        self.statuses = Counter()
+        self.totals = Counter()
+        self.peak_rss = 0
+        self.latencies = deque(maxlen=window)
+        self.queue_waits = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._log = open(log_path, 'a', encoding='utf-8') if log_path else None
+
+    def start_clock(self):
+        """Measure throughput from now on, e.g. from the start of a batch"""
+        with self._lock:
+            self.started = time.time()
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, result):
+        """Add a finished ``core.FileResult``; returns its record"""
+        record = job_record(result)
+        with self._lock:
+            self.last = time.time()
+            self.statuses[record["status"]] += 1
+            if record["status"] == "ok":
+                self.totals["bytes_in"] += record["bytes_in"]
+                self.totals["bytes_out"] += record["bytes_out"]
+                self.latencies.append(record["elapsed"] + (record["queue_wait"] or 0))
+            if record["queue_wait"] is not None:
+                self.queue_waits.append(record["queue_wait"])
+            for key in ("gs_time", "user_time", "sys_time"):
+                self.totals[key] += record[key] or 0
+            self.peak_rss = max(self.peak_rss, record["peak_rss"] or 0)
+            if self._log is not None:
+                self._log.write(json.dumps(record) + "\n")
+                self._log.flush()
+            text = self._prometheus() if self.prometheus_path else None
+        if text is not None:
+            try:
+                _write_atomic(self.prometheus_path, text)
+            except OSError:
+                # Metrics must never fail a job
+                pass
+        return record
+
+    def summary(self):
+        """Aggregates over the jobs recorded so far.
+
+        Latency is from the start of the batch (or submission) to the end
+        of the job, so it includes the queue wait.
+        """
+        with self._lock:
+            wall = (self.last or time.time()) - self.started
+            ok = self.statuses["ok"]
+            latencies = list(self.latencies)
+            waits = list(self.queue_waits)
+            return {
+                "jobs": sum(self.statuses.values()),
+                "statuses": dict(self.statuses),
+                "wall_time": round(wall, 3),
+                "latency_p50": percentile(latencies, 0.5),
+                "latency_p95": percentile(latencies, 0.95),
+                "queue_wait_p50": percentile(waits, 0.5),
+                "queue_wait_p95": percentile(waits, 0.95),
+                "mb_per_s": round(self.totals["bytes_in"] / wall / (1024 * 1024), 3) if wall > 0 else None,
+                "files_per_min": round(ok / wall * 60, 2) if wall > 0 else None,
+                "bytes_in": self.totals["bytes_in"],
+                "bytes_out": self.totals["bytes_out"],
+                "gs_time": round(self.totals["gs_time"], 3),
+                "user_time": round(self.totals["user_time"], 3),
+                "sys_time": round(self.totals["sys_time"], 3),
+                "peak_rss": self.peak_rss or None,
+            }
+
+    def prometheus(self, gauges=None):
+        """Prometheus text exposition; ``gauges`` adds name -> value pairs"""
+        with self._lock:
+            return self._prometheus(gauges)
+
+    def _prometheus(self, gauges=None):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP pdfc_{name} {help_text}")
+            lines.append(f"# TYPE pdfc_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"pdfc_{name}{labels} {round(value, 6) if isinstance(value, float) else value}")
+
+        def summary(name, help_text, values):
+            samples = [(f'{{quantile="{q}"}}', float(percentile(values, q) or 0)) for q in (0.5, 0.95)]
+            samples += [("_sum", float(sum(values))), ("_count", len(values))]
+            metric(name, "summary", help_text, samples)
+
+        metric("jobs_total", "counter", "Jobs finished, by status.",
+               [(f'{{status="{status}"}}', count) for status, count in sorted(self.statuses.items())])
+        summary("job_latency_seconds", "Time from submission to the end of a job that succeeded.",
+                list(self.latencies))
+        summary("queue_wait_seconds", "Time a job waited for a worker, a pause or memory.",
+                list(self.queue_waits))
+        metric("input_bytes_total", "counter", "Bytes read by jobs that succeeded.",
+               [("", self.totals["bytes_in"])])
+        metric("output_bytes_total", "counter", "Bytes written by jobs that succeeded.",
+               [("", self.totals["bytes_out"])])
+        metric("ghostscript_seconds_total", "counter", "Wall time of Ghostscript processes.",
+               [("", float(self.totals["gs_time"]))])
+        metric("ghostscript_cpu_seconds_total", "counter", "CPU time of Ghostscript processes.",
+               [('{mode="user"}', float(self.totals["user_time"])),
+                ('{mode="system"}', float(self.totals["sys_time"]))])
+        metric("ghostscript_peak_rss_bytes", "gauge", "Largest peak RSS of a Ghostscript process.",
+               [("", self.peak_rss)])
+        for name, value in sorted((gauges or {}).items()):
+            metric(name, "gauge", name.replace("_", " ").capitalize() + ".", [("", value)])
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,780 @@
+"""Minimal pure-Python PDF object reader.
+
+Reads just enough of a PDF to answer structural questions (page tree,
+outlines, annotations, document info, encryption) without Ghostscript
+and without loading the whole file: the file is memory-mapped and objects
+are parsed lazily through the cross-reference table. Classic xref tables,
+xref streams, object streams and hybrid files are supported; when the
+cross-reference data is broken the object table is rebuilt by scanning
+for ``N G obj`` headers.
+"""
+import binascii
+import hashlib
+import mmap
+import os
+import re
+import zlib
+from collections import namedtuple
+
+WHITESPACE = b"\x00\t\n\x0c\r "
+DELIMITERS = b"()<>[]{}/%"
+TAIL_SIZE = 4096
+
+
+class PdfError(ValueError):
+    """Raised for input that cannot be parsed as PDF"""
+
+
+class PdfName(str):
+    """A PDF name object, stored without the leading slash"""
+
+    def __repr__(self):
+        return "/" + str(self)
+
+
+class PdfString(bytes):
+    """A PDF string object (raw bytes, escapes already resolved)"""
+
+    def text(self):
+        """Decode as PDF text string (UTF-16BE with BOM, else PDFDocEncoding/Latin-1)"""
+        if self.startswith(b"\xfe\xff"):
+            return self[2:].decode("utf-16-be", "replace")
+        if self.startswith(b"\xef\xbb\xbf"):
+            return self[3:].decode("utf-8", "replace")
+        return self.decode("latin-1")
+
+
+class PdfRef(namedtuple("PdfRef", "num gen")):
+    """An indirect reference ``num gen R``"""
+
+    def __repr__(self):
+        return f"{self.num} {self.gen} R"
+
+
+class PdfStream:
+    """A stream object: its dictionary plus where its undecoded data lives.
+
+    The data is only copied out of the file when ``raw`` is read, so
+    walking the objects of a large scan does not load its images.
+    """
+
+    def __init__(self, dictionary, source, offset, length):
+        self.dict = dictionary
+        self.source = source
+        self.offset = offset
+        self.length = length
+
+    @property
+    def raw(self):
+        return self.source[self.offset:self.offset + self.length]
+
+    def get(self, key, default=None):
+        return self.dict.get(key, default)
+
+    def __getitem__(self, key):
+        return self.dict[key]
+
+    def __contains__(self, key):
+        return key in self.dict
+
+    def filters(self):
+        """Filter names and their decode parameters, in application order"""
+        filters = self.dict.get("Filter")
+        params = self.dict.get("DecodeParms")
+        if filters is None:
+            return []
+        if not isinstance(filters, list):
+            filters = [filters]
+            params = [params]
+        elif not isinstance(params, list):
+            params = [params] * len(filters)
+        return list(zip(filters, params))
+
+    def decode(self, resolve=lambda obj: obj):
+        """Decoded stream data; raises PdfError for unsupported filters"""
+        data = bytes(self.raw)
+        for name, params in self.filters():
+            name = resolve(name)
+            params = resolve(params) or {}
+            decoder = DECODERS.get(name)
+            if decoder is None:
+                raise PdfError(f"unsupported filter /{name}")
+            data = decoder(data, params)
+        return data
+
+
+# --- Stream filters ---
+
+def _png_unpredict(data, columns, colors=1, bpc=8):
+    bpp = max(1, colors * bpc // 8)
+    rowlen = (columns * colors * bpc + 7) // 8
+    out = bytearray()
+    prev = bytearray(rowlen)
+    pos = 0
+    while pos + rowlen < len(data) + 1 and pos < len(data):
+        ftype = data[pos]
+        row = bytearray(data[pos + 1:pos + 1 + rowlen])
+        row.extend(b"\x00" * (rowlen - len(row)))
+        pos += rowlen + 1
+        if ftype == 1:
+            for i in range(bpp, rowlen):
+                row[i] = (row[i] + row[i - bpp]) & 0xFF
+        elif ftype == 2:
+            for i in range(rowlen):
+                row[i] = (row[i] + prev[i]) & 0xFF
+        elif ftype == 3:
+            for i in range(rowlen):
+                left = row[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + prev[i]) >> 1)) & 0xFF
+        elif ftype == 4:
+            for i in range(rowlen):
+                a = row[i - bpp] if i >= bpp else 0
+                b = prev[i]
+                c = prev[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                if pa <= pb and pa <= pc:
+                    pred = a
+                elif pb <= pc:
+                    pred = b
+                else:
+                    pred = c
+                row[i] = (row[i] + pred) & 0xFF
+        out.extend(row)
+        prev = row
+    return bytes(out)
+
+
+def _flate_decode(data, params):
+    try:
+        data = zlib.decompress(data)
+    except zlib.error:
+        # Tolerate truncated or trailing-garbage streams
+        data = zlib.decompressobj().decompress(data)
+    predictor = params.get("Predictor", 1) if isinstance(params, dict) else 1
+    if predictor >= 10:
+        data = _png_unpredict(data, params.get("Columns", 1), params.get("Colors", 1),
+                              params.get("BitsPerComponent", 8))
+    return data
+
+
+def _ascii_hex_decode(data, params):
+    data = re.sub(rb"\s+", b"", data).split(b">", 1)[0]
+    if len(data) % 2:
+        data += b"0"
+    return binascii.unhexlify(data)
+
+
+def _ascii85_decode(data, params):
+    data = re.sub(rb"\s+", b"", data)
+    if data.startswith(b"<~"):
+        data = data[2:]
+    if data.endswith(b"~>"):
+        data = data[:-2]
+    out = bytearray()
+    group = []
+    for ch in data:
+        if ch == ord("z") and not group:
+            out.extend(b"\x00\x00\x00\x00")
+            continue
+        group.append(ch - 33)
+        if len(group) == 5:
+            value = 0
+            for c in group:
+                value = value * 85 + c
+            out.extend(value.to_bytes(4, "big"))
+            group = []
+    if group:
+        padding = 5 - len(group)
+        value = 0
+        for c in group + [84] * padding:
+            value = value * 85 + c
+        out.extend(value.to_bytes(4, "big")[:4 - padding])
+    return bytes(out)
+
+
+DECODERS = {
+    "FlateDecode": _flate_decode,
+    "Fl": _flate_decode,
+    "ASCIIHexDecode": _ascii_hex_decode,
+    "AHx": _ascii_hex_decode,
+    "ASCII85Decode": _ascii85_decode,
+    "A85": _ascii85_decode,
+}
+
+
+# --- Tokenizer / object parser ---
+
+_NUMBER = re.compile(rb"[+-]?(\d+\.?\d*|\.\d+)")
+_REGULAR = re.compile(rb"[^\x00\t\n\x0c\r ()<>\[\]{}/%]+")
+_NAME_ESCAPE = re.compile(rb"#([0-9A-Fa-f]{2})")
+_REF_TAIL = re.compile(rb"\s+(\d+)\s+R(?=[\x00\t\n\x0c\r ()<>\[\]{}/%]|$)")
+_ESCAPES = {ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t", ord("b"): b"\b",
+            ord("f"): b"\f", ord("("): b"(", ord(")"): b")", ord("\\"): b"\\"}
+
+
+def skip_whitespace(buf, pos):
+    """Skip whitespace and comments"""
+    end = len(buf)
+    while pos < end:
+        ch = buf[pos]
+        if ch in WHITESPACE:
+            pos += 1
+        elif ch == 0x25:  # %
+            while pos < end and buf[pos] not in b"\r\n":
+                pos += 1
+        else:
+            break
+    return pos
+
+
+def _parse_literal_string(buf, pos):
+    out = bytearray()
+    depth = 1
+    end = len(buf)
+    while pos < end:
+        ch = buf[pos]
+        pos += 1
+        if ch == 0x5C:  # backslash
+            if pos >= end:
+                break
+            nxt = buf[pos]
+            pos += 1
+            if nxt in _ESCAPES:
+                out.extend(_ESCAPES[nxt])
+            elif 0x30 <= nxt <= 0x37:
+                digits = bytes([nxt])
+                while len(digits) < 3 and pos < end and 0x30 <= buf[pos] <= 0x37:
+                    digits += bytes([buf[pos]])
+                    pos += 1
+                out.append(int(digits, 8) & 0xFF)
+            elif nxt == 0x0D:
+                if pos < end and buf[pos] == 0x0A:
+                    pos += 1
+            elif nxt != 0x0A:
+                out.append(nxt)
+        elif ch == 0x28:
+            depth += 1
+            out.append(ch)
+        elif ch == 0x29:
+            depth -= 1
+            if depth == 0:
+                return PdfString(out), pos
+            out.append(ch)
+        else:
+            out.append(ch)
+    raise PdfError("unterminated string")
+
+
+def parse_object(buf, pos):
+    """Parse one object starting at ``pos``; returns (object, new_pos)"""
+    pos = skip_whitespace(buf, pos)
+    if pos >= len(buf):
+        raise PdfError("unexpected end of data")
+    ch = buf[pos]
+
+    if ch == 0x2F:  # /
+        match = _REGULAR.match(buf, pos + 1)
+        raw = match.group(0) if match else b""
+        name = _NAME_ESCAPE.sub(lambda m: bytes([int(m.group(1), 16)]), raw)
+        return PdfName(name.decode("latin-1")), pos + 1 + len(raw)
+
+    if ch == 0x3C:  # <
+        if buf[pos + 1:pos + 2] == b"<":
+            result = {}
+            pos += 2
+            while True:
+                pos = skip_whitespace(buf, pos)
+                if buf[pos:pos + 2] == b">>":
+                    pos += 2
+                    break
+                key, pos = parse_object(buf, pos)
+                if not isinstance(key, PdfName):
+                    raise PdfError(f"dictionary key is not a name at offset {pos}")
+                value, pos = parse_object(buf, pos)
+                result[key] = value
+            return result, pos
+        end = buf.find(b">", pos)
+        if end < 0:
+            raise PdfError("unterminated hex string")
+        return PdfString(_ascii_hex_decode(bytes(buf[pos + 1:end]), None)), end + 1
+
+    if ch == 0x28:  # (
+        return _parse_literal_string(buf, pos + 1)
+
+    if ch == 0x5B:  # [
+        result = []
+        pos += 1
+        while True:
+            pos = skip_whitespace(buf, pos)
+            if pos >= len(buf):
+                raise PdfError("unterminated array")
+            if buf[pos] == 0x5D:
+                return result, pos + 1
+            value, pos = parse_object(buf, pos)
+            result.append(value)
+
+    match = _NUMBER.match(buf, pos)
+    if match:
+        text = match.group(0)
+        end = match.end()
+        if b"." not in text:
+            ref = _REF_TAIL.match(buf, end)
+            if ref:
+                return PdfRef(int(text), int(ref.group(1))), ref.end()
+            return int(text), end
+        return float(text), end
+
+    match = _REGULAR.match(buf, pos)
+    if not match:
+        raise PdfError(f"unexpected character {chr(ch)!r} at offset {pos}")
+    word = match.group(0)
+    if word == b"true":
+        return True, match.end()
+    if word == b"false":
+        return False, match.end()
+    if word == b"null":
+        return None, match.end()
+    raise PdfError(f"unexpected keyword {word!r} at offset {pos}")
+
+
+def serialize(obj):
+    """Serialise an object back to PDF (and pdfmark-compatible) syntax"""
+    if obj is None:
+        return b"null"
+    if obj is True:
+        return b"true"
+    if obj is False:
+        return b"false"
+    if isinstance(obj, PdfName):
+        escaped = "".join(c if 33 <= ord(c) < 127 and c not in "()<>[]{}/%#" else f"#{ord(c):02X}"
+                          for c in obj)
+        return b"/" + escaped.encode("latin-1")
+    if isinstance(obj, PdfRef):
+        return f"{obj.num} {obj.gen} R".encode()
+    if isinstance(obj, (bytes, bytearray)):
+        return b"<" + binascii.hexlify(bytes(obj)).upper() + b">"
+    if isinstance(obj, int):
+        return str(obj).encode()
+    if isinstance(obj, float):
+        text = f"{obj:.6f}".rstrip("0").rstrip(".")
+        return (text if text not in ("", "-0") else "0").encode()
+    if isinstance(obj, str):
+        return serialize(PdfString(obj.encode("latin-1", "replace")))
+    if isinstance(obj, (list, tuple)):
+        return b"[" + b" ".join(serialize(v) for v in obj) + b"]"
+    if isinstance(obj, dict):
+        return b"<<" + b"".join(serialize(PdfName(k)) + b" " + serialize(v) + b"\n"
+                                for k, v in obj.items()) + b">>"
+    if isinstance(obj, PdfStream):
+        raise PdfError("streams cannot be serialised inline")
+    raise TypeError(f"cannot serialise {type(obj).__name__}")
+
+
+# --- Standard security handler ---
+
+# Padding for passwords shorter than 32 bytes (PDF 32000-1, 7.6.3.3)
+_PASSWORD_PAD = bytes.fromhex("28BF4E5E4E758A4164004E56FFFA01082E2E00B6D0683E802F0CA9FE6453697A")
+
+
+def _rc4(key, data):
+    state = list(range(256))
+    j = 0
+    for i in range(256):
+        j = (j + state[i] + key[i % len(key)]) % 256
+        state[i], state[j] = state[j], state[i]
+    out = bytearray()
+    i = j = 0
+    for byte in data:
+        i = (i + 1) % 256
+        j = (j + state[i]) % 256
+        state[i], state[j] = state[j], state[i]
+        out.append(byte ^ state[(state[i] + state[j]) % 256])
+    return bytes(out)
+
+
+def empty_password_opens(encrypt, first_id=b""):
+    """Whether the standard security handler dict ``encrypt`` accepts the
+    empty user password, i.e. the file only has an owner password.
+
+    None when that cannot be decided here: revision 6 needs AES, which
+    the standard library does not have.
+    """
+    revision = encrypt.get("R")
+    user = bytes(encrypt.get("U") or b"")
+    if revision == 5:
+        # SHA-256 of the password (empty) and the validation salt
+        return len(user) >= 40 and hashlib.sha256(user[32:40]).digest() == user[:32]
+    if revision not in (2, 3, 4):
+        return None
+    owner = bytes(encrypt.get("O") or b"")
+    length = encrypt.get("Length", 40) if revision > 2 else 40
+    key_size = max(5, min(16, int(length) // 8)) if isinstance(length, int) else 5
+    permissions = int(encrypt.get("P", 0)) & 0xFFFFFFFF
+    digest = hashlib.md5(_PASSWORD_PAD + owner[:32] + permissions.to_bytes(4, "little") + bytes(first_id))
+    if revision == 4 and encrypt.get("EncryptMetadata") is False:
+        digest.update(b"\xff\xff\xff\xff")
+    key = digest.digest()[:key_size]
+    if revision == 2:
+        return _rc4(key, _PASSWORD_PAD) == user[:32]
+    for _ in range(50):
+        key = hashlib.md5(key).digest()[:key_size]
+    check = _rc4(key, hashlib.md5(_PASSWORD_PAD + bytes(first_id)).digest())
+    for i in range(1, 20):
+        check = _rc4(bytes(b ^ i for b in key), check)
+    return check == user[:16]
+
+
+# --- Document ---
+
+_OBJ_HEADER = re.compile(rb"(\d+)\s+(\d+)\s+obj\b")
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_XREF_SUBSECTION = re.compile(rb"(\d+)[ \t]+(\d+)[ \t]*")
+_XREF_ENTRY = re.compile(rb"(\d{1,10})[ \t]+(\d{1,5})[ \t]+([nf])")
+
+
+class PdfDocument:
+    """Lazily parsed, memory-mapped PDF file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        if self.size == 0:
+            self._file.close()
+            raise PdfError("empty file")
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.xref = {}
+        self.trailer = {}
+        self.repaired = False
+        self._cache = {}
+        self._objstm_cache = {}
+        self._pages = None
+        try:
+            if not self.buf[:1024].lstrip(WHITESPACE).startswith(b"%PDF-") and self.buf.find(b"%PDF-", 0, 1024) < 0:
+                raise PdfError("not a PDF file")
+            try:
+                self._read_xref_chain()
+            except (PdfError, ValueError, IndexError, zlib.error):
+                self._rebuild_xref()
+            if "Root" not in self.trailer:
+                self._rebuild_xref()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._cache = {}
+        self._objstm_cache = {}
+        self._pages = None
+        if getattr(self, "buf", None) is not None:
+            self.buf.close()
+            self.buf = None
+        if not self._file.closed:
+            self._file.close()
+
+    @property
+    def version(self):
+        match = re.search(rb"%PDF-(\d\.\d)", self.buf[:1024])
+        return match.group(1).decode() if match else None
+
+    # --- Cross-reference ---
+
+    def _read_xref_chain(self):
+        tail = self.buf[max(0, self.size - TAIL_SIZE):]
+        matches = list(_STARTXREF.finditer(tail))
+        if not matches:
+            raise PdfError("startxref not found")
+        offset = int(matches[-1].group(1))
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            trailer = self._read_xref_section(offset)
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            if isinstance(trailer.get("XRefStm"), int):
+                self._read_xref_section(trailer["XRefStm"])
+            offset = trailer.get("Prev") if isinstance(trailer.get("Prev"), int) else None
+
+    def _read_xref_section(self, offset):
+        pos = skip_whitespace(self.buf, offset)
+        if self.buf[pos:pos + 4] == b"xref":
+            return self._read_xref_table(pos + 4)
+        return self._read_xref_stream(pos)
+
+    def _read_xref_table(self, pos):
+        buf = self.buf
+        while True:
+            pos = skip_whitespace(buf, pos)
+            if buf[pos:pos + 7] == b"trailer":
+                trailer, _ = parse_object(buf, pos + 7)
+                return trailer
+            subsection = _XREF_SUBSECTION.match(buf, pos)
+            if not subsection:
+                raise PdfError(f"malformed xref subsection at offset {pos}")
+            start, count = int(subsection.group(1)), int(subsection.group(2))
+            pos = subsection.end()
+            for num in range(start, start + count):
+                entry = _XREF_ENTRY.match(buf, skip_whitespace(buf, pos))
+                if not entry:
+                    raise PdfError(f"malformed xref entry at offset {pos}")
+                pos = entry.end()
+                if num in self.xref:
+                    continue
+                if entry.group(3) == b"n":
+                    self.xref[num] = (1, int(entry.group(1)), int(entry.group(2)))
+                else:
+                    self.xref[num] = (0, 0, 0)
+
+    def _read_xref_stream(self, pos):
+        header = _OBJ_HEADER.match(self.buf, pos)
+        if not header:
+            raise PdfError(f"no xref at offset {pos}")
+        stream = self._parse_indirect(header.end())
+        if not isinstance(stream, PdfStream) or stream.get("Type") != "XRef":
+            raise PdfError("xref stream expected")
+        data = stream.decode()
+        widths = stream["W"]
+        size = stream["Size"]
+        index = stream.get("Index", [0, size])
+        rowlen = sum(widths)
+        row = 0
+        for start, count in zip(index[0::2], index[1::2]):
+            for num in range(start, start + count):
+                entry = data[row * rowlen:(row + 1) * rowlen]
+                row += 1
+                fields = []
+                p = 0
+                for width in widths:
+                    fields.append(int.from_bytes(entry[p:p + width], "big") if width else None)
+                    p += width
+                kind = 1 if fields[0] is None else fields[0]
+                if num not in self.xref:
+                    self.xref[num] = (kind, fields[1] or 0, fields[2] or 0)
+        return stream.dict
+
+    def _rebuild_xref(self):
+        """Recover the object table by scanning for object headers"""
+        self.repaired = True
+        self.xref = {}
+        trailer = {}
+        for match in _OBJ_HEADER.finditer(self.buf):
+            self.xref[int(match.group(1))] = (1, match.start(), int(match.group(2)))
+        for match in re.finditer(rb"trailer\s*<<", self.buf):
+            try:
+                found, _ = parse_object(self.buf, match.start() + 7)
+                trailer.update(found)
+            except PdfError:
+                continue
+        if "Root" not in trailer:
+            for num in sorted(self.xref):
+                try:
+                    obj = self.get(PdfRef(num, self.xref[num][2]))
+                except PdfError:
+                    continue
+                if isinstance(obj, dict) and obj.get("Type") == "Catalog":
+                    trailer["Root"] = PdfRef(num, self.xref[num][2])
+                    break
+        if "Root" not in trailer:
+            raise PdfError("document catalog not found")
+        self.trailer = trailer
+        self._cache = {}
+
+    # --- Objects ---
+
+    def _parse_indirect(self, pos):
+        obj, pos = parse_object(self.buf, pos)
+        pos = skip_whitespace(self.buf, pos)
+        if isinstance(obj, dict) and self.buf[pos:pos + 6] == b"stream":
+            pos += 6
+            if self.buf[pos:pos + 2] == b"\r\n":
+                pos += 2
+            elif self.buf[pos:pos + 1] in (b"\n", b"\r"):
+                pos += 1
+            length = obj.get("Length")
+            if isinstance(length, PdfRef):
+                length = self._resolve_length(length)
+            end = pos + length if isinstance(length, int) else -1
+            if end < pos or self.buf[end:end + 30].find(b"endstream") < 0:
+                end = self.buf.find(b"endstream", pos)
+                if end < 0:
+                    raise PdfError("endstream not found")
+                while end > pos and self.buf[end - 1] in b"\r\n":
+                    end -= 1
+            return PdfStream(obj, self.buf, pos, end - pos)
+        return obj
+
+    def _resolve_length(self, ref):
+        try:
+            value = self.get(ref)
+        except PdfError:
+            return None
+        return value if isinstance(value, int) else None
+
+    def object_offset(self, num):
+        """File offset of an uncompressed object, or None"""
+        entry = self.xref.get(num)
+        if entry and entry[0] == 1:
+            return entry[1]
+        return None
+
+    def get(self, ref):
+        """Load the object an indirect reference points to"""
+        if ref in self._cache:
+            return self._cache[ref]
+        entry = self.xref.get(ref.num)
+        obj = None
+        if entry is None or entry[0] == 0:
+            obj = None
+        elif entry[0] == 1:
+            header = _OBJ_HEADER.match(self.buf, skip_whitespace(self.buf, entry[1]))
+            if not header or int(header.group(1)) != ref.num:
+                if not self.repaired:
+                    self._rebuild_xref()
+                    return self.get(ref)
+                raise PdfError(f"object {ref.num} not found")
+            obj = self._parse_indirect(header.end())
+        elif entry[0] == 2:
+            obj = self._from_object_stream(entry[1], entry[2], ref.num)
+        self._cache[ref] = obj
+        return obj
+
+    def _from_object_stream(self, stream_num, index, num):
+        if stream_num not in self._objstm_cache:
+            stream = self.get(PdfRef(stream_num, 0))
+            if not isinstance(stream, PdfStream):
+                raise PdfError(f"object stream {stream_num} missing")
+            data = stream.decode(self.resolve)
+            count = self.resolve(stream["N"])
+            first = self.resolve(stream["First"])
+            numbers = [int(v) for v in data[:first].split()[:count * 2]]
+            offsets = {numbers[i]: first + numbers[i + 1] for i in range(0, len(numbers), 2)}
+            self._objstm_cache[stream_num] = (data, offsets)
+        data, offsets = self._objstm_cache[stream_num]
+        if num not in offsets:
+            raise PdfError(f"object {num} not in object stream {stream_num}")
+        obj, _ = parse_object(data, offsets[num])
+        return obj
+
+    def resolve(self, obj):
+        """Follow indirect references until a direct object is reached"""
+        seen = 0
+        while isinstance(obj, PdfRef):
+            obj = self.get(obj)
+            seen += 1
+            if seen > 32:
+                raise PdfError("reference loop")
+        return obj
+
+    def object_numbers(self):
+        return sorted(num for num, entry in self.xref.items() if entry[0] in (1, 2))
+
+    # --- Document structure ---
+
+    @property
+    def catalog(self):
+        return self.resolve(self.trailer.get("Root")) or {}
+
+    @property
+    def info(self):
+        info = self.resolve(self.trailer.get("Info"))
+        return info if isinstance(info, dict) else {}
+
+    @property
+    def encrypted(self):
+        return "Encrypt" in self.trailer
+
+    @property
+    def needs_password(self):
+        """Whether opening the file needs a user password; None if unknown.
+
+        Files with only an owner password (permission restrictions) open
+        with the empty user password, as Ghostscript does.
+        """
+        if not self.encrypted:
+            return False
+        encrypt = self.resolve(self.trailer["Encrypt"])
+        if not isinstance(encrypt, dict) or self.resolve(encrypt.get("Filter")) != "Standard":
+            return None
+        encrypt = {key: self.resolve(value) for key, value in encrypt.items()}
+        ids = self.resolve(self.trailer.get("ID"))
+        first_id = self.resolve(ids[0]) if isinstance(ids, list) and ids else b""
+        opens = empty_password_opens(encrypt, first_id if isinstance(first_id, bytes) else b"")
+        return None if opens is None else not opens
+
+    @property
+    def linearized(self):
+        match = _OBJ_HEADER.search(self.buf, 0, 2048)
+        if not match:
+            return False
+        try:
+            obj, _ = parse_object(self.buf, match.end())
+        except PdfError:
+            return False
+        return isinstance(obj, dict) and "Linearized" in obj
+
+    def pages(self):
+        """List of (page_ref, page_dict) in document order, with inherited
+        attributes (MediaBox, CropBox, Resources, Rotate) filled in"""
+        if self._pages is not None:
+            return self._pages
+        pages = []
+        inheritable = ("MediaBox", "CropBox", "Resources", "Rotate")
+        root = self.catalog.get("Pages")
+        stack = [(root, {})]
+        visited = set()
+        while stack:
+            ref, inherited = stack.pop()
+            if isinstance(ref, PdfRef):
+                if ref in visited:
+                    continue
+                visited.add(ref)
+            node = self.resolve(ref)
+            if not isinstance(node, dict):
+                continue
+            if node.get("Type") == "Pages" or "Kids" in node:
+                attrs = dict(inherited)
+                attrs.update({k: node[k] for k in inheritable if k in node})
+                kids = self.resolve(node.get("Kids")) or []
+                stack.extend((kid, attrs) for kid in reversed(kids))
+            else:
+                page = dict(inherited)
+                page.update(node)
+                pages.append((ref, page))
+        self._pages = pages
+        return pages
+
+    @property
+    def page_count(self):
+        return len(self.pages())
+
+    def page_index(self):
+        """Map page reference -> zero-based page number"""
+        return {ref: i for i, (ref, _page) in enumerate(self.pages())}
+
+    def named_destination(self, name):
+        """Look up a named destination in /Dests or the /Names tree"""
+        key = name.text() if isinstance(name, PdfString) else str(name)
+        dests = self.resolve(self.catalog.get("Dests"))
+        if isinstance(dests, dict) and key in dests:
+            return self.resolve(dests[key])
+        names = self.resolve(self.catalog.get("Names"))
+        tree = self.resolve(names.get("Dests")) if isinstance(names, dict) else None
+        stack = [tree] if tree else []
+        while stack:
+            node = self.resolve(stack.pop())
+            if not isinstance(node, dict):
+                continue
+            entries = self.resolve(node.get("Names")) or []
+            for i in range(0, len(entries) - 1, 2):
+                entry_name = self.resolve(entries[i])
+                if isinstance(entry_name, PdfString) and entry_name.text() == key:
+                    return self.resolve(entries[i + 1])
+            stack.extend(self.resolve(node.get("Kids")) or [])
+        return None
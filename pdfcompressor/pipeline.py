@@ -0,0 +1,74 @@
+"""Assemble the ``compress_func`` a batch runs with.
+
+The layers wrap each other from the inside out: the engine (spawn,
+interpreter pool or direct), page-range splitting for large files, direct
+image recompression for presets that ask for it, automatic level
+selection, the target-size search, the result cache, so a cache hit skips
+everything below it, the preset rules, which pick the quality setting the
+cache key is made with, and finally the pre-flight gate, which rules files
+out before they are hashed.
+"""
+import contextlib
+
+from . import core
+from .auto import AutoCompressor
+from .cache import ResultCache
+from .direct import DirectCompressor
+from .preflight import PreflightGate
+from .presets import PresetRouter
+from .shard import ShardedCompressor
+from .target import TargetSizeCompressor
+
+
+@contextlib.contextmanager
+def open_pipeline(gs_path, engine="spawn", workers=None, engine_options=None,
+                  cache=None, split=None, auto=None, target=None, preflight=None, gs_args=None,
+                  rules=None):
+    """Yield a ready ``compress_func``.
+
+    ``cache`` is a ``ResultCache`` (or None); ``split`` is a dict of
+    ``ShardedCompressor`` options such as ``min_pages``/``min_bytes``
+    (or None to never split); ``auto`` is a dict of ``AutoCompressor``
+    options used when the quality setting is ``core.AUTO_SETTING``;
+    ``target`` is a dict of ``TargetSizeCompressor`` options used when it
+    is ``core.TARGET_SETTING``;
+    ``preflight`` is a dict of ``PreflightGate`` options (or None to
+    compress every file as given); ``gs_args`` are extra Ghostscript
+    arguments for every process, such as ``MemoryBudget.gs_args()``;
+    ``rules`` are ``presets.load_rules`` rules that pick a quality
+    setting per file (None or empty to use the batch setting throughout).
+    """
+    if gs_args:
+        engine_options = dict(engine_options or {}, gs_args=gs_args)
+        if split is not None:
+            split = dict(split, gs_args=gs_args)
+    with contextlib.ExitStack() as stack:
+        compress_func = stack.enter_context(
+            core.open_engine(gs_path, engine, workers=workers, **(engine_options or {})))
+        # Splitting re-renders with Ghostscript, which the direct engine is there to avoid
+        if split is not None and engine != "direct":
+            sharded = stack.enter_context(
+                ShardedCompressor(gs_path, workers=workers, fallback=compress_func, **split))
+            compress_func = sharded.compress
+        if engine != "direct":
+            direct = stack.enter_context(DirectCompressor(compress_func, workers=workers))
+            compress_func = direct.compress
+        auto_compressor = stack.enter_context(
+            AutoCompressor(compress_func, workers=workers, **(auto or {})))
+        compress_func = auto_compressor.compress
+        target_compressor = stack.enter_context(
+            TargetSizeCompressor(compress_func, workers=workers, **(target or {})))
+        compress_func = target_compressor.compress
+        if isinstance(cache, ResultCache):
+            variant = auto_compressor.describe()
+            if target_compressor.target_bytes:
+                variant = dict(variant, **target_compressor.describe())
+            if engine == "direct":
+                # The only engine whose output differs from Ghostscript's
+                variant = dict(variant, engine=engine)
+            compress_func = cache.wrap(gs_path, compress_func, variant=variant)
+        if rules:
+            compress_func = PresetRouter(compress_func, rules).compress
+        if preflight is not None:
+            compress_func = PreflightGate(compress_func, **preflight).compress
+        yield compress_func
@@ -0,0 +1,181 @@
+"""Pre-flight scan: learn what a PDF contains before spending Ghostscript time.
+
+The scan memory-maps the file and walks the cross-reference table. Only
+objects whose first bytes look like an image, font or font descriptor
+are parsed, and stream data is never read, so even very large scans are
+analysed in milliseconds. The report is used to skip files that cannot
+succeed (encrypted with a user password) or will not shrink (small text-only files), to narrow
+the levels auto mode tries, and by the scheduler to estimate how long each
+file will take.
+"""
+import functools
+import os
+import shutil
+import time
+from dataclasses import asdict, dataclass, field
+
+from . import core
+from .pdfparse import PdfDocument, PdfError, PdfName, PdfRef, PdfStream
+
+# Only objects with one of these in their first bytes are parsed
+PEEK_BYTES = 1024
+PEEK_MARKERS = (b"/Image", b"/Font")
+
+# Text-only files smaller than this per page are copied instead of compressed
+DEFAULT_MIN_TEXT_BYTES_PER_PAGE = 12 * 1024
+
+
+@dataclass
+class PreflightReport:
+    """What the pre-flight scan found in one file"""
+    path: str
+    size: int = 0
+    version: str = None
+    pages: int = None
+    images: int = 0
+    image_bytes: int = 0
+    fonts: list = field(default_factory=list)
+    font_bytes: int = 0
+    encrypted: bool = False
+    needs_password: bool = False
+    linearized: bool = False
+    repaired: bool = False
+    error: str = None
+
+    @property
+    def text_only(self):
+        # The objects of encrypted files are not scanned, so their images are unknown
+        return self.error is None and self.images == 0 and not self.encrypted
+
+    @property
+    def image_fraction(self):
+        return self.image_bytes / self.size if self.size else 0.0
+
+    def to_dict(self):
+        data = asdict(self)
+        del data["path"]
+        return data
+
+
+def _scan_objects(doc, report):
+    fonts = set()
+    font_files = set()
+    buf = doc.buf
+    for num in doc.object_numbers():
+        kind, offset, generation = doc.xref[num]
+        if kind == 1:
+            window = buf[offset:offset + PEEK_BYTES]
+            if not any(marker in window for marker in PEEK_MARKERS):
+                continue
+        else:
+            # Objects in object streams are never streams themselves, so
+            # they can be fonts but not images; the third field is an index
+            generation = 0
+        try:
+            obj = doc.get(PdfRef(num, generation))
+        except (PdfError, ValueError, KeyError, TypeError):
+            continue
+        if isinstance(obj, PdfStream):
+            if doc.resolve(obj.get("Subtype")) == "Image":
+                report.images += 1
+                report.image_bytes += obj.length
+            continue
+        if not isinstance(obj, dict):
+            continue
+        object_type = doc.resolve(obj.get("Type"))
+        if object_type == "Font":
+            name = doc.resolve(obj.get("BaseFont"))
+            if isinstance(name, PdfName):
+                fonts.add(str(name))
+        elif object_type == "FontDescriptor":
+            for key in ("FontFile", "FontFile2", "FontFile3"):
+                if isinstance(obj.get(key), PdfRef):
+                    font_files.add(obj[key])
+    for ref in font_files:
+        try:
+            stream = doc.get(ref)
+        except (PdfError, ValueError, KeyError, TypeError):
+            continue
+        if isinstance(stream, PdfStream):
+            report.font_bytes += stream.length
+    report.fonts = sorted(fonts)
+
+
+def analyze(path):
+    """Scan one file; problems are recorded in ``report.error``, never raised"""
+    report = PreflightReport(path, size=core.get_file_size(path))
+    try:
+        with PdfDocument(path) as doc:
+            report.version = doc.version
+            report.encrypted = doc.encrypted
+            report.needs_password = doc.needs_password
+            report.linearized = doc.linearized
+            report.pages = doc.page_count
+            if not report.encrypted:
+                # Strings and streams of encrypted files cannot be read
+                _scan_objects(doc, report)
+            report.repaired = doc.repaired
+    except (PdfError, OSError, ValueError, KeyError, TypeError, IndexError) as e:
+        report.error = str(e) or type(e).__name__
+    return report
+
+
+@functools.lru_cache(maxsize=4096)
+def _analyze_cached(path, _mtime_ns, _size):
+    return analyze(path)
+
+
+def analyze_cached(path):
+    """``analyze`` memoised on (path, mtime, size), so every layer can ask"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return analyze(path)
+    return _analyze_cached(path, stat.st_mtime_ns, stat.st_size)
+
+
+class PreflightError(RuntimeError):
+    """Raised for files the pre-flight scan rules out"""
+
+
+class PreflightGate:
+    """``compress_func`` that skips or copies files the scan rules out"""
+
+    def __init__(self, compress_func, min_text_bytes_per_page=DEFAULT_MIN_TEXT_BYTES_PER_PAGE):
+        self.compress_func = compress_func
+        self.min_text_bytes_per_page = min_text_bytes_per_page
+
+    def verdict(self, report):
+        """'skip' (cannot succeed), 'copy' (will not shrink) or None"""
+        if report.needs_password:
+            return "skip"
+        if (report.text_only and report.pages
+                and report.size / report.pages < self.min_text_bytes_per_page):
+            return "copy"
+        return None
+
+    def fan_out(self, input_path, quality_setting):
+        return core.fan_out(self.compress_func, input_path, quality_setting)
+
+    def compress(self, input_path, output_path, quality_setting, **options):
+        start = time.perf_counter()
+        report = analyze_cached(input_path)
+        extra = {"pages": report.pages, "images": report.images,
+                 "preflight_time": round(time.perf_counter() - start, 3)}
+        verdict = self.verdict(report)
+        if verdict == "skip":
+            raise PreflightError("PDF terenkripsi, dilewati (encrypted PDF skipped)")
+        # A copy could be over the budget of target-size mode, which must say so
+        if verdict == "copy" and quality_setting != core.TARGET_SETTING:
+            shutil.copyfile(input_path, output_path)
+            extra["preflight"] = "copied: text-only"
+            return extra
+        try:
+            result = core.call_compress(self.compress_func, input_path, output_path, quality_setting, **options)
+        except core.GhostscriptError as e:
+            if report.needs_password is None:
+                # A security handler the scan cannot check: Ghostscript found it needs a password
+                raise PreflightError(f"PDF terenkripsi, dilewati (encrypted PDF skipped): {e}") from e
+            raise
+        extra.update(result or {})
+        return extra
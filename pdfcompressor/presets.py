@@ -0,0 +1,394 @@
+"""Custom compression presets and the rules that pick one per document.
+
+A preset is either a ``-dPDFSETTINGS`` name such as ``"/ebook"``, a list
+of Ghostscript arguments, like the built-in levels in
+``core.COMPRESSION_LEVELS``, or a dict of named settings that is compiled
+into such a list::
+
+    {"base": "/ebook", "color_dpi": 150, "gray_dpi": 150, "mono_dpi": 300,
+     "downsample_type": "/Bicubic", "downsample_threshold": 1.5,
+     "jpeg_quality": 60, "compatibility": "1.5", "fast_web_view": true}
+
+``"engine": "direct"`` recompresses only the images of each file,
+without a Ghostscript re-render (see ``direct``).
+
+Custom presets live in ``settings.json`` under ``"custom_presets"``.
+The GUI lists them after the built-in levels, and the command line
+selects them by name with ``--presets FILE``. ``"preset_rules"`` maps
+documents to a preset by file name, size or page count; the first rule
+that matches a file wins, and files no rule matches use the selected
+level. ``python -m pdfcompressor.bench flags`` measures what each
+argument of a preset costs and saves, and can write a trimmed preset.
+"""
+import fnmatch
+import json
+import math
+import os
+import re
+
+from . import core
+from . import direct
+
+SETTINGS_KEY = "custom_presets"
+RULES_KEY = "preset_rules"
+# Other keys of the GUI's settings.json; a file with any of them is read as
+# settings, not as a bare mapping of preset name -> preset
+GUI_SETTINGS_KEYS = ("theme", "max_workers", "engine", "ghostscript_path", "cache", "cache_dir", "cache_max_mb",
+                     "split_large_files", "split_min_pages", "split_min_mb", "auto_min_dpi", "auto_target_mb",
+                     "auto_target_ratio", "target_size_mb", "preflight", "preflight_text_page_kb", "schedule",
+                     "timings_file", "file_timeout_s", "memory_budget_mb", "job_memory_limit_mb", "dedupe",
+                     "metrics_file", "prometheus_file", "folder_recursive", "folder_include", "folder_exclude")
+
+# Arguments the compressor sets itself, or that would make a preset unsafe
+RESERVED_PREFIXES = ("-sDEVICE", "-sOutputFile", "-o", "-dBATCH", "-dNOPAUSE", "-dQUIET", "-dNOSAFER",
+                     "-dDELAYSAFER", "--permit", "-f", "-c")
+
+DOWNSAMPLE_TYPES = ("/Bicubic", "/Average", "/Subsample")
+COMPATIBILITY_LEVELS = ("1.3", "1.4", "1.5", "1.6", "1.7", "2.0")
+IMAGE_KINDS = (("Color", "color_dpi"), ("Gray", "gray_dpi"), ("Mono", "mono_dpi"))
+PRESET_FIELDS = ("base", "color_dpi", "gray_dpi", "mono_dpi", "downsample_type", "downsample_threshold",
+                 "jpeg_quality", "compatibility", "fast_web_view", "distiller_params", "args", "engine")
+# Distiller parameter names, and the tokens of the PostScript distiller_arguments() writes
+DISTILLER_NAME = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+DISTILLER_TOKEN = re.compile(r"<<|>>|\[|\]|/?[^\s<>\[\]/]+")
+PRESET_ENGINES = ("ghostscript", "direct")
+RULE_FIELDS = ("preset", "pattern", "min_mb", "max_mb", "min_pages", "max_pages")
+
+
+class PresetError(ValueError):
+    pass
+
+
+def jpeg_qfactor(quality):
+    """pdfwrite's JPEG QFactor for an IJG-style quality of 1-100 (1.0 is quality 50)"""
+    scale = 5000 / quality if quality < 50 else 200 - 2 * quality
+    return round(max(scale, 1) / 100, 3)
+
+
+def jpeg_arguments(quality):
+    """Flags and distiller parameters that re-encode colour and grey images
+    as JPEG at ``quality``, as (arguments, params)"""
+    qfactor = jpeg_qfactor(quality)
+    image_dict = {"QFactor": qfactor, "Blend": 1, "HSamples": [2, 1, 1, 2], "VSamples": [2, 1, 1, 2]}
+    arguments = [
+        "-dPassThroughJPEGImages=false",
+        "-dAutoFilterColorImages=false",
+        "-dAutoFilterGrayImages=false",
+        "-dColorImageFilter=/DCTEncode",
+        "-dGrayImageFilter=/DCTEncode",
+    ]
+    return arguments, {"ColorImageDict": image_dict, "GrayImageDict": dict(image_dict)}
+
+
+def _distiller_value(name, key, value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)) and math.isfinite(value):
+        return repr(value)
+    if isinstance(value, str) and value.startswith("/") and DISTILLER_NAME.fullmatch(value[1:]):
+        return value
+    if isinstance(value, list):
+        return "[" + " ".join(_distiller_value(name, key, item) for item in value) + "]"
+    if isinstance(value, dict):
+        return _distiller_dict(name, value)
+    raise PresetError(f"{name}: distiller parameter {key} must be a number, true/false, a /Name, "
+                      f"a list or a dict of them")
+
+
+def _distiller_dict(name, params):
+    items = []
+    for key, value in params.items():
+        if not isinstance(key, str) or not DISTILLER_NAME.fullmatch(key):
+            raise PresetError(f"{name}: not a distiller parameter name: {key!r}")
+        items.append(f"/{key} {_distiller_value(name, key, value)}")
+    return "<< " + " ".join(items) + " >>"
+
+
+def distiller_arguments(name, params):
+    """The ``-c`` segment that sets the distiller parameters ``params``.
+
+    Only PostScript written here reaches Ghostscript: names, numbers,
+    booleans, arrays and dicts of them, followed by ``setdistillerparams``.
+    ``build_command`` moves the segment after the output file.
+    """
+    if not params:
+        return []
+    return ["-c", f"{_distiller_dict(name, params)} setdistillerparams"]
+
+
+def parse_distiller_arguments(arguments):
+    """``params`` back from ``distiller_arguments(name, params)``, or None"""
+    tokens = DISTILLER_TOKEN.findall(arguments[1]) if len(arguments) == 2 and arguments[0] == "-c" else []
+    if not tokens or tokens[-1] != "setdistillerparams":
+        return None
+    stack = [[]]
+    for token in tokens[:-1]:
+        if token in ("<<", "["):
+            stack.append([token])
+            continue
+        if token in (">>", "]"):
+            if len(stack) == 1:
+                return None
+            opener, *items = stack.pop()
+            if (opener == "<<") != (token == ">>"):
+                return None
+            if opener == "<<":
+                keys = items[0::2]
+                if len(items) % 2 or not all(isinstance(k, str) and k.startswith("/") for k in keys):
+                    return None
+                value = {key[1:]: item for key, item in zip(keys, items[1::2])}
+            else:
+                value = items
+        elif token in ("true", "false"):
+            value = token == "true"
+        elif token.startswith("/"):
+            value = token
+        else:
+            try:
+                value = float(token) if any(c in token for c in ".eE") else int(token)
+            except ValueError:
+                return None
+        stack[-1].append(value)
+    if len(stack) != 1 or len(stack[0]) != 1 or not isinstance(stack[0][0], dict):
+        return None
+    return stack[0][0]
+
+
+def _merge_params(base, override):
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = _merge_params(merged[key], value)
+        merged[key] = value
+    return merged
+
+
+def _number(name, spec, key, kind=int, minimum=1, maximum=None):
+    value = spec[key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or (kind is int and value != int(value)):
+        raise PresetError(f"{name}: {key} must be a number")
+    if value < minimum or (maximum is not None and value > maximum):
+        limits = f"{minimum}-{maximum}" if maximum is not None else f"at least {minimum}"
+        raise PresetError(f"{name}: {key} must be {limits}")
+    return kind(value)
+
+
+def _name(name, spec, key, choices):
+    value = spec[key]
+    if isinstance(value, str) and key != "compatibility" and not value.startswith("/"):
+        value = "/" + value
+    matches = [choice for choice in choices if isinstance(value, str) and choice.lower() == value.lower()]
+    if not matches:
+        raise PresetError(f"{name}: {key} must be one of {', '.join(choices)}")
+    return matches[0]
+
+
+def compile_preset(name, spec):
+    """Ghostscript arguments for a preset given as a dict of named settings"""
+    unknown = sorted(set(spec) - set(PRESET_FIELDS))
+    if unknown:
+        raise PresetError(f"{name}: unknown setting {', '.join(unknown)} (known: {', '.join(PRESET_FIELDS)})")
+    base = spec.get("base", "/default")
+    if not isinstance(base, str) or not base:
+        raise PresetError(f"{name}: base must be a -dPDFSETTINGS name such as /ebook")
+    arguments = [f"-dPDFSETTINGS={base if base.startswith('/') else '/' + base}"]
+    for kind, key in IMAGE_KINDS:
+        if key in spec:
+            arguments += [f"-dDownsample{kind}Images=true",
+                          f"-d{kind}ImageResolution={_number(name, spec, key, maximum=2400)}"]
+    if "downsample_type" in spec:
+        value = _name(name, spec, "downsample_type", DOWNSAMPLE_TYPES)
+        arguments += [f"-d{kind}ImageDownsampleType={value}" for kind, _key in IMAGE_KINDS]
+    if "downsample_threshold" in spec:
+        value = _number(name, spec, "downsample_threshold", kind=float, minimum=1.0, maximum=10.0)
+        arguments += [f"-d{kind}ImageDownsampleThreshold={value}" for kind, _key in IMAGE_KINDS]
+    if "compatibility" in spec:
+        spec = dict(spec, compatibility=str(spec["compatibility"]))
+        arguments.append(f"-dCompatibilityLevel={_name(name, spec, 'compatibility', COMPATIBILITY_LEVELS)}")
+    if "fast_web_view" in spec:
+        if not isinstance(spec["fast_web_view"], bool):
+            raise PresetError(f"{name}: fast_web_view must be true or false")
+        arguments.append(f"-dFastWebView={'true' if spec['fast_web_view'] else 'false'}")
+    arguments += _check_arguments(name, spec.get("args", []))
+    if spec.get("engine", "ghostscript") not in PRESET_ENGINES:
+        raise PresetError(f"{name}: engine must be one of {', '.join(PRESET_ENGINES)}")
+    if spec.get("engine") == "direct":
+        arguments.append(direct.ENGINE_FLAG)
+    params = {}
+    if "jpeg_quality" in spec:
+        jpeg_flags, params = jpeg_arguments(_number(name, spec, "jpeg_quality", maximum=100))
+        arguments += jpeg_flags
+    if "distiller_params" in spec:
+        if not isinstance(spec["distiller_params"], dict):
+            raise PresetError(f"{name}: distiller_params must map parameter names to values")
+        params = _merge_params(params, spec["distiller_params"])
+    # One -c segment, after every -d flag
+    return arguments + distiller_arguments(name, params)
+
+
+def _check_arguments(name, arguments):
+    if not isinstance(arguments, list):
+        raise PresetError(f"{name}: expected a list of Ghostscript arguments")
+    for arg in arguments:
+        if not isinstance(arg, str) or not arg.startswith("-"):
+            raise PresetError(f"{name}: not a Ghostscript argument: {arg!r}")
+        if arg == "-c":
+            raise PresetError(f"{name}: PostScript (-c) is not allowed, set distiller_params instead")
+        if arg.split("=", 1)[0] in RESERVED_PREFIXES or arg.startswith("--permit"):
+            raise PresetError(f"{name}: {arg} is set by the compressor")
+    return list(arguments)
+
+
+def validate_preset(name, setting):
+    """Return ``setting`` in the form ``build_command`` takes, or raise PresetError"""
+    if not name or not isinstance(name, str):
+        raise PresetError("a preset needs a name")
+    if name in core.COMPRESSION_LEVELS or name.lower() in core.LEVEL_ALIASES:
+        raise PresetError(f"{name}: the name of a built-in level")
+    if isinstance(setting, str):
+        if not setting.startswith("/"):
+            raise PresetError(f"{name}: expected a -dPDFSETTINGS name such as /ebook, or a list of arguments")
+        return setting
+    if isinstance(setting, dict):
+        return compile_preset(name, setting)
+    if not isinstance(setting, list) or not setting:
+        raise PresetError(f"{name}: expected a non-empty list of Ghostscript arguments")
+    return _check_arguments(name, setting)
+
+
+def load_presets(data):
+    """Valid presets in ``data`` (a settings dict, or just the presets).
+
+    Returns ({name: setting}, [problems]); invalid presets are left out.
+    """
+    if isinstance(data, dict) and SETTINGS_KEY in data:
+        data = data[SETTINGS_KEY]
+    if not isinstance(data, dict):
+        return {}, [f"{SETTINGS_KEY} must map preset names to settings"]
+    presets = {}
+    problems = []
+    for name, setting in data.items():
+        try:
+            presets[name] = validate_preset(name, setting)
+        except PresetError as e:
+            problems.append(str(e))
+    return presets, problems
+
+
+def validate_rule(rule, presets=None):
+    """A rule with its preset resolved to a quality setting, or raise PresetError"""
+    if not isinstance(rule, dict) or "preset" not in rule:
+        raise PresetError(f"rule {rule!r}: needs a \"preset\"")
+    unknown = sorted(set(rule) - set(RULE_FIELDS))
+    if unknown:
+        raise PresetError(f"rule for {rule['preset']}: unknown key {', '.join(unknown)}")
+    try:
+        setting = core.resolve_level(rule["preset"], presets)
+    except KeyError as e:
+        raise PresetError(f"rule for {rule['preset']}: {e.args[0]}")
+    patterns = rule.get("pattern", [])
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    if not isinstance(patterns, list) or not all(isinstance(p, str) and p for p in patterns):
+        raise PresetError(f"rule for {rule['preset']}: pattern must be a file name pattern or a list of them")
+    checked = {"preset": rule["preset"], "setting": setting, "pattern": patterns}
+    for key in ("min_mb", "max_mb", "min_pages", "max_pages"):
+        if key in rule:
+            checked[key] = _number(f"rule for {rule['preset']}", rule, key,
+                                   kind=float if key.endswith("_mb") else int, minimum=0)
+    if len(checked) == 3 and not patterns:
+        raise PresetError(f"rule for {rule['preset']}: needs a pattern, size or page condition")
+    return checked
+
+
+def load_rules(data, presets=None):
+    """Valid rules in ``data`` (a settings dict, or just the rule list).
+
+    Returns ([rule], [problems]); invalid rules are left out, the order
+    of the others is kept.
+    """
+    if isinstance(data, dict):
+        data = data.get(RULES_KEY, [])
+    if not isinstance(data, list):
+        return [], [f"{RULES_KEY} must be a list of rules"]
+    rules = []
+    problems = []
+    for rule in data:
+        try:
+            rules.append(validate_rule(rule, presets))
+        except PresetError as e:
+            problems.append(str(e))
+    return rules, problems
+
+
+def read_presets(path):
+    """(presets, rules, problems) from a JSON file, e.g. the GUI's settings.json"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    # A settings file (custom presets and/or rules among other settings), or just the presets
+    settings_file = isinstance(data, dict) and any(
+        key in data for key in (SETTINGS_KEY, RULES_KEY) + GUI_SETTINGS_KEYS)
+    presets, problems = load_presets(data.get(SETTINGS_KEY, {}) if settings_file else data)
+    rules, rule_problems = load_rules(data, presets) if settings_file else ([], [])
+    return presets, rules, problems + rule_problems
+
+
+def _page_count(path):
+    # Imported here: the scan is only needed when a rule counts pages
+    from .preflight import analyze_cached
+    return analyze_cached(path).pages
+
+
+def rule_matches(rule, path):
+    """Whether ``rule`` applies to the file at ``path``"""
+    if rule["pattern"]:
+        name = os.path.basename(path).lower()
+        full = path.replace(os.sep, "/").lower()
+        if not any(fnmatch.fnmatchcase(full if "/" in pattern else name, pattern.lower())
+                   for pattern in rule["pattern"]):
+            return False
+    if "min_mb" in rule or "max_mb" in rule:
+        size_mb = core.get_file_size(path) / (1024 * 1024)
+        if size_mb < rule.get("min_mb", 0) or ("max_mb" in rule and size_mb > rule["max_mb"]):
+            return False
+    if "min_pages" in rule or "max_pages" in rule:
+        pages = _page_count(path)
+        if pages is None or pages < rule.get("min_pages", 0) or \
+                ("max_pages" in rule and pages > rule["max_pages"]):
+            return False
+    return True
+
+
+def select_rule(rules, path):
+    """First rule in ``rules`` that applies to ``path``, or None"""
+    for rule in rules:
+        if rule_matches(rule, path):
+            return rule
+    return None
+
+
+class PresetRouter:
+    """``compress_func`` that compresses each file with the preset of the first matching rule"""
+
+    def __init__(self, compress_func, rules):
+        self.compress_func = compress_func
+        self.rules = list(rules)
+
+    def select(self, input_path):
+        return select_rule(self.rules, input_path)
+
+    def fan_out(self, input_path, quality_setting):
+        rule = self.select(input_path)
+        if rule is not None:
+            quality_setting = rule["setting"]
+        return core.fan_out(self.compress_func, input_path, quality_setting)
+
+    def compress(self, input_path, output_path, quality_setting, progress=None, cancel=None):
+        rule = self.select(input_path)
+        if rule is not None:
+            quality_setting = rule["setting"]
+        extra = core.call_compress(self.compress_func, input_path, output_path, quality_setting,
+                                   progress=progress, cancel=cancel)
+        if rule is None:
+            return extra
+        return dict(extra or {}, preset=rule["preset"])
@@ -0,0 +1,208 @@
+"""Longest-first batch scheduling with a cost model learned from past runs.
+
+The batch runner hands jobs to its workers in submission order. In
+selection order, one large file submitted last can leave every other
+worker idle while it finishes. Submitting the most expensive files first
+(longest processing time, LPT) keeps the tail short. A file's cost is
+estimated as ``seconds_per_mb * size + seconds_per_page * pages``. The
+two rates are fitted per quality setting from the timings of earlier
+batches and saved between runs.
+"""
+import heapq
+import json
+import os
+import tempfile
+import threading
+
+from .preflight import analyze_cached
+from .presets import select_rule
+
+# Rates used until a quality setting has enough history of its own
+PRIOR_SECONDS_PER_MB = 0.5
+PRIOR_SECONDS_PER_PAGE = 0.05
+MAX_SAMPLES = 200
+MIN_SAMPLES = 5
+ORDERS = ("lpt", "fifo")
+
+
+def default_model_path():
+    """Per-user file the learned rates are kept in"""
+    if os.name == 'nt':
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "MaximumPDFCompressor", "timings.json")
+    base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "pdfcompressor", "timings.json")
+
+
+def fit_rates(samples):
+    """Least-squares (seconds_per_mb, seconds_per_page) through the origin.
+
+    ``samples`` are (megabytes, pages, seconds). Falls back to a single
+    cost-per-megabyte ratio when the two features cannot be separated.
+    """
+    sxx = sum(mb * mb for mb, _p, _s in samples)
+    sxy = sum(mb * pages for mb, pages, _s in samples)
+    syy = sum(pages * pages for _mb, pages, _s in samples)
+    sxt = sum(mb * seconds for mb, _p, seconds in samples)
+    syt = sum(pages * seconds for _mb, pages, seconds in samples)
+    det = sxx * syy - sxy * sxy
+    if det > 1e-9 * max(sxx * syy, 1e-12):
+        per_mb = (sxt * syy - syt * sxy) / det
+        per_page = (syt * sxx - sxt * sxy) / det
+        if per_mb >= 0 and per_page >= 0:
+            return per_mb, per_page
+    total_mb = sum(mb for mb, _p, _s in samples)
+    if total_mb <= 0:
+        return PRIOR_SECONDS_PER_MB, PRIOR_SECONDS_PER_PAGE
+    return sum(seconds for _mb, _p, seconds in samples) / total_mb, 0.0
+
+
+def setting_key(quality_setting):
+    """JSON-safe key of a quality setting; argument lists are joined"""
+    if isinstance(quality_setting, str):
+        return quality_setting
+    return " ".join(quality_setting)
+
+
+class CostModel:
+    """Per-quality-setting compression rates, persisted as JSON"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.samples = {}
+        self._rates = {}
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        samples = data.get("samples", {}) if isinstance(data, dict) else {}
+        self.samples = {key: [tuple(s) for s in value][-MAX_SAMPLES:] for key, value in samples.items()}
+        self._rates = {}
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            data = json.dumps({"samples": self.samples})
+        fd, tmp_path = tempfile.mkstemp(prefix=".timings-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def rates(self, quality_setting):
+        """(seconds_per_mb, seconds_per_page) for ``quality_setting``"""
+        key = setting_key(quality_setting)
+        with self._lock:
+            if key not in self._rates:
+                samples = self.samples.get(key, [])
+                if len(samples) < MIN_SAMPLES:
+                    rates = (PRIOR_SECONDS_PER_MB, PRIOR_SECONDS_PER_PAGE)
+                else:
+                    rates = fit_rates(samples)
+                self._rates[key] = rates
+            return self._rates[key]
+
+    def estimate(self, quality_setting, size, pages=None):
+        """Expected seconds to compress a file of ``size`` bytes"""
+        per_mb, per_page = self.rates(quality_setting)
+        return per_mb * size / (1024 * 1024) + per_page * (pages or 0)
+
+    def record(self, quality_setting, size, pages, seconds):
+        key = setting_key(quality_setting)
+        with self._lock:
+            samples = self.samples.setdefault(key, [])
+            samples.append((size / (1024 * 1024), pages or 0, seconds))
+            del samples[:-MAX_SAMPLES]
+            self._rates.pop(key, None)
+
+
+def simulate_makespan(durations, workers):
+    """Finish time of ``durations`` handed in order to ``workers`` idle workers"""
+    free_at = [0.0] * max(1, min(workers, len(durations) or 1))
+    for duration in durations:
+        heapq.heappush(free_at, heapq.heappop(free_at) + duration)
+    return max(free_at)
+
+
+class Scheduler:
+    """Orders a batch longest-first and learns from how long files took.
+
+    ``rules`` are the batch's preset rules: files a rule sends to another
+    preset are estimated, and learned from, with that preset's rates.
+    """
+
+    def __init__(self, model=None, order="lpt", scan=True, rules=None):
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order {order!r}; choose from {', '.join(ORDERS)}")
+        self.model = model if model is not None else CostModel()
+        self.order = order
+        self.scan = scan
+        self.rules = list(rules or [])
+        self._rule_settings = {rule["preset"]: rule["setting"] for rule in self.rules}
+
+    def _features(self, input_path):
+        if self.scan:
+            report = analyze_cached(input_path)
+            return report.size, report.pages
+        try:
+            return os.path.getsize(input_path), None
+        except OSError:
+            return 0, None
+
+    def setting_for(self, input_path, quality_setting):
+        """The quality setting ``input_path`` will be compressed with"""
+        rule = select_rule(self.rules, input_path) if self.rules else None
+        return rule["setting"] if rule is not None else quality_setting
+
+    def estimate(self, input_path, quality_setting):
+        size, pages = self._features(input_path)
+        return self.model.estimate(self.setting_for(input_path, quality_setting), size, pages)
+
+    def order_jobs(self, jobs, quality_setting):
+        """Jobs in the order they should be submitted"""
+        jobs = list(jobs)
+        if self.order == "fifo":
+            return jobs
+        return sorted(jobs, key=lambda job: self.estimate(job[0], quality_setting), reverse=True)
+
+    def record(self, batch, quality_setting):
+        """Learn from files that really ran (not cached, copied or failed)"""
+        for result in batch.results:
+            if not result.ok or result.extra.get("cache") == "hit" or result.extra.get("preflight") \
+                    or "duplicate_of" in result.extra:
+                continue
+            _size, pages = self._features(result.input_path)
+            # PresetRouter names the preset a rule picked
+            setting = self._rule_settings.get(result.extra.get("preset"), quality_setting)
+            self.model.record(setting, result.original_size, pages, result.elapsed)
+
+    def makespan_report(self, batch, submitted_jobs, selection_order, workers):
+        """Compare the order used with selection order, using measured times.
+
+        Both makespans are simulated from the per-file times of this batch,
+        so they are comparable with each other (not with wall time, which
+        also includes start-up and scheduling overhead).
+        """
+        elapsed = {r.input_path: r.elapsed for r in batch.results}
+        used = simulate_makespan([elapsed.get(path, 0.0) for path, _out in submitted_jobs], workers)
+        fifo = simulate_makespan([elapsed.get(path, 0.0) for path, _out in selection_order], workers)
+        return {
+            "order": self.order,
+            "makespan": used,
+            "fifo_makespan": fifo,
+            "improvement": (fifo - used) / fifo * 100 if fifo else 0.0,
+            "wall_time": batch.elapsed,
+        }
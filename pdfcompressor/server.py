@@ -0,0 +1,476 @@
+"""Local HTTP compression service: ``python -m pdfcompressor.server``
+
+Other tools upload a PDF, poll the job and download the result::
+
+    POST   /jobs?level=ebook&name=scan.pdf   body: the PDF    -> 202 + job
+    GET    /jobs/<id>                        job status
+    GET    /jobs/<id>/result                 the compressed PDF
+    DELETE /jobs/<id>                        cancel the job, delete its files
+    GET    /metrics                          queue depth, running jobs, totals, latency
+    GET    /metrics?format=prometheus        the same in Prometheus text format
+    GET    /health
+
+Uploads are streamed to disk in chunks, never held in memory. At most
+``max_uploads`` bodies are received at once, and a body over
+``max_bytes`` is refused with 413. Jobs wait in a bounded queue for one
+of ``workers`` compression threads. When the queue is full, new uploads
+are refused with 503 and a Retry-After header. Finished jobs and their
+files are deleted after ``keep`` seconds. The service has no
+authentication, so it listens on localhost unless told otherwise.
+"""
+import argparse
+import asyncio
+import contextlib
+import http
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from . import core
+from .cli import (add_compression_arguments, add_metrics_arguments, check_compression_arguments,
+                  ghostscript_args, memory_budget_for, open_metrics, pipeline_options)
+from .control import BatchControl
+from .metrics import MetricsRecorder
+from .pipeline import open_pipeline
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_MB = 200
+DEFAULT_MAX_UPLOADS = 8
+DEFAULT_KEEP = 3600
+CHUNK_SIZE = 64 * 1024
+HEAD_LIMIT = 16 * 1024
+RETRY_AFTER = 5
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class Job:
+    """One uploaded file and what became of it"""
+
+    def __init__(self, job_id, name, quality_setting, input_path, output_path):
+        self.id = job_id
+        self.name = name
+        self.quality_setting = quality_setting
+        self.input_path = input_path
+        self.output_path = output_path
+        self.status = QUEUED
+        self.created = time.time()
+        # Clock the queue wait is measured with
+        self.queued_at = time.perf_counter()
+        self.started = None
+        self.finished = None
+        self.result = None
+
+    def to_dict(self):
+        data = {"id": self.id, "name": self.name, "status": self.status, "created": self.created,
+                "started": self.started, "finished": self.finished}
+        if self.result is not None:
+            data.update(original_size=self.result.original_size, compressed_size=self.result.compressed_size,
+                        elapsed=round(self.result.elapsed, 3), error=self.result.error)
+            data.update({k: v for k, v in self.result.extra.items()
+                         if k in ("auto_level", "target", "cache", "peak_rss", "queue_wait", "gs_time")})
+        if self.status == DONE:
+            data["result"] = f"/jobs/{self.id}/result"
+        return data
+
+
+class CompressionService:
+    """Job queue and worker pool behind the HTTP handlers"""
+
+    def __init__(self, compress_func, quality_setting, work_dir, workers=None, queue_size=None,
+                 max_bytes=DEFAULT_MAX_MB * 1024 * 1024, max_uploads=DEFAULT_MAX_UPLOADS, keep=DEFAULT_KEEP,
+                 batch_control=None, memory_budget=None, presets=None, metrics=None):
+        self.compress_func = compress_func
+        self.quality_setting = quality_setting
+        self.presets = presets or {}
+        self.work_dir = work_dir
+        self.workers = max(1, workers or core.default_workers())
+        self.queue_size = queue_size or 4 * self.workers
+        self.max_bytes = max_bytes
+        self.max_uploads = max_uploads
+        self.keep = keep
+        self.batch_control = batch_control or BatchControl()
+        self.memory_budget = memory_budget
+        self.recorder = metrics or MetricsRecorder()
+        self.jobs = {}
+        self.running = 0
+        self.uploading = 0
+        self.started = time.time()
+        self.totals = {"accepted": 0, "done": 0, "failed": 0, "cancelled": 0, "rejected_full": 0,
+                       "rejected_size": 0, "bytes_in": 0, "bytes_out": 0}
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        # Created in run(), inside the event loop
+        self._queue = None
+        self._upload_slots = None
+
+    # Jobs
+
+    def metrics(self):
+        queued = [job for job in self.jobs.values() if job.status == QUEUED]
+        oldest = min((job.created for job in queued), default=None)
+        summary = self.recorder.summary()
+        return dict(self.totals, queue_depth=self._queue.qsize() if self._queue else 0,
+                    queue_size=self.queue_size, running=self.running, workers=self.workers,
+                    uploading=self.uploading, max_uploads=self.max_uploads, jobs=len(self.jobs),
+                    oldest_queued_seconds=round(time.time() - oldest, 3) if oldest else 0,
+                    uptime=round(time.time() - self.started, 3),
+                    **{key: summary[key] for key in ("latency_p50", "latency_p95", "queue_wait_p50",
+                                                     "queue_wait_p95", "mb_per_s", "files_per_min")})
+
+    def prometheus(self):
+        metrics = self.metrics()
+        return self.recorder.prometheus(gauges={
+            key: metrics[key] for key in ("queue_depth", "running", "uploading", "jobs",
+                                          "oldest_queued_seconds")})
+
+    def _compress(self, job):
+        result = core._run_job(self.compress_func, job.input_path, job.output_path, job.quality_setting,
+                               batch_control=self.batch_control, memory_budget=self.memory_budget,
+                               queued_at=job.queued_at)
+        self.batch_control.forget(job.input_path)
+        return result
+
+    async def _worker(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            job = await self._queue.get()
+            if job.status != QUEUED:
+                # Cancelled while it was waiting
+                continue
+            job.status = RUNNING
+            job.started = time.time()
+            self.running += 1
+            try:
+                job.result = await loop.run_in_executor(self._executor, self._compress, job)
+            finally:
+                self.running -= 1
+            job.finished = time.time()
+            self.recorder.record(job.result)
+            if job.result.ok:
+                job.status = DONE
+                self.totals["done"] += 1
+                self.totals["bytes_out"] += job.result.compressed_size
+            elif job.result.extra.get("cancelled"):
+                job.status = CANCELLED
+                self.totals["cancelled"] += 1
+            else:
+                job.status = FAILED
+                self.totals["failed"] += 1
+            # Only the result is kept
+            _remove(job.input_path)
+
+    def _drop(self, job):
+        self.jobs.pop(job.id, None)
+        _remove(job.input_path)
+        _remove(job.output_path)
+
+    async def _janitor(self):
+        while True:
+            await asyncio.sleep(min(60, max(1, self.keep)))
+            expired = time.time() - self.keep
+            for job in list(self.jobs.values()):
+                if job.finished is not None and job.finished < expired:
+                    self._drop(job)
+
+    # HTTP
+
+    async def _handle(self, reader, writer):
+        try:
+            method, path, query, headers = await _read_head(reader)
+            await self._route(method, path, query, headers, reader, writer)
+        except HttpError as e:
+            with contextlib.suppress(ConnectionError):
+                await _send_json(writer, e.status, {"error": e.message}, e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, query, headers, reader, writer):
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"] and method == "GET":
+            await _send_json(writer, 200, {"status": "ok"})
+        elif parts == ["metrics"] and method == "GET":
+            if query.get("format") == "prometheus":
+                body = self.prometheus().encode("utf-8")
+                writer.write(_head(200, "text/plain; version=0.0.4", len(body)) + body)
+                await writer.drain()
+            else:
+                await _send_json(writer, 200, self.metrics())
+        elif parts == ["jobs"] and method == "POST":
+            job = await self._upload(query, headers, reader, writer)
+            await _send_json(writer, 202, job.to_dict(), {"Location": f"/jobs/{job.id}"})
+        elif len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HttpError(404, "no such job")
+            if len(parts) == 2 and method == "GET":
+                await _send_json(writer, 200, job.to_dict())
+            elif len(parts) == 2 and method == "DELETE":
+                self._cancel(job)
+                await _send_json(writer, 200, job.to_dict())
+            elif parts[2:] == ["result"] and method == "GET":
+                await self._send_result(job, writer)
+            else:
+                raise HttpError(405, "method not allowed")
+        else:
+            raise HttpError(404, "not found")
+
+    async def _upload(self, query, headers, reader, writer):
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HttpError(411, "send the PDF with a Content-Length")
+        try:
+            length = int(headers["content-length"])
+        except (KeyError, ValueError):
+            raise HttpError(411, "send the PDF with a Content-Length")
+        if length > self.max_bytes:
+            self.totals["rejected_size"] += 1
+            raise HttpError(413, f"upload is larger than {core.format_file_size(self.max_bytes)}")
+        quality_setting = self.quality_setting
+        if "level" in query:
+            try:
+                quality_setting = core.resolve_level(query["level"], self.presets)
+            except KeyError as e:
+                raise HttpError(400, e.args[0])
+        if self._queue.full():
+            self.totals["rejected_full"] += 1
+            # Read the body anyway, so the client gets to see the answer
+            await _discard(reader, length)
+            raise HttpError(503, "queue is full, try again later", {"Retry-After": str(RETRY_AFTER)})
+        if headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+
+        name = os.path.basename(query.get("name", "")) or "upload.pdf"
+        job_id = uuid.uuid4().hex
+        input_path = os.path.join(self.work_dir, f"{job_id}.pdf")
+        job = Job(job_id, name, quality_setting, input_path, core.generate_output_path(input_path))
+        async with self._upload_slots:
+            self.uploading += 1
+            try:
+                await _receive(reader, input_path, length)
+            except BaseException:
+                _remove(input_path)
+                raise
+            finally:
+                self.uploading -= 1
+        try:
+            # The queue may have filled up during the upload
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            _remove(input_path)
+            self.totals["rejected_full"] += 1
+            raise HttpError(503, "queue is full, try again later", {"Retry-After": str(RETRY_AFTER)})
+        self.jobs[job_id] = job
+        self.totals["accepted"] += 1
+        self.totals["bytes_in"] += length
+        return job
+
+    def _cancel(self, job):
+        if job.status == QUEUED:
+            job.status = CANCELLED
+            job.finished = time.time()
+            self.totals["cancelled"] += 1
+            self._drop(job)
+        elif job.status == RUNNING:
+            # The worker records the outcome and removes the input
+            self.batch_control.cancel_job(job.input_path)
+        else:
+            self._drop(job)
+
+    async def _send_result(self, job, writer):
+        if job.status != DONE:
+            raise HttpError(409, f"job is {job.status}")
+        stem = os.path.splitext(job.name)[0]
+        headers = {"Content-Disposition": f'attachment; filename="{stem}{core.OUTPUT_SUFFIX}.pdf"'}
+        try:
+            f = open(job.output_path, 'rb')
+        except OSError:
+            raise HttpError(410, "result is gone")
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            writer.write(_head(200, "application/pdf", size, headers))
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+
+    async def run(self, host=DEFAULT_HOST, port=DEFAULT_PORT, on_ready=None):
+        """Serve until SIGINT/SIGTERM (or until the task is cancelled)"""
+        loop = asyncio.get_event_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._upload_slots = asyncio.Semaphore(self.max_uploads)
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl+C raises KeyboardInterrupt instead
+                pass
+        tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        tasks.append(asyncio.ensure_future(self._janitor()))
+        server = await asyncio.start_server(self._handle, host, port, limit=HEAD_LIMIT)
+        try:
+            if on_ready:
+                on_ready(server.sockets[0].getsockname())
+            await stop.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            self.batch_control.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._executor.shutdown(wait=True)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def _read_head(reader):
+    """(method, path, query, headers) of the next request"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError:
+        raise HttpError(431, "request head is too large")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "bad request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    url = urlsplit(target)
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    return method.upper(), url.path, query, headers
+
+
+async def _receive(reader, path, length):
+    """Stream ``length`` body bytes to ``path``, checking that it is a PDF"""
+    received = 0
+    with open(path, 'wb') as f:
+        while received < length:
+            chunk = await reader.read(min(CHUNK_SIZE, length - received))
+            if not chunk:
+                raise ConnectionError("upload cut short")
+            if received == 0 and b"%PDF-" not in chunk[:1024]:
+                await _discard(reader, length - len(chunk))
+                raise HttpError(415, "upload is not a PDF")
+            f.write(chunk)
+            received += len(chunk)
+
+
+async def _discard(reader, length):
+    while length > 0:
+        chunk = await reader.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            return
+        length -= len(chunk)
+
+
+def _head(status, content_type, length, headers=None):
+    lines = [f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}",
+             f"Content-Type: {content_type}",
+             f"Content-Length: {length}",
+             "Connection: close"]
+    lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _send_json(writer, status, data, headers=None):
+    body = json.dumps(data).encode("utf-8")
+    writer.write(_head(status, "application/json", len(body), headers) + body)
+    await writer.drain()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pdfcompressor.server",
+        description="Local HTTP service that compresses uploaded PDFs.")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help=f"address to listen on (default: {DEFAULT_HOST}; there is no authentication)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"default: {DEFAULT_PORT}")
+    add_compression_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument("--queue-size", type=int, metavar="N",
+                        help="jobs that may wait for a worker before uploads are refused (default: 4 per job)")
+    parser.add_argument("--max-mb", type=int, default=DEFAULT_MAX_MB, metavar="MB",
+                        help=f"largest upload accepted (default: {DEFAULT_MAX_MB})")
+    parser.add_argument("--max-uploads", type=int, default=DEFAULT_MAX_UPLOADS, metavar="N",
+                        help=f"uploads received at the same time (default: {DEFAULT_MAX_UPLOADS})")
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP, metavar="SECONDS",
+                        help=f"how long finished jobs and results are kept (default: {DEFAULT_KEEP})")
+    parser.add_argument("--work-dir", help="where uploads and results are stored (default: a temporary folder)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    checked = check_compression_arguments(args)
+    if checked is None:
+        return 2
+    quality_setting, gs_path = checked
+    recorder = open_metrics(args)
+    if recorder is None:
+        return 2
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="pdfc-server-")
+    os.makedirs(work_dir, exist_ok=True)
+
+    batch_control = BatchControl(timeout=args.timeout)
+    memory_budget = memory_budget_for(args)
+
+    def ready(address):
+        print(f"listening on http://{address[0]}:{address[1]}/ (work folder: {work_dir})", file=sys.stderr)
+
+    try:
+        with open_pipeline(gs_path, gs_args=ghostscript_args(gs_path, args, memory_budget),
+                          **pipeline_options(args)) as compress_func:
+            service = CompressionService(compress_func, quality_setting, work_dir, workers=args.jobs,
+                                         queue_size=args.queue_size, max_bytes=args.max_mb * 1024 * 1024,
+                                         max_uploads=args.max_uploads, keep=args.keep,
+                                         batch_control=batch_control, memory_budget=memory_budget,
+                                         presets=args.custom_presets, metrics=recorder)
+            asyncio.run(service.run(args.host, args.port, on_ready=ready))
+    except KeyboardInterrupt:
+        batch_control.cancel()
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        recorder.close()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""Page-range sharding: compress one large PDF on several cores.
+
+The input is split into contiguous page ranges that are compressed in
+parallel (``-dFirstPage``/``-dLastPage``), then merged by a final
+Ghostscript pass that copies the already-compressed shards without
+re-encoding their images. Shards lose cross-page structure, so bookmarks,
+link annotations, document info and the initial page mode are read from
+the original with ``pdfparse`` and re-applied during the merge as
+pdfmarks. Documents whose structure cannot be carried over this way
+(encrypted files, forms, non-link annotations) are never split.
+"""
+import functools
+import os
+import threading
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from . import core
+from .pdfparse import PdfDocument, PdfError, PdfName, PdfRef, PdfString, serialize
+from .preflight import analyze_cached
+
+DEFAULT_MIN_PAGES = 300
+DEFAULT_MIN_BYTES = 100 * 1024 * 1024
+MIN_PAGES_PER_SHARD = 10
+
+# Shards carry no annotations or outlines; the merge pass adds them back
+SHARD_ARGS = ["-dPreserveAnnots=false", "-dNO_PDFMARK_OUTLINES"]
+
+# Copy shards into one file without downsampling or lossy re-encoding
+MERGE_ARGS = [
+    "-dAutoRotatePages=/None",
+    "-dPassThroughJPEGImages=true",
+    "-dPassThroughJPXImages=true",
+    "-dDownsampleColorImages=false",
+    "-dDownsampleGrayImages=false",
+    "-dDownsampleMonoImages=false",
+    "-dAutoFilterColorImages=false",
+    "-dAutoFilterGrayImages=false",
+    "-dColorImageFilter=/FlateEncode",
+    "-dGrayImageFilter=/FlateEncode",
+]
+
+DOCINFO_KEYS = ("Title", "Author", "Subject", "Keywords", "Creator", "CreationDate", "ModDate", "Trapped")
+FIT_COORDINATES = {
+    # Which destination operands are x (0) or y (1) coordinates
+    "XYZ": (0, 1, None),
+    "FitH": (1,),
+    "FitBH": (1,),
+    "FitV": (0,),
+    "FitBV": (0,),
+    "FitR": (0, 1, 0, 1),
+}
+
+
+def page_ranges(page_count, shards):
+    """Split 1..page_count into ``shards`` contiguous (first, last) ranges"""
+    shards = max(1, min(shards, page_count))
+    size, extra = divmod(page_count, shards)
+    ranges = []
+    first = 1
+    for i in range(shards):
+        last = first + size - 1 + (1 if i < extra else 0)
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+class DocumentStructure:
+    """What the merge pass must restore, as pdfmark PostScript"""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.page_count = doc.page_count
+        self._index = doc.page_index()
+        self._origins = [self._origin(page) for _ref, page in doc.pages()]
+        self.marks = []
+
+    def _origin(self, page):
+        box = self.doc.resolve(page.get("MediaBox")) or [0, 0, 612, 792]
+        box = [self.doc.resolve(v) for v in box]
+        try:
+            return min(box[0], box[2]), min(box[1], box[3])
+        except (TypeError, IndexError):
+            return 0, 0
+
+    def _destination(self, dest):
+        """pdfmark /Page and /View entries for a destination, or None"""
+        resolve = self.doc.resolve
+        dest = resolve(dest)
+        if isinstance(dest, (PdfString, PdfName)):
+            dest = self.doc.named_destination(dest)
+        if isinstance(dest, dict):
+            dest = resolve(dest.get("D"))
+        if not isinstance(dest, list) or not dest:
+            return None
+        target = dest[0]
+        if isinstance(target, PdfRef):
+            page = self._index.get(target)
+        elif isinstance(target, int):
+            page = target
+        else:
+            page = None
+        if page is None or not 0 <= page < self.page_count:
+            return None
+
+        fit = resolve(dest[1]) if len(dest) > 1 else PdfName("Fit")
+        operands = [resolve(v) for v in dest[2:]]
+        origin = self._origins[page]
+        for i, axis in enumerate(FIT_COORDINATES.get(str(fit), ())):
+            if axis is not None and i < len(operands) and isinstance(operands[i], (int, float)):
+                operands[i] = operands[i] - origin[axis]
+        return {"Page": page + 1, "View": [PdfName(fit)] + operands}
+
+    def _action(self, item):
+        """pdfmark entries for a /Dest or /A on an outline item or link"""
+        resolve = self.doc.resolve
+        if "Dest" in item:
+            return self._destination(item["Dest"])
+        action = resolve(item.get("A"))
+        if not isinstance(action, dict):
+            return None
+        kind = resolve(action.get("S"))
+        if kind == "GoTo":
+            return self._destination(action.get("D"))
+        if kind == "URI":
+            return {"Action": {"Subtype": PdfName("URI"), "URI": resolve(action.get("URI"))}}
+        if kind == "Named":
+            return {"Action": {"Subtype": PdfName("Named"), "N": resolve(action.get("N"))}}
+        return None
+
+    def _emit(self, entries, kind):
+        body = b" ".join(serialize(PdfName(k)) + b" " + serialize(v) for k, v in entries.items())
+        self.marks.append(b"[" + body + b" /" + kind.encode() + b" pdfmark\n")
+
+    def add_docinfo(self):
+        info = {}
+        for key in DOCINFO_KEYS:
+            value = self.doc.resolve(self.doc.info.get(key))
+            if isinstance(value, (PdfString, PdfName)):
+                info[key] = value
+        if info:
+            self._emit(info, "DOCINFO")
+        mode = self.doc.resolve(self.doc.catalog.get("PageMode"))
+        if isinstance(mode, PdfName):
+            self._emit({"PageMode": mode}, "DOCVIEW")
+
+    def add_outlines(self):
+        resolve = self.doc.resolve
+        root = resolve(self.doc.catalog.get("Outlines"))
+        if not isinstance(root, dict):
+            return
+        visited = set()
+
+        def children(node):
+            item_ref = node.get("First")
+            while isinstance(item_ref, PdfRef) and item_ref not in visited:
+                visited.add(item_ref)
+                item = resolve(item_ref)
+                if not isinstance(item, dict):
+                    break
+                yield item
+                item_ref = item.get("Next")
+
+        # Outline pdfmarks are emitted in pre-order; /Count is the number of
+        # direct children, negative when the entry starts out closed
+        stack = [list(children(root))[::-1]]
+        while stack:
+            if not stack[-1]:
+                stack.pop()
+                continue
+            item = stack[-1].pop()
+            kids = list(children(item))
+            title = resolve(item.get("Title"))
+            entries = {"Title": title if isinstance(title, PdfString) else PdfString(b"")}
+            if kids:
+                closed = isinstance(resolve(item.get("Count")), int) and resolve(item.get("Count")) < 0
+                entries["Count"] = -len(kids) if closed else len(kids)
+            entries.update(self._action(item) or {})
+            self._emit(entries, "OUT")
+            if kids:
+                stack.append(kids[::-1])
+
+    def add_links(self):
+        resolve = self.doc.resolve
+        for page_number, (_ref, page) in enumerate(self.doc.pages()):
+            origin = self._origins[page_number]
+            for annot in resolve(page.get("Annots")) or []:
+                annot = resolve(annot)
+                if not isinstance(annot, dict) or resolve(annot.get("Subtype")) != "Link":
+                    continue
+                target = self._action(annot)
+                rect = [resolve(v) for v in resolve(annot.get("Rect")) or []]
+                if not target or len(rect) != 4:
+                    continue
+                rect = [rect[0] - origin[0], rect[1] - origin[1], rect[2] - origin[0], rect[3] - origin[1]]
+                border = resolve(annot.get("Border")) or [0, 0, 0]
+                entries = {"Rect": rect, "Border": [resolve(v) for v in border],
+                           "SrcPg": page_number + 1, "Subtype": PdfName("Link")}
+                entries.update(target)
+                self._emit(entries, "ANN")
+
+    def pdfmarks(self):
+        self.marks = []
+        self.add_docinfo()
+        self.add_outlines()
+        self.add_links()
+        return b"%!PS\n" + b"".join(self.marks)
+
+
+def check_splittable(doc):
+    """Reason the document must not be split, or None if it can be"""
+    if doc.encrypted:
+        return "encrypted"
+    if "AcroForm" in doc.catalog:
+        return "has form fields"
+    for _ref, page in doc.pages():
+        for annot in doc.resolve(page.get("Annots")) or []:
+            annot = doc.resolve(annot)
+            if isinstance(annot, dict) and doc.resolve(annot.get("Subtype")) != "Link":
+                return "has non-link annotations"
+    return None
+
+
+class ShardedCompressor:
+    """``compress_func`` that splits large documents across several cores.
+
+    Files below both thresholds, or that cannot be split safely, go to
+    ``fallback`` (spawn-per-file by default) unchanged.
+    """
+
+    def __init__(self, gs_path, workers=None, min_pages=DEFAULT_MIN_PAGES,
+                 min_bytes=DEFAULT_MIN_BYTES, fallback=None, gs_args=()):
+        self.gs_path = gs_path
+        self.gs_args = tuple(gs_args)
+        self.workers = max(1, workers or core.default_workers())
+        self.min_pages = min_pages
+        self.min_bytes = min_bytes
+        self.fallback = fallback or functools.partial(core.compress_pdf, gs_path, gs_args=self.gs_args)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def plan(self, input_path):
+        """(page ranges, pdfmarks) for a file worth splitting, else None"""
+        size = core.get_file_size(input_path)
+        try:
+            with PdfDocument(input_path) as doc:
+                pages = doc.page_count
+                big_enough = pages >= self.min_pages or size >= self.min_bytes
+                shards = min(self.workers, pages // MIN_PAGES_PER_SHARD)
+                if not big_enough or shards < 2 or check_splittable(doc):
+                    return None
+                return page_ranges(pages, shards), DocumentStructure(doc).pdfmarks()
+        except (PdfError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def fan_out(self, input_path, quality_setting):
+        """Shards a file would be split into (all run at once), from the pre-flight scan"""
+        report = analyze_cached(input_path)
+        pages = report.pages or 0
+        shards = min(self.workers, pages // MIN_PAGES_PER_SHARD)
+        if shards >= 2 and (pages >= self.min_pages or report.size >= self.min_bytes):
+            return shards
+        return core.fan_out(self.fallback, input_path, quality_setting)
+
+    def _compress_range(self, input_path, shard_path, quality_setting, first, last,
+                        progress=None, cancel=None):
+        command = core.build_command(self.gs_path, input_path, shard_path, quality_setting, self.gs_args)
+        index = command.index(f"-sOutputFile={shard_path}")
+        command[index:index] = [f"-dFirstPage={first}", f"-dLastPage={last}"] + SHARD_ARGS
+        return core.run_ghostscript(command, progress, cancel)
+
+    def _merge(self, shard_paths, marks_path, output_path, cancel=None):
+        command = core.build_command(self.gs_path, shard_paths[0], output_path, MERGE_ARGS, self.gs_args)
+        command += shard_paths[1:] + [marks_path]
+        return core.run_ghostscript(command, cancel=cancel)
+
+    def compress(self, input_path, output_path, quality_setting, progress=None, cancel=None):
+        plan = self.plan(input_path)
+        if plan is None:
+            return core.call_compress(self.fallback, input_path, output_path, quality_setting,
+                                      progress=progress, cancel=cancel)
+        ranges, marks = plan
+
+        shard_progress = [None] * len(ranges)
+        if progress is not None:
+            # Sum the pages finished by every shard into one document-wide count
+            total_pages = ranges[-1][1]
+            done = [0] * len(ranges)
+            lock = threading.Lock()
+
+            def report(index, pages, _total):
+                with lock:
+                    done[index] = pages
+                    progress(sum(done), total_pages)
+
+            shard_progress = [functools.partial(report, i) for i in range(len(ranges))]
+
+        work_dir = tempfile.mkdtemp(prefix=".pdfc-shards-", dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            shard_paths = [os.path.join(work_dir, f"shard-{i:04d}.pdf") for i in range(len(ranges))]
+            futures = [self._executor.submit(self._compress_range, input_path, path, quality_setting,
+                                             first, last, shard_progress[i], cancel)
+                       for i, (path, (first, last)) in enumerate(zip(shard_paths, ranges))]
+            # Let every shard finish before the work folder is removed
+            errors = [future.exception() for future in futures]
+            for error in errors:
+                if error is not None:
+                    raise error
+            marks_path = os.path.join(work_dir, "structure.ps")
+            with open(marks_path, 'wb') as f:
+                f.write(marks)
+            usages = [future.result() for future in futures]
+            usages.append(self._merge(shard_paths, marks_path, output_path, cancel))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return dict(core.merge_usage(usages) or {}, shards=len(ranges))
@@ -0,0 +1,213 @@
+"""Synthetic PDFs for benchmarking without a private document corpus.
+
+Every file is generated deterministically from a seed, using only the
+standard library. The set covers the document kinds the presets treat
+differently: plain text, long text (splittable), grayscale scans, RGB
+photos and a file that repeats the same image on every page. With
+``object_streams`` a file is written the PDF 1.5 way, with its
+dictionaries packed into an object stream and a cross-reference stream
+instead of a table.
+"""
+import os
+import random
+import zlib
+
+A4 = (595, 842)
+
+
+class _Writer:
+    """Minimal PDF writer: numbered objects plus a classic xref table, or
+    an object stream and an xref stream with ``object_streams``"""
+
+    def __init__(self, object_streams=False):
+        self.objects = []
+        self.object_streams = object_streams
+
+    def reserve(self):
+        self.objects.append(None)
+        return len(self.objects)
+
+    def set(self, num, body):
+        self.objects[num - 1] = body
+
+    def add(self, body):
+        num = self.reserve()
+        self.set(num, body)
+        return num
+
+    def add_stream(self, entries, data, compress=True):
+        if compress:
+            data = zlib.compress(data, 6)
+            entries += " /Filter /FlateDecode"
+        return self.add(b"<< %s /Length %d >>\nstream\n" % (entries.encode(), len(data)) + data + b"\nendstream")
+
+    def write(self, path, root):
+        if self.object_streams:
+            self._write_compact(path, root)
+            return
+        out = bytearray(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for num, body in enumerate(self.objects, 1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.objects) + 1)
+        out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(self.objects) + 1, root, xref)
+        with open(path, 'wb') as f:
+            f.write(out)
+
+    def _write_compact(self, path, root):
+        out = bytearray(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+        # (type, field 2, field 3) per object: 1 = at an offset, 2 = in the object stream
+        entries = [(0, 0, 0xFFFF)]
+        packed = []
+        for num, body in enumerate(self.objects, 1):
+            if b"\nstream\n" in body:
+                entries.append((1, len(out), 0))
+                out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+            else:
+                entries.append((2, len(self.objects) + 1, len(packed)))
+                packed.append((num, body))
+        header = bytearray()
+        data = bytearray()
+        for num, body in packed:
+            header += b"%d %d " % (num, len(data))
+            data += body + b"\n"
+        objstm = zlib.compress(bytes(header) + bytes(data), 6)
+        entries.append((1, len(out), 0))
+        out += (b"%d 0 obj\n<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>\nstream\n"
+                % (len(self.objects) + 1, len(packed), len(header), len(objstm)) + objstm + b"\nendstream\nendobj\n")
+        xref = len(out)
+        entries.append((1, xref, 0))
+        rows = zlib.compress(b"".join(bytes([kind]) + field.to_bytes(4, "big") + index.to_bytes(2, "big")
+                                      for kind, field, index in entries), 6)
+        out += (b"%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 2] /Root %d 0 R /Filter /FlateDecode /Length %d >>\n"
+                b"stream\n" % (len(self.objects) + 2, len(entries), root, len(rows)) + rows + b"\nendstream\nendobj\n")
+        out += b"startxref\n%d\n%%%%EOF\n" % xref
+        with open(path, 'wb') as f:
+            f.write(out)
+
+
+def _text_content(rng, page_number):
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "pdf", "kompresi", "laporan",
+             "halaman", "data", "nilai", "tabel", "ringkasan", "catatan"]
+    lines = [b"BT /F1 10 Tf 12 TL 56 780 Td"]
+    lines.append(b"(Halaman %d) Tj T*" % page_number)
+    for _ in range(60):
+        text = " ".join(rng.choice(words) for _ in range(12))
+        lines.append(b"(%s) ' " % text.encode())
+    lines.append(b"ET")
+    return b"\n".join(lines)
+
+
+def _gradient_image(rng, width, height, channels, noise):
+    """Smooth gradient with ``noise`` (0-1) of each row replaced by random bytes"""
+    row_bytes = width * channels
+    cache = {}
+    rows = []
+    for y in range(height):
+        base = (y * 255) // max(1, height - 1)
+        if base not in cache:
+            cache[base] = bytes((base + (x * 96) // row_bytes) & 255 for x in range(row_bytes))
+        noisy = int(row_bytes * noise * rng.random())
+        rows.append(cache[base][:row_bytes - noisy])
+        if noisy:
+            rows.append(rng.getrandbits(8 * noisy).to_bytes(noisy, "little"))
+    return b"".join(rows)
+
+
+def _document(path, page_specs, writer=None, object_streams=False):
+    """Write a PDF whose pages are (content, {name: image_obj}) pairs.
+
+    ``writer`` may already hold the image objects the pages refer to.
+    """
+    writer = writer or _Writer(object_streams)
+    catalog = writer.reserve()
+    pages = writer.reserve()
+    font = writer.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    kids = []
+    for content, images in page_specs:
+        xobjects = " ".join(f"/{name} {num} 0 R" for name, num in images.items())
+        contents = writer.add_stream("", content)
+        kids.append(writer.add(
+            (f"<< /Type /Page /Parent {pages} 0 R /MediaBox [0 0 {A4[0]} {A4[1]}] "
+             f"/Resources << /Font << /F1 {font} 0 R >> /XObject << {xobjects} >> >> "
+             f"/Contents {contents} 0 R >>").encode()))
+    writer.set(pages, (f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] "
+                       f"/Count {len(kids)} >>").encode())
+    writer.set(catalog, f"<< /Type /Catalog /Pages {pages} 0 R >>".encode())
+    writer.write(path, catalog)
+
+
+def text_pdf(path, pages, seed=1, object_streams=False):
+    rng = random.Random(seed)
+    _document(path, [(_text_content(rng, i + 1), {}) for i in range(pages)], object_streams=object_streams)
+
+
+def scan_pdf(path, pages, width=1240, height=1754, seed=2, object_streams=False):
+    """Full-page grayscale images, like a 150 dpi scan"""
+    rng = random.Random(seed)
+    writer = _Writer(object_streams)
+    specs = []
+    for _ in range(pages):
+        data = _gradient_image(rng, width, height, 1, noise=0.3)
+        image = writer.add_stream(f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                                  f"/ColorSpace /DeviceGray /BitsPerComponent 8", data)
+        specs.append((f"q {A4[0]} 0 0 {A4[1]} 0 0 cm /Im1 Do Q".encode(), {"Im1": image}))
+    _document(path, specs, writer)
+
+
+def photo_pdf(path, pages, width=1600, height=1200, seed=3, object_streams=False):
+    """One large RGB image per page"""
+    rng = random.Random(seed)
+    writer = _Writer(object_streams)
+    specs = []
+    for _ in range(pages):
+        data = _gradient_image(rng, width, height, 3, noise=0.6)
+        image = writer.add_stream(f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                                  f"/ColorSpace /DeviceRGB /BitsPerComponent 8", data)
+        specs.append((b"q 480 0 0 360 57 400 cm /Im1 Do Q", {"Im1": image}))
+    _document(path, specs, writer)
+
+
+def duplicates_pdf(path, pages, seed=4, object_streams=False):
+    """Text pages that each embed their own copy of the same logo"""
+    rng = random.Random(seed)
+    logo = _gradient_image(random.Random(seed), 400, 400, 3, noise=0.2)
+    writer = _Writer(object_streams)
+    specs = []
+    for i in range(pages):
+        image = writer.add_stream("/Type /XObject /Subtype /Image /Width 400 /Height 400 "
+                                  "/ColorSpace /DeviceRGB /BitsPerComponent 8", logo)
+        content = _text_content(rng, i + 1) + b"\nq 100 0 0 100 460 720 cm /Im1 Do Q"
+        specs.append((content, {"Im1": image}))
+    _document(path, specs, writer)
+
+
+# (file name prefix, generator, pages at scale 1)
+CORPUS = [
+    ("text", text_pdf, 20),
+    ("text-long", text_pdf, 300),
+    ("scan-gray", scan_pdf, 8),
+    ("photo-rgb", photo_pdf, 4),
+    ("logo-duplicates", duplicates_pdf, 12),
+]
+
+
+def generate_corpus(directory, scale=1.0):
+    """Write the synthetic corpus to ``directory``; returns the file paths.
+
+    ``scale`` multiplies every page count. Files already generated with
+    the same page count are reused.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for prefix, generator, pages in CORPUS:
+        pages = max(1, int(pages * scale))
+        path = os.path.join(directory, f"{prefix}-{pages}p.pdf")
+        if not os.path.exists(path):
+            generator(path, pages)
+        paths.append(path)
+    return paths
@@ -0,0 +1,256 @@
+"""Target-size mode: the best quality that fits a byte budget.
+
+Upload portals often reject files above a fixed size. With the quality
+setting ``core.TARGET_SETTING`` the image resolution and JPEG quality are
+searched for the largest output that is still at most the budget, in a
+few rounds of Ghostscript runs that execute in parallel:
+
+1. The first round runs the smallest setting (lowest resolution and
+   quality) next to a medium one. When even the smallest output is over
+   the budget, the file fails right away instead of after every preset.
+2. Output size is modelled as ``fixed + images * scale``, where ``scale``
+   grows with the square of the resolution and with the JPEG quality.
+   Both terms are fitted to the runs so far.
+3. Each further round runs the settings predicted to land just under the
+   budget, plus the cheapest one predicted to land over it, as the model
+   is only an estimate. Settings that cannot do better than what was
+   already measured are never run.
+
+The search stops once an output is within ``tolerance`` of the budget, or
+when no untried setting can come closer. Files already within the budget
+are copied unchanged.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+from . import core
+from .auto import is_valid_output
+from .control import JobControl
+from .preflight import analyze_cached
+from .presets import compile_preset
+
+# Resolutions (dpi) and JPEG qualities searched, best first
+DPI_STEPS = (300, 250, 200, 175, 150, 125, 110, 100, 90, 80, 72, 60, 50)
+# JPEG size relative to quality 75, for a typical photo
+QUALITY_SCALE = {95: 2.6, 85: 1.5, 75: 1.0, 65: 0.85, 55: 0.74, 45: 0.63, 35: 0.52, 25: 0.41}
+REFERENCE_DPI = 150
+# An output this close under the budget ends the search
+DEFAULT_TOLERANCE = 0.05
+MAX_ROUNDS = 4
+
+
+class TargetSizeError(RuntimeError):
+    """Raised when no setting brings a file within the budget"""
+
+
+def image_scale(dpi, quality):
+    """Relative size of the images at ``dpi`` and JPEG ``quality``"""
+    return (dpi / REFERENCE_DPI) ** 2 * QUALITY_SCALE[quality]
+
+
+def setting_for(dpi, quality):
+    """Ghostscript arguments for one point of the search"""
+    return compile_preset(f"target {dpi} dpi", {
+        "base": "/ebook", "color_dpi": dpi, "gray_dpi": dpi, "mono_dpi": min(600, dpi * 2),
+        "downsample_type": "/Bicubic", "downsample_threshold": 1.0, "jpeg_quality": quality,
+    })
+
+
+class SizeModel:
+    """``size = fixed + images * image_scale(dpi, quality)``, least-squares fitted"""
+
+    def __init__(self):
+        self.fixed = 0.0
+        self.images = 0.0
+
+    def fit(self, points):
+        """``points`` are (image scale, measured size) pairs"""
+        n = len(points)
+        if not n:
+            return
+        mean_x = sum(x for x, _size in points) / n
+        mean_y = sum(size for _x, size in points) / n
+        spread = sum((x - mean_x) ** 2 for x, _size in points)
+        if spread > 0:
+            self.images = sum((x - mean_x) * (size - mean_y) for x, size in points) / spread
+            self.fixed = mean_y - self.images * mean_x
+        if spread <= 0 or self.images < 0:
+            # Images make no difference (or there is only one point)
+            self.images, self.fixed = 0.0, mean_y
+        elif self.fixed < 0:
+            self.fixed = 0.0
+            self.images = sum(x * size for x, size in points) / sum(x * x for x, _size in points)
+
+    def predict(self, dpi, quality):
+        return self.fixed + self.images * image_scale(dpi, quality)
+
+
+class TargetSizeCompressor:
+    """``compress_func`` that handles ``core.TARGET_SETTING`` by searching
+    resolution and JPEG quality for the byte budget ``target_bytes``.
+
+    Any other quality setting goes straight to ``compress_func``.
+    """
+
+    def __init__(self, compress_func, workers=None, target_bytes=None, min_dpi=0,
+                 tolerance=DEFAULT_TOLERANCE):
+        self.compress_func = compress_func
+        self.workers = max(1, workers or core.default_workers())
+        self.target_bytes = target_bytes
+        self.min_dpi = min_dpi or 0
+        self.tolerance = tolerance
+        self.dpi_steps = [dpi for dpi in DPI_STEPS if dpi >= self.min_dpi] or [max(DPI_STEPS)]
+        self.qualities = sorted(QUALITY_SCALE, reverse=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def describe(self):
+        """Options that change the outcome; part of the result cache key"""
+        return {"target_bytes": self.target_bytes, "target_min_dpi": self.min_dpi}
+
+    def first_round(self):
+        """The smallest setting, a medium one and, with workers to spare, the largest"""
+        points = [(self.dpi_steps[-1], self.qualities[-1]),
+                  (self.dpi_steps[len(self.dpi_steps) // 2], 75)]
+        if self.workers >= 3:
+            points.append((self.dpi_steps[0], self.qualities[0]))
+        return list(dict.fromkeys(points))
+
+    def next_round(self, model, measured):
+        """Untried settings worth running, given the sizes ``measured`` so far"""
+        budget = self.target_bytes
+        over = [point for point, size in measured.items() if size is not None and size > budget]
+        under = [point for point, size in measured.items() if size is not None and size <= budget]
+        candidates = []
+        for dpi in self.dpi_steps:
+            for quality in self.qualities:
+                if (dpi, quality) in measured:
+                    continue
+                # At least as large as a setting that was over the budget ...
+                if any(dpi >= d and quality >= q for d, q in over):
+                    continue
+                # ... or at most as large as one that already fits: neither can win
+                if any(dpi <= d and quality <= q for d, q in under):
+                    continue
+                candidates.append((model.predict(dpi, quality), dpi, quality))
+        fitting = sorted((c for c in candidates if c[0] <= budget), reverse=True)
+        missing = sorted(c for c in candidates if c[0] > budget)
+        if not fitting:
+            return [(dpi, quality) for _size, dpi, quality in missing[:self.workers]]
+        picks = fitting[:max(1, self.workers - 1)]
+        if missing and self.workers > 1:
+            picks.append(missing[0])
+        return [(dpi, quality) for _size, dpi, quality in picks]
+
+    def fan_out(self, input_path, quality_setting):
+        if quality_setting != core.TARGET_SETTING:
+            return core.fan_out(self.compress_func, input_path, quality_setting)
+        runs = 1 if analyze_cached(input_path).text_only else self.workers
+        floor = setting_for(self.dpi_steps[-1], self.qualities[-1])
+        return runs * core.fan_out(self.compress_func, input_path, floor)
+
+    def _run_point(self, input_path, work_dir, point, cancel, progress):
+        dpi, quality = point
+        path = os.path.join(work_dir, f"target-{dpi}-{quality}.pdf")
+        extra = core.call_compress(self.compress_func, input_path, path, setting_for(dpi, quality),
+                                   progress=progress, cancel=cancel)
+        return point, path, extra
+
+    def compress(self, input_path, output_path, quality_setting, progress=None, cancel=None):
+        if quality_setting != core.TARGET_SETTING:
+            return core.call_compress(self.compress_func, input_path, output_path, quality_setting,
+                                      progress=progress, cancel=cancel)
+        if not self.target_bytes:
+            raise TargetSizeError("Target-size mode needs a target size")
+        budget = self.target_bytes
+        original_size = core.get_file_size(input_path)
+        if original_size <= budget:
+            shutil.copyfile(input_path, output_path)
+            return {"target": "original", "target_runs": 0}
+
+        report = analyze_cached(input_path)
+        leader = {"done": 0}
+        lock = threading.Lock()
+
+        def show(done, total):
+            # Every run starts at page 0; report the one furthest along
+            with lock:
+                if done > leader["done"]:
+                    leader["done"] = done
+                    progress(done, total)
+
+        work_dir = tempfile.mkdtemp(prefix=".pdfc-target-", dir=os.path.dirname(os.path.abspath(output_path)))
+        measured = {}
+        outputs = {}
+        usages = []
+        last_error = None
+        model = SizeModel()
+        try:
+            # Without images only fonts and structure can shrink: one run tells all
+            points = self.first_round()[:1] if report.text_only else self.first_round()
+            floor = points[0]
+            for _round in range(MAX_ROUNDS):
+                round_cancel = JobControl.linked_to(cancel)
+                futures = [self._executor.submit(self._run_point, input_path, work_dir, point, round_cancel,
+                                                 show if progress else None)
+                           for point in points]
+                for future in as_completed(futures):
+                    try:
+                        point, path, extra = future.result()
+                    except (core.CompressionCancelled, CancelledError):
+                        continue
+                    except Exception as e:
+                        # A setting that fails on this document drops out
+                        last_error = e
+                        continue
+                    usages.append(extra)
+                    size = core.get_file_size(path)
+                    if not is_valid_output(path, report.pages):
+                        measured[point] = None
+                        continue
+                    measured[point] = size
+                    outputs[point] = path
+                    if point == floor and size > budget:
+                        # Nothing can be smaller: stop the other runs of this round
+                        round_cancel.set()
+                        for other in futures:
+                            other.cancel()
+                round_cancel.set()
+                if cancel is not None and cancel.is_set():
+                    raise core.CompressionCancelled()
+                floor_size = measured.get(floor)
+                if floor_size is None:
+                    if last_error is not None:
+                        raise last_error
+                    raise TargetSizeError("Ghostscript produced no valid output")
+                if floor_size > budget:
+                    raise TargetSizeError(
+                        f"Ukuran target {core.format_file_size(budget)} tidak tercapai, hasil terkecil "
+                        f"{core.format_file_size(floor_size)} (target cannot be reached at {floor[0]} dpi, "
+                        f"JPEG {floor[1]})")
+                best = max((size, point) for point, size in measured.items()
+                           if size is not None and size <= budget)
+                if best[0] >= budget * (1 - self.tolerance) or report.text_only:
+                    break
+                model.fit([(image_scale(*point), size) for point, size in measured.items() if size is not None])
+                points = self.next_round(model, measured)
+                if not points:
+                    break
+
+            size, (dpi, quality) = best
+            os.replace(outputs[(dpi, quality)], output_path)
+            usage = core.merge_usage(usages) or {}
+            return dict(usage, target=f"{dpi} dpi, JPEG {quality}", target_runs=len(usages))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
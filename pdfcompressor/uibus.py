@@ -0,0 +1,81 @@
+"""Coalesced state updates from worker threads to a UI thread.
+
+Worker threads ``post`` the latest value of a piece of state (progress,
+status text, ...) instead of scheduling a UI callback for every change.
+The UI thread ``drain``s the bus a fixed number of times per second and
+only sees the newest value of each key, so a thousand updates between
+two frames cost one redraw. One-off actions that must all run, in order,
+after the state they follow (a final message box) go through ``call``.
+
+Nothing here imports a GUI toolkit; ``pump`` only needs a widget with
+Tk's ``after`` method.
+"""
+import threading
+
+# Frames per second the UI drains the bus at
+DEFAULT_FPS = 30
+
+
+class UpdateBus:
+    """Latest value per key, written by any thread and read by the UI thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+        self._calls = []
+        self.posted = 0
+        self.applied = 0
+
+    def post(self, key, value):
+        """Set ``key`` to ``value``; replaces a value the UI has not seen yet"""
+        with self._lock:
+            self._state[key] = value
+            self.posted += 1
+
+    def call(self, func, *args, **kwargs):
+        """Run ``func`` on the UI thread after the state posted so far"""
+        with self._lock:
+            self._calls.append((self._state, func, args, kwargs))
+            self._state = {}
+            self.posted += 1
+
+    def drain(self):
+        """(state, calls) posted since the last drain.
+
+        ``calls`` is a list of (state before the call, func, args, kwargs);
+        apply each state before running its call, then ``state``.
+        """
+        with self._lock:
+            state, self._state = self._state, {}
+            calls, self._calls = self._calls, []
+            self.applied += len(state) + sum(len(call[0]) + 1 for call in calls)
+        return state, calls
+
+    @property
+    def merged(self):
+        """Updates that were replaced before the UI saw them"""
+        return self.posted - self.applied
+
+
+def apply_updates(bus, handlers):
+    """Drain ``bus`` into ``handlers`` (key -> function of the value)"""
+    state, calls = bus.drain()
+    for before, func, args, kwargs in calls:
+        for key, value in before.items():
+            handlers[key](value)
+        func(*args, **kwargs)
+    for key, value in state.items():
+        handlers[key](value)
+
+
+def pump(widget, bus, handlers, fps=DEFAULT_FPS):
+    """Drain ``bus`` into ``handlers`` on ``widget``'s event loop, ``fps`` times a second"""
+    interval = max(1, int(1000 / fps))
+
+    def tick():
+        try:
+            apply_updates(bus, handlers)
+        finally:
+            widget.after(interval, tick)
+
+    widget.after(interval, tick)
@@ -0,0 +1,101 @@
+"""Folder input: PDF files found by walking directory trees.
+
+``iter_pdfs`` is a generator over ``os.scandir``: files are yielded while
+the tree is still being walked, and only the folders waiting to be
+visited are held in memory, so a tree of a million files costs no more
+than a small one. ``iter_jobs`` turns files and folders into
+(input, output) pairs; a folder's outputs mirror its tree under the
+output folder.
+"""
+import fnmatch
+import os
+
+from . import core
+
+
+def matches(relative_path, patterns):
+    """True when a glob in ``patterns`` matches ``relative_path``.
+
+    Patterns with a "/" are matched against the path relative to the
+    walked folder (with "/" separators), others against the name alone.
+    """
+    name = relative_path.rpartition("/")[2]
+    return any(fnmatch.fnmatch(relative_path if "/" in pattern else name, pattern) for pattern in patterns)
+
+
+def is_output_name(name):
+    """Names the compressor gives its outputs, e.g. ``scan_compressed.pdf``"""
+    return os.path.splitext(name)[0].endswith(core.OUTPUT_SUFFIX)
+
+
+def iter_pdfs(root, recursive=False, include=(), exclude=(), skip=(), onerror=None):
+    """PDF files in ``root`` (and its subfolders when ``recursive``).
+
+    ``include`` globs keep only the files they match, ``exclude`` globs
+    drop files and whole folders. Folders in ``skip`` (e.g. the output
+    folder) are not entered, nor are symlinked folders, which could loop.
+    Files named like outputs are skipped, so running twice does not
+    compress the first run's outputs. ``onerror(exc)`` is called for
+    folders that cannot be read. Names are sorted within each folder.
+    """
+    skip = {os.path.normcase(os.path.realpath(path)) for path in skip}
+    stack = [""]
+    while stack:
+        relative = stack.pop()
+        directory = os.path.join(root, relative) if relative else root
+        try:
+            with os.scandir(directory) as scanner:
+                entries = sorted(scanner, key=lambda entry: entry.name)
+        except OSError as e:
+            if onerror is not None:
+                onerror(e)
+            continue
+        folders = []
+        for entry in entries:
+            path = f"{relative}/{entry.name}" if relative else entry.name
+            try:
+                is_folder = entry.is_dir(follow_symlinks=False)
+                is_file = not is_folder and entry.is_file()
+            except OSError:
+                continue
+            if is_folder:
+                if recursive and not matches(path, exclude) \
+                        and (not skip or os.path.normcase(os.path.realpath(entry.path)) not in skip):
+                    folders.append(path)
+            elif is_file and entry.name.lower().endswith(".pdf") and not is_output_name(entry.name) \
+                    and (not include or matches(path, include)) and not matches(path, exclude):
+                yield entry.path
+        # Depth-first, in name order
+        stack.extend(reversed(folders))
+
+
+def mirrored_output_path(input_path, root, output_dir):
+    """Output path for a file found under ``root``: its folder is recreated
+    under ``output_dir`` (created when missing)"""
+    relative_dir = os.path.relpath(os.path.dirname(input_path), root)
+    target_dir = os.path.normpath(os.path.join(output_dir, relative_dir))
+    os.makedirs(target_dir, exist_ok=True)
+    return core.generate_output_path(input_path, target_dir)
+
+
+def iter_jobs(inputs, output_dir=None, recursive=False, include=(), exclude=(), onerror=None):
+    """(input, output) pairs for the files and folders in ``inputs``.
+
+    Files are passed through. Folders are walked lazily with ``iter_pdfs``;
+    with ``output_dir`` their subfolders are recreated under it, without
+    it each output goes next to its input.
+    """
+    for path in inputs:
+        if not os.path.isdir(path):
+            yield path, core.generate_output_path(path, output_dir)
+            continue
+        skip = [output_dir] if output_dir else []
+        for input_path in iter_pdfs(path, recursive, include, exclude, skip, onerror):
+            if output_dir:
+                yield input_path, mirrored_output_path(input_path, path, output_dir)
+            else:
+                yield input_path, core.generate_output_path(input_path)
+
+
+def has_folders(inputs):
+    return any(os.path.isdir(path) for path in inputs)
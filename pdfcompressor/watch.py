@@ -0,0 +1,422 @@
+"""Compress PDFs as they arrive in a folder: ``python -m pdfcompressor.watch``
+
+Scanners and other programs drop files into the folder at any time. A
+file is only taken once its size and mtime have stayed the same for
+``settle`` seconds and it ends with a PDF trailer, so half-written files
+are left alone. Ready files go into a bounded queue served by the worker
+threads; while the queue is full, new files simply wait in the folder
+(backpressure). Changes are picked up with inotify on Linux and by
+polling elsewhere. The folder is also rescanned every minute, which
+catches what inotify cannot see, such as files written to a network
+share by another machine.
+
+Outputs are named by ``core.generate_output_path``. Each version (size
+and mtime) of a file is compressed once; at start-up, files whose output
+is already newer than the input are skipped. A JSON status file reports
+what the watcher is doing, including latency and throughput aggregates.
+"""
+import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import json
+import os
+import queue
+import select
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+from . import core
+from .cli import (add_compression_arguments, add_metrics_arguments, check_compression_arguments,
+                  format_metrics, ghostscript_args, memory_budget_for, open_metrics, pipeline_options,
+                  print_result, signal_handlers)
+from .control import BatchControl
+from .pipeline import open_pipeline
+
+DEFAULT_SETTLE = 2.0
+DEFAULT_POLL = 1.0
+RESCAN_INTERVAL = 60
+STATUS_INTERVAL = 5
+RECENT_RESULTS = 20
+# A file without a PDF trailer is still taken once it has been unchanged
+# for this many settle periods; Ghostscript can often repair it
+TRAILER_GRACE = 10
+
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Names of the files created, written or moved into a folder (Linux)"""
+
+    name = "inotify"
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"cannot watch {folder}")
+
+    def changes(self, timeout):
+        """Names changed within ``timeout`` seconds; None when events were lost"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        names = set()
+        if not readable:
+            return names
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            _wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback that asks for a full rescan after every wait"""
+
+    name = "polling"
+
+    def changes(self, timeout):
+        time.sleep(timeout)
+        return None
+
+    def close(self):
+        pass
+
+
+def open_watcher(folder, polling=False):
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError):
+            # No inotify (or out of watches): poll instead
+            pass
+    return PollingWatcher()
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def has_trailer(path):
+    """Whether the file ends like a complete PDF"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 1024))
+            return b"%%EOF" in f.read()
+    except OSError:
+        # E.g. still locked by the writer on Windows
+        return False
+
+
+class FolderWatch:
+    """Feed the PDFs arriving in ``folder`` to ``compress_func``.
+
+    ``run()`` blocks until ``batch_control`` is cancelled. ``on_result``
+    is called from the worker threads as
+    ``on_result(result, finished, taken)``. Every result is recorded in
+    ``metrics`` (a ``metrics.MetricsRecorder``), if given.
+    """
+
+    def __init__(self, folder, compress_func, quality_setting, output_dir=None, workers=None,
+                 queue_size=None, settle=DEFAULT_SETTLE, poll=DEFAULT_POLL, polling=False,
+                 status_path=None, batch_control=None, memory_budget=None, on_result=None, metrics=None):
+        self.folder = os.path.abspath(folder)
+        self.compress_func = compress_func
+        self.quality_setting = quality_setting
+        self.output_dir = output_dir
+        self.workers = max(1, workers or core.default_workers())
+        self.queue = queue.Queue(maxsize=queue_size or 2 * self.workers)
+        self.settle = settle
+        self.poll = poll
+        self.polling = polling
+        self.status_path = status_path
+        self.batch_control = batch_control or BatchControl()
+        self.memory_budget = memory_budget
+        self.on_result = on_result
+        self.metrics = metrics
+        # Files still being written: path -> [signature, unchanged since]
+        self.pending = {}
+        # Version of each file that was queued or finished: path -> signature
+        self.seen = {}
+        # When each queued file was queued, for its queue wait
+        self.queued_at = {}
+        self.stats = {"done": 0, "failed": 0, "cancelled": 0, "bytes_in": 0, "bytes_out": 0}
+        self.running = 0
+        self.recent = deque(maxlen=RECENT_RESULTS)
+        self.state = "starting"
+        self.last_error = None
+        self.watcher_name = None
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._status_written = 0.0
+
+    def wants(self, path):
+        name = os.path.basename(path)
+        if not name.lower().endswith(".pdf") or name.startswith((".", "~$")):
+            return False
+        same_folder = not self.output_dir or os.path.abspath(self.output_dir) == self.folder
+        # Our own outputs land in the watched folder when there is no output folder
+        return not (same_folder and os.path.splitext(name)[0].endswith(core.OUTPUT_SUFFIX))
+
+    def consider(self, path, startup=False):
+        if not self.wants(path):
+            return
+        signature = _signature(path)
+        if signature is None:
+            self.pending.pop(path, None)
+            return
+        with self._lock:
+            if self.seen.get(path) == signature:
+                return
+            if startup:
+                output = _signature(core.generate_output_path(path, self.output_dir))
+                if output is not None and output[1] >= signature[1]:
+                    # Compressed before the watcher was last stopped
+                    self.seen[path] = signature
+                    return
+        entry = self.pending.get(path)
+        if entry is None or entry[0] != signature:
+            self.pending[path] = [signature, time.monotonic()]
+
+    def scan(self, startup=False):
+        try:
+            with os.scandir(self.folder) as it:
+                paths = [entry.path for entry in it if entry.is_file()]
+        except OSError as e:
+            # E.g. a network share that is briefly gone; try again next time
+            self.last_error = f"cannot read {self.folder}: {e}"
+            return
+        for path in paths:
+            self.consider(path, startup)
+        present = set(paths)
+        for path in list(self.pending):
+            if path not in present:
+                del self.pending[path]
+
+    def promote(self):
+        """Queue the files that have settled, oldest first, while there is room"""
+        now = time.monotonic()
+        for path, (signature, since) in sorted(self.pending.items(), key=lambda item: item[1][1]):
+            current = _signature(path)
+            if current is None:
+                del self.pending[path]
+                continue
+            if current != signature:
+                self.pending[path] = [current, now]
+                continue
+            still = now - since
+            if still < self.settle or (still < self.settle * TRAILER_GRACE and not has_trailer(path)):
+                continue
+            try:
+                self.queued_at[path] = time.perf_counter()
+                self.queue.put_nowait(path)
+            except queue.Full:
+                # Backpressure: the rest stays in the folder until a worker is free
+                break
+            del self.pending[path]
+            with self._lock:
+                self.seen[path] = signature
+            self._dirty = True
+
+    def _work(self):
+        while True:
+            path = self.queue.get()
+            if path is None:
+                return
+            with self._lock:
+                self.running += 1
+            output_path = core.generate_output_path(path, self.output_dir)
+            result = core._run_job(self.compress_func, path, output_path, self.quality_setting,
+                                   batch_control=self.batch_control, memory_budget=self.memory_budget,
+                                   queued_at=self.queued_at.pop(path, None))
+            self.batch_control.forget(path)
+            if self.metrics is not None:
+                self.metrics.record(result)
+            with self._lock:
+                self.running -= 1
+                if result.ok:
+                    self.stats["done"] += 1
+                    self.stats["bytes_in"] += result.original_size
+                    self.stats["bytes_out"] += result.compressed_size
+                elif result.extra.get("cancelled"):
+                    # Stopped before it finished: take it again next time
+                    self.stats["cancelled"] += 1
+                    self.seen.pop(path, None)
+                else:
+                    self.stats["failed"] += 1
+                self.recent.append(result.to_dict())
+                finished = self.stats["done"] + self.stats["failed"]
+                taken = len(self.seen)
+                self._dirty = True
+            if self.on_result:
+                self.on_result(result, finished, taken)
+
+    def status(self):
+        with self._lock:
+            stats = dict(self.stats)
+            running = self.running
+            recent = list(self.recent)
+        saved = 0.0
+        if stats["bytes_in"]:
+            saved = (stats["bytes_in"] - stats["bytes_out"]) / stats["bytes_in"] * 100
+        return dict(stats, folder=self.folder, output_dir=self.output_dir, state=self.state,
+                    watcher=self.watcher_name, pid=os.getpid(), started=self.started, updated=time.time(),
+                    settling=len(self.pending), queued=self.queue.qsize(), running=running,
+                    saved_percent=round(saved, 1), last_error=self.last_error, recent=recent,
+                    metrics=self.metrics.summary() if self.metrics is not None else None)
+
+    def write_status(self, force=False):
+        if not self.status_path:
+            return
+        now = time.monotonic()
+        if not force and not self._dirty and now - self._status_written < STATUS_INTERVAL:
+            return
+        self._dirty = False
+        self._status_written = now
+        directory = os.path.dirname(os.path.abspath(self.status_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".status-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.status(), f, indent=2)
+            # Readers never see a half-written status
+            os.replace(tmp_path, self.status_path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+    def run(self):
+        watcher = open_watcher(self.folder, self.polling)
+        self.watcher_name = watcher.name
+        threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        self.state = "watching"
+        self.scan(startup=True)
+        last_scan = time.monotonic()
+        try:
+            while not self.batch_control.cancelled:
+                self.promote()
+                self.write_status()
+                changes = watcher.changes(self.poll)
+                if changes is None or time.monotonic() - last_scan >= RESCAN_INTERVAL:
+                    self.scan()
+                    last_scan = time.monotonic()
+                else:
+                    for name in changes:
+                        self.consider(os.path.join(self.folder, name))
+        finally:
+            watcher.close()
+            self.state = "stopping"
+            self.batch_control.cancel()
+            # Files still queued are taken again next time
+            while True:
+                try:
+                    path = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                with self._lock:
+                    self.seen.pop(path, None)
+            for _ in threads:
+                self.queue.put(None)
+            for thread in threads:
+                thread.join()
+            self.state = "stopped"
+            self.write_status(force=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pdfcompressor.watch",
+        description="Watch a folder and compress every PDF that is dropped into it.")
+    parser.add_argument("folder", help="folder to watch")
+    parser.add_argument("-o", "--output-dir",
+                        help="output folder (default: the watched folder, with the usual suffix)")
+    add_compression_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE, metavar="SECONDS",
+                        help="take a file once its size and time stamp have not changed for SECONDS "
+                             f"(default: {DEFAULT_SETTLE:g})")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL, metavar="SECONDS",
+                        help=f"how often waiting files are checked (default: {DEFAULT_POLL:g})")
+    parser.add_argument("--polling", action="store_true",
+                        help="rescan the folder every --poll seconds instead of using inotify")
+    parser.add_argument("--queue-size", type=int, metavar="N",
+                        help="files that may wait for a free worker (default: 2 per job)")
+    parser.add_argument("--status", metavar="FILE", help="keep a JSON status file up to date")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print errors")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.isdir(args.folder):
+        print(f"error: not a folder: {args.folder}", file=sys.stderr)
+        return 2
+    checked = check_compression_arguments(args)
+    if checked is None:
+        return 2
+    quality_setting, gs_path = checked
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    recorder = open_metrics(args)
+    if recorder is None:
+        return 2
+
+    batch_control = BatchControl(timeout=args.timeout)
+    memory_budget = memory_budget_for(args)
+    on_result = None if args.quiet else print_result
+    with recorder, signal_handlers(batch_control), \
+            open_pipeline(gs_path, gs_args=ghostscript_args(gs_path, args, memory_budget),
+                          **pipeline_options(args)) as compress_func:
+        watch = FolderWatch(args.folder, compress_func, quality_setting, output_dir=args.output_dir,
+                            workers=args.jobs, queue_size=args.queue_size, settle=args.settle,
+                            poll=args.poll, polling=args.polling, status_path=args.status,
+                            batch_control=batch_control, memory_budget=memory_budget, on_result=on_result,
+                            metrics=recorder)
+        if not args.quiet:
+            print(f"watching {watch.folder}, Ctrl+C to stop", file=sys.stderr)
+        watch.run()
+    status = watch.status()
+    if not args.quiet:
+        print(f"{status['done']} file(s) compressed, {status['failed']} failed, "
+              f"{core.format_file_size(status['bytes_in'])} -> {core.format_file_size(status['bytes_out'])}")
+        line = format_metrics(status["metrics"])
+        if line:
+            print(f"metrics: {line}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
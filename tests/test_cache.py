@@ -0,0 +1,72 @@
+"""Result cache hits, private copies and eviction."""
+import os
+import time
+
+import pytest
+
+from pdfcompressor import cache
+from pdfcompressor.cache import ResultCache
+
+
+@pytest.fixture(autouse=True)
+def fixed_version(monkeypatch):
+    monkeypatch.setattr(cache, "ghostscript_version", lambda gs_path: "10.02.1")
+
+
+def fake_compress(calls):
+    def compress(input_path, output_path, quality_setting, **kwargs):
+        calls.append(input_path)
+        with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+            dst.write(src.read()[:100])
+        return {"gs_time": 1.0}
+    return compress
+
+
+def test_hit_after_miss(tmp_path):
+    source = tmp_path / "in.pdf"
+    source.write_bytes(b"%PDF-1.4 " + b"a" * 500)
+    calls = []
+    compress = ResultCache(str(tmp_path / "cache")).wrap("gs", fake_compress(calls))
+    assert compress(str(source), str(tmp_path / "1.pdf"), "/ebook")["cache"] == "miss"
+    assert compress(str(source), str(tmp_path / "2.pdf"), "/ebook") == {"cache": "hit"}
+    assert compress(str(source), str(tmp_path / "3.pdf"), "/screen")["cache"] == "miss"
+    assert len(calls) == 2
+    assert (tmp_path / "2.pdf").read_bytes() == (tmp_path / "1.pdf").read_bytes()
+
+
+def test_outputs_are_private_copies(tmp_path):
+    source = tmp_path / "in.pdf"
+    source.write_bytes(b"%PDF-1.4 " + b"a" * 500)
+    compress = ResultCache(str(tmp_path / "cache")).wrap("gs", fake_compress([]))
+    compress(str(source), str(tmp_path / "1.pdf"), "/ebook")
+    compress(str(source), str(tmp_path / "2.pdf"), "/ebook")
+    assert os.stat(tmp_path / "1.pdf").st_nlink == 1
+    assert os.stat(tmp_path / "2.pdf").st_nlink == 1
+    # Editing an output in place does not reach the cache
+    with open(tmp_path / "2.pdf", 'r+b') as f:
+        f.write(b"edited")
+    compress(str(source), str(tmp_path / "3.pdf"), "/ebook")
+    assert (tmp_path / "3.pdf").read_bytes() == (tmp_path / "1.pdf").read_bytes()
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    result_cache = ResultCache(str(tmp_path / "cache"), max_bytes=250)
+    compress = result_cache.wrap("gs", fake_compress([]))
+    sources = []
+    for i in range(3):
+        source = tmp_path / f"in{i}.pdf"
+        source.write_bytes(b"%PDF-1.4 " + bytes([97 + i]) * 500)
+        sources.append(source)
+    for i in range(2):
+        compress(str(sources[i]), str(tmp_path / f"out{i}.pdf"), "/ebook")
+        # Entry mtimes are the last-use times
+        time.sleep(0.01)
+    assert result_cache._total == 200
+    # Using the first entry again makes the second the oldest
+    assert compress(str(sources[0]), str(tmp_path / "again.pdf"), "/ebook") == {"cache": "hit"}
+    time.sleep(0.01)
+    compress(str(sources[2]), str(tmp_path / "out2.pdf"), "/ebook")
+    on_disk = sum(size for _mtime, size, _path in result_cache._entries())
+    assert on_disk == result_cache._total == 200
+    assert compress(str(sources[0]), str(tmp_path / "a.pdf"), "/ebook") == {"cache": "hit"}
+    assert compress(str(sources[1]), str(tmp_path / "b.pdf"), "/ebook")["cache"] == "miss"
@@ -0,0 +1,71 @@
+"""Identical inputs are compressed once per batch."""
+import threading
+
+from pdfcompressor import core
+from pdfcompressor.dedupe import DuplicateFinder
+from pdfcompressor.presets import load_rules
+
+SAME = b"%PDF-1.4 " + b"s" * 400
+
+
+def make_jobs(tmp_path, contents):
+    jobs = []
+    for name, data in contents:
+        path = tmp_path / name
+        path.write_bytes(data)
+        jobs.append((str(path), str(tmp_path / f"out-{name}")))
+    return jobs
+
+
+def run(jobs, duplicates, workers=3):
+    calls = []
+    lock = threading.Lock()
+
+    def compress(input_path, output_path, quality_setting):
+        with lock:
+            calls.append(input_path)
+        with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+            dst.write(src.read()[:50])
+        return {}
+
+    batch = core.compress_batch("gs", jobs, "/ebook", max_workers=workers, compress_func=compress,
+                                duplicates=duplicates)
+    return batch, calls
+
+
+def test_identical_inputs_run_once(tmp_path):
+    jobs = make_jobs(tmp_path, [("a.pdf", SAME), ("b.pdf", SAME), ("c.pdf", SAME),
+                                ("other.pdf", b"%PDF-1.4 " + b"o" * 400)])
+    batch, calls = run(jobs, DuplicateFinder())
+    assert len(calls) == 2
+    assert len(batch.results) == 4 and not batch.failed
+    copies = [r for r in batch.results if "duplicate_of" in r.extra]
+    assert len(copies) == 2
+    for input_path, output_path in jobs[:3]:
+        with open(output_path, 'rb') as f:
+            assert f.read() == SAME[:50]
+
+
+def test_same_size_other_content_runs_separately(tmp_path):
+    jobs = make_jobs(tmp_path, [("a.pdf", SAME), ("b.pdf", SAME[:-1] + b"x")])
+    _batch, calls = run(jobs, DuplicateFinder())
+    assert len(calls) == 2
+
+
+def test_rules_keep_duplicates_with_other_presets_apart(tmp_path):
+    rules, problems = load_rules([{"pattern": "arsip_*", "preset": "screen"}])
+    assert not problems
+    jobs = make_jobs(tmp_path, [("a.pdf", SAME), ("arsip_a.pdf", SAME), ("b.pdf", SAME)])
+    _batch, calls = run(jobs, DuplicateFinder(rules))
+    assert len(calls) == 2
+
+
+def test_failed_original_fails_its_copies(tmp_path):
+    jobs = make_jobs(tmp_path, [("a.pdf", SAME), ("b.pdf", SAME)])
+
+    def compress(input_path, output_path, quality_setting):
+        raise core.GhostscriptError(1, "broken")
+
+    batch = core.compress_batch("gs", jobs, "/ebook", max_workers=1, compress_func=compress,
+                                duplicates=DuplicateFinder())
+    assert len(batch.failed) == 2
@@ -0,0 +1,138 @@
+"""Resuming batches from the journal."""
+import json
+import os
+
+from pdfcompressor.core import FileResult
+from pdfcompressor.journal import DONE, FAILED, PENDING, BatchJournal
+
+SETTINGS = {"level": "/ebook", "engine": "spawn"}
+
+
+def make_jobs(tmp_path, count=3):
+    jobs = []
+    for i in range(count):
+        source = tmp_path / f"in{i}.pdf"
+        source.write_bytes(b"%PDF-1.4 input " + bytes([48 + i]) * 100)
+        jobs.append((str(source), str(tmp_path / f"out{i}.pdf")))
+    return jobs
+
+
+def finish(journal, jobs, failed=()):
+    """Record ``jobs`` as done (writing their outputs), except ``failed``"""
+    for input_path, output_path in jobs:
+        if input_path in failed:
+            journal.record(FileResult(input_path, output_path, original_size=115, error="Ghostscript error"))
+            continue
+        with open(output_path, 'wb') as f:
+            f.write(b"%PDF-1.4 out")
+        journal.record(FileResult(input_path, output_path, original_size=115, compressed_size=12, elapsed=0.5))
+
+
+def run_batch(path, jobs, settings=SETTINGS, failed=()):
+    with BatchJournal(path) as journal:
+        pending, resumed = journal.begin(jobs, settings)
+        finish(journal, pending, failed)
+
+
+def resume(path, jobs, settings=SETTINGS):
+    with BatchJournal(path) as journal:
+        pending, resumed = journal.begin(jobs, settings, resume=True)
+    return pending, resumed
+
+
+def test_records_reach_disk(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    jobs = make_jobs(tmp_path)
+    run_batch(path, jobs, failed={jobs[1][0]})
+    journal = BatchJournal(path)
+    assert journal.settings == SETTINGS
+    assert [journal.entries[i]["status"] for i, _o in jobs] == [DONE, FAILED, DONE]
+    assert journal.entries[jobs[0][0]]["sha256"]
+    assert journal.entries[jobs[0][0]]["input_size"] == os.path.getsize(jobs[0][0])
+    assert journal.unfinished() == [jobs[1]]
+
+
+def test_resume_skips_finished_jobs(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    jobs = make_jobs(tmp_path)
+    run_batch(path, jobs, failed={jobs[1][0]})
+    pending, resumed = resume(path, jobs)
+    assert pending == [jobs[1]]
+    assert [r.input_path for r in resumed] == [jobs[0][0], jobs[2][0]]
+    assert all(r.extra["resumed"] and r.compressed_size == 12 for r in resumed)
+    # The rewritten journal keeps the skipped jobs done and the rest pending
+    journal = BatchJournal(path)
+    assert journal.entries[jobs[0][0]]["status"] == DONE
+    assert journal.entries[jobs[1][0]]["status"] == PENDING
+
+
+def test_other_settings_run_everything(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    jobs = make_jobs(tmp_path)
+    run_batch(path, jobs)
+    pending, resumed = resume(path, jobs, dict(SETTINGS, level="/screen"))
+    assert pending == jobs
+    assert resumed == []
+
+
+def test_without_resume_everything_runs(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    jobs = make_jobs(tmp_path)
+    run_batch(path, jobs)
+    with BatchJournal(path) as journal:
+        pending, resumed = journal.begin(jobs, SETTINGS)
+    assert pending == jobs and resumed == []
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    jobs = make_jobs(tmp_path)
+    run_batch(str(path), jobs)
+    # A crash in the middle of the last line
+    data = path.read_bytes()
+    path.write_bytes(data[:-20])
+    journal = BatchJournal(str(path))
+    assert journal.settings == SETTINGS
+    lines = data.decode().splitlines()
+    torn = json.loads(lines[-1])["input"]
+    # The job's earlier pending line is what remains of it
+    assert journal.entries[torn]["status"] == PENDING
+    pending, resumed = resume(str(path), jobs)
+    assert pending == [job for job in jobs if job[0] == torn]
+    assert len(resumed) == 2
+
+
+def test_stale_outputs_are_redone(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    jobs = make_jobs(tmp_path)
+    run_batch(path, jobs)
+    os.remove(jobs[0][1])
+    with open(jobs[1][1], 'ab') as f:
+        f.write(b"edited")
+    pending, _resumed = resume(path, jobs)
+    assert pending == jobs[:2]
+
+
+def test_changed_inputs_are_redone(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    jobs = make_jobs(tmp_path)
+    run_batch(path, jobs)
+    # Touched but unchanged: the SHA-256 still matches
+    stat = os.stat(jobs[0][0])
+    os.utime(jobs[0][0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    # Same size, other content
+    data = open(jobs[1][0], 'rb').read()
+    with open(jobs[1][0], 'wb') as f:
+        f.write(data[:-1] + b"x")
+    pending, resumed = resume(path, jobs)
+    assert pending == [jobs[1]]
+    assert [r.input_path for r in resumed] == [jobs[0][0], jobs[2][0]]
+
+
+def test_outputs_elsewhere_are_redone(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    jobs = make_jobs(tmp_path)
+    run_batch(path, jobs)
+    moved = [(input_path, output_path.replace("out", "moved")) for input_path, output_path in jobs]
+    pending, _resumed = resume(path, moved)
+    assert pending == moved
@@ -0,0 +1,172 @@
+"""PdfDocument and the pre-flight scan over synthetic files."""
+import binascii
+import hashlib
+import struct
+
+import pytest
+
+from pdfcompressor import synthetic
+from pdfcompressor.pdfparse import PdfDocument, PdfError, _rc4
+from pdfcompressor.preflight import PreflightError, PreflightGate, analyze
+
+PAGES = 3
+
+
+def write(tmp_path, generator, name="doc.pdf", **options):
+    path = tmp_path / name
+    generator(str(path), PAGES, **options)
+    return path
+
+
+def damage(path, old, new):
+    data = path.read_bytes()
+    assert old in data
+    path.write_bytes(data.replace(old, new, 1))
+
+
+def test_classic_xref_text(tmp_path):
+    path = write(tmp_path, synthetic.text_pdf)
+    with PdfDocument(str(path)) as doc:
+        assert doc.page_count == PAGES
+        assert not doc.encrypted
+        assert not doc.repaired
+        assert all(kind != 2 for kind, _field, _index in doc.xref.values())
+    report = analyze(str(path))
+    assert report.error is None
+    assert report.pages == PAGES
+    assert report.images == 0
+    assert report.fonts == ["Helvetica"]
+    assert report.text_only
+
+
+def test_classic_xref_images(tmp_path):
+    path = write(tmp_path, synthetic.scan_pdf, width=64, height=64)
+    report = analyze(str(path))
+    assert report.pages == PAGES
+    assert report.images == PAGES
+    assert report.image_bytes > 0
+    assert not report.text_only
+
+
+def test_xref_stream_with_object_streams(tmp_path):
+    path = write(tmp_path, synthetic.duplicates_pdf, object_streams=True)
+    assert b"/Type /XRef" in path.read_bytes()
+    with PdfDocument(str(path)) as doc:
+        # The catalog, pages and fonts live in the object stream
+        assert any(kind == 2 for kind, _field, _index in doc.xref.values())
+        assert doc.page_count == PAGES
+        assert not doc.encrypted
+        assert not doc.repaired
+    report = analyze(str(path))
+    assert report.error is None
+    assert report.images == PAGES
+    assert report.fonts == ["Helvetica"]
+
+
+def test_object_streams_match_classic(tmp_path):
+    classic = analyze(str(write(tmp_path, synthetic.photo_pdf, "classic.pdf", width=64, height=48)))
+    compact = analyze(str(write(tmp_path, synthetic.photo_pdf, "compact.pdf", width=64, height=48,
+                                object_streams=True)))
+    assert (compact.pages, compact.images, compact.image_bytes, compact.fonts) == \
+        (classic.pages, classic.images, classic.image_bytes, classic.fonts)
+
+
+def test_shifted_offsets_force_rebuild(tmp_path):
+    path = write(tmp_path, synthetic.scan_pdf, width=64, height=64)
+    # Bytes inserted after the header move every object away from its xref offset
+    damage(path, b"\n1 0 obj", b"\n% padding that was not there when the xref was written\n1 0 obj")
+    with PdfDocument(str(path)) as doc:
+        assert doc.repaired
+        assert doc.page_count == PAGES
+    report = analyze(str(path))
+    assert report.repaired
+    assert report.images == PAGES
+    assert report.fonts == ["Helvetica"]
+
+
+def test_startxref_past_the_end_forces_rebuild(tmp_path):
+    path = write(tmp_path, synthetic.text_pdf)
+    data = path.read_bytes()
+    start = data.rindex(b"startxref")
+    path.write_bytes(data[:start] + b"startxref\n99999999\n%%EOF\n")
+    with PdfDocument(str(path)) as doc:
+        assert doc.repaired
+        assert doc.page_count == PAGES
+
+
+def test_encrypted(tmp_path):
+    path = write(tmp_path, synthetic.scan_pdf, width=64, height=64)
+    damage(path, b"trailer\n<< ", b"trailer\n<< /Encrypt << /Filter /Standard /V 1 /R 2 /P -4 >> ")
+    with PdfDocument(str(path)) as doc:
+        assert doc.encrypted
+        assert doc.page_count == PAGES
+    report = analyze(str(path))
+    assert report.encrypted
+    # Streams of encrypted files are not scanned
+    assert report.images == 0
+
+
+PAD = bytes.fromhex("28BF4E5E4E758A4164004E56FFFA01082E2E00B6D0683E802F0CA9FE6453697A")
+FILE_ID = bytes(range(16))
+OWNER = hashlib.md5(b"owner entry").digest() * 2
+
+
+def user_entry(password, revision, permissions=-3904):
+    """/U of the standard security handler (PDF 32000-1, algorithms 2, 4 and 5)"""
+    size = 5 if revision == 2 else 16
+    key = hashlib.md5((password + PAD)[:32] + OWNER + struct.pack("<i", permissions) + FILE_ID).digest()[:size]
+    if revision == 2:
+        return _rc4(key, PAD)
+    for _ in range(50):
+        key = hashlib.md5(key).digest()[:size]
+    data = _rc4(key, hashlib.md5(PAD + FILE_ID).digest())
+    for i in range(1, 20):
+        data = _rc4(bytes(b ^ i for b in key), data)
+    return data + bytes(16)
+
+
+def encrypt(path, password, revision):
+    hexed = lambda data: b"<" + binascii.hexlify(data) + b">"
+    length = b"" if revision == 2 else b" /Length 128"
+    damage(path, b"trailer\n<< ", b"trailer\n<< /Encrypt << /Filter /Standard /V %d /R %d%s /P -3904 /O %s /U %s >> "
+           b"/ID [%s %s] " % (1 if revision == 2 else 2, revision, length, hexed(OWNER),
+                              hexed(user_entry(password, revision)), hexed(FILE_ID), hexed(FILE_ID)))
+
+
+def test_rc4():
+    assert _rc4(b"Key", b"Plaintext").hex() == "bbf316e8d940af0ad3"
+
+
+@pytest.mark.parametrize("revision", [2, 3])
+@pytest.mark.parametrize("password, needed", [(b"", False), (b"secret", True)])
+def test_user_password(tmp_path, revision, password, needed):
+    path = write(tmp_path, synthetic.scan_pdf, width=64, height=64)
+    encrypt(path, password, revision)
+    with PdfDocument(str(path)) as doc:
+        assert doc.encrypted
+        assert doc.needs_password is needed
+
+
+def test_owner_password_only_is_compressed(tmp_path):
+    calls = []
+    gate = PreflightGate(lambda input_path, output_path, quality_setting: calls.append(input_path))
+    owner_only = write(tmp_path, synthetic.scan_pdf, name="restricted.pdf", width=64, height=64)
+    encrypt(owner_only, b"", 3)
+    locked = write(tmp_path, synthetic.scan_pdf, name="locked.pdf", width=64, height=64)
+    encrypt(locked, b"secret", 3)
+    report = analyze(str(owner_only))
+    assert report.encrypted and not report.needs_password
+    assert gate.verdict(report) is None
+    gate.compress(str(owner_only), str(tmp_path / "out.pdf"), "/ebook")
+    assert calls == [str(owner_only)]
+    with pytest.raises(PreflightError):
+        gate.compress(str(locked), str(tmp_path / "out.pdf"), "/ebook")
+    assert calls == [str(owner_only)]
+
+
+def test_not_a_pdf(tmp_path):
+    path = tmp_path / "notes.pdf"
+    path.write_bytes(b"just some text\n" * 10)
+    with pytest.raises(PdfError):
+        PdfDocument(str(path))
+    assert analyze(str(path)).error
@@ -0,0 +1,99 @@
+"""Compiling and checking custom presets."""
+import pytest
+
+from pdfcompressor import bench, core
+from pdfcompressor.presets import PresetError, compile_preset, parse_distiller_arguments, validate_preset
+
+
+def test_named_settings():
+    arguments = compile_preset("p", {"base": "ebook", "color_dpi": 150, "downsample_type": "bicubic",
+                                     "compatibility": 1.5, "fast_web_view": True})
+    assert arguments == ["-dPDFSETTINGS=/ebook", "-dDownsampleColorImages=true", "-dColorImageResolution=150",
+                         "-dColorImageDownsampleType=/Bicubic", "-dGrayImageDownsampleType=/Bicubic",
+                         "-dMonoImageDownsampleType=/Bicubic", "-dCompatibilityLevel=1.5", "-dFastWebView=true"]
+
+
+@pytest.mark.parametrize("spec", [
+    {"color_dpi": 0},
+    {"color_dpi": True},
+    {"jpeg_quality": 101},
+    {"downsample_type": "/Lanczos"},
+    {"fast_web_view": "yes"},
+    {"engine": "other"},
+    {"resolution": 150},
+])
+def test_invalid_settings(spec):
+    with pytest.raises(PresetError):
+        compile_preset("p", spec)
+
+
+def test_jpeg_quality_and_args_give_one_trailing_segment():
+    arguments = compile_preset("p", {"base": "/ebook", "jpeg_quality": 60, "args": ["-dDetectDuplicateImages=true"],
+                                     "distiller_params": {"ColorACSImageDict": {"QFactor": 0.5},
+                                                          "GrayImageDict": {"QFactor": 0.3}}})
+    assert arguments.count("-c") == 1
+    index = arguments.index("-c")
+    assert index == len(arguments) - 2
+    assert all(arg.startswith("-d") for arg in arguments[:index])
+    assert "-dColorImageFilter=/DCTEncode" in arguments[:index]
+    params = parse_distiller_arguments(arguments[index:])
+    assert params["ColorImageDict"]["QFactor"] == 0.8
+    assert params["GrayImageDict"] == {"QFactor": 0.3, "Blend": 1, "HSamples": [2, 1, 1, 2],
+                                       "VSamples": [2, 1, 1, 2]}
+    assert params["ColorACSImageDict"] == {"QFactor": 0.5}
+    # The compiled list passes its own check, and every -d flag goes before the output file
+    assert validate_preset("q", bench.preset_spec(arguments)) == arguments
+    command = core.build_command("gs", "in.pdf", "out.pdf", arguments)
+    output = command.index("-sOutputFile=out.pdf")
+    assert command[output + 1] == "-c"
+    assert all(not arg.startswith("-d") for arg in command[output:])
+
+
+@pytest.mark.parametrize("arguments", [
+    ["-dPDFSETTINGS=/ebook", "-c", "<< /ColorImageDict << /QFactor 0.4 >> >> setdistillerparams"],
+    ["-dPDFSETTINGS=/ebook", "-c", "(x) print"],
+    ["-dPDFSETTINGS=/ebook", "-f", "other.pdf"],
+    ["-sOutputFile=x.pdf"],
+    ["-dNOSAFER"],
+    ["--permit-file-read=/"],
+    ["/ebook"],
+])
+def test_list_presets_reject_postscript_and_reserved_arguments(arguments):
+    with pytest.raises(PresetError):
+        validate_preset("p", arguments)
+
+
+def test_args_cannot_carry_postscript():
+    with pytest.raises(PresetError):
+        compile_preset("p", {"jpeg_quality": 60, "args": ["-c", "<< >> setdistillerparams"]})
+
+
+@pytest.mark.parametrize("params", [
+    {"Run": "(file) run"},
+    {"ColorImageDict": {"QFactor": "0.4"}},
+    {"bad name": 1},
+    {"Blend": float("nan")},
+    {"Filter": "/DCT/Encode"},
+    ["ColorImageDict"],
+])
+def test_distiller_params_only_take_structured_values(params):
+    with pytest.raises(PresetError):
+        compile_preset("p", {"distiller_params": params})
+
+
+def test_harmless_names_are_accepted():
+    # Names that merely contain "run", "file" or "def" are fine
+    arguments = compile_preset("p", {"distiller_params": {"DefaultRenderingIntent": "/Default",
+                                                          "PreserveOverprintSettings": True}})
+    assert parse_distiller_arguments(arguments[-2:]) == {"DefaultRenderingIntent": "/Default",
+                                                         "PreserveOverprintSettings": True}
+
+
+@pytest.mark.parametrize("code", [
+    "<< /A 1 >> setdistillerparams exec",
+    "<< /A { run } >> setdistillerparams",
+    "<< /A 1 >> >> setdistillerparams",
+    "<< /A >> setdistillerparams",
+])
+def test_parse_only_accepts_written_code(code):
+    assert parse_distiller_arguments(["-c", code]) is None
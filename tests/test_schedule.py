@@ -0,0 +1,74 @@
+"""Cost model and longest-first ordering."""
+import pytest
+
+from pdfcompressor import schedule
+from pdfcompressor.core import BatchResult, FileResult
+from pdfcompressor.schedule import CostModel, Scheduler, fit_rates, simulate_makespan
+
+
+def test_fit_rates_recovers_both_rates():
+    samples = [(mb, pages, 0.4 * mb + 0.02 * pages) for mb, pages in [(1, 10), (5, 20), (2, 200), (8, 40), (3, 90)]]
+    per_mb, per_page = fit_rates(samples)
+    assert per_mb == pytest.approx(0.4)
+    assert per_page == pytest.approx(0.02)
+
+
+def test_fit_rates_falls_back_to_one_ratio():
+    # Pages always 10x megabytes: the two rates cannot be told apart
+    samples = [(mb, mb * 10, mb * 0.3) for mb in (1, 2, 4, 8)]
+    assert fit_rates(samples) == (pytest.approx(0.3), 0.0)
+
+
+def test_fit_rates_never_negative():
+    samples = [(1, 100, 0.1), (10, 1, 5.0), (2, 50, 0.2), (20, 2, 9.0)]
+    per_mb, per_page = fit_rates(samples)
+    assert per_mb >= 0 and per_page >= 0
+
+
+def test_fit_rates_without_sizes_uses_priors():
+    assert fit_rates([(0, 3, 1.0)]) == (schedule.PRIOR_SECONDS_PER_MB, schedule.PRIOR_SECONDS_PER_PAGE)
+
+
+def test_model_uses_priors_until_enough_samples(tmp_path):
+    path = str(tmp_path / "timings.json")
+    model = CostModel(path)
+    for _ in range(schedule.MIN_SAMPLES - 1):
+        model.record("/ebook", 1024 * 1024, 0, 2.0)
+    assert model.rates("/ebook") == (schedule.PRIOR_SECONDS_PER_MB, schedule.PRIOR_SECONDS_PER_PAGE)
+    model.record("/ebook", 1024 * 1024, 0, 2.0)
+    assert model.rates("/ebook") == (pytest.approx(2.0), 0.0)
+    model.save()
+    assert CostModel(path).rates("/ebook") == (pytest.approx(2.0), 0.0)
+    # Other settings keep their own history
+    assert CostModel(path).rates("/screen") == (schedule.PRIOR_SECONDS_PER_MB, schedule.PRIOR_SECONDS_PER_PAGE)
+
+
+def test_longest_first(tmp_path):
+    jobs = []
+    for name, size in (("small", 1000), ("large", 90000), ("medium", 20000)):
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(b"x" * size)
+        jobs.append((str(path), str(tmp_path / f"{name}-out.pdf")))
+    scheduler = Scheduler(CostModel(), scan=False)
+    assert [job[0] for job in scheduler.order_jobs(jobs, "/ebook")] == [jobs[1][0], jobs[2][0], jobs[0][0]]
+    assert Scheduler(CostModel(), order="fifo", scan=False).order_jobs(jobs, "/ebook") == jobs
+
+
+def test_record_skips_jobs_that_did_not_run(tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"x" * 1000)
+    model = CostModel()
+    batch = BatchResult(results=[
+        FileResult(str(path), "o1", original_size=1000, elapsed=1.0),
+        FileResult(str(path), "o2", original_size=1000, elapsed=1.0, error="failed"),
+        FileResult(str(path), "o3", original_size=1000, extra={"cache": "hit"}),
+        FileResult(str(path), "o4", original_size=1000, extra={"duplicate_of": "x"}),
+    ])
+    Scheduler(model, scan=False).record(batch, "/ebook")
+    assert len(model.samples["/ebook"]) == 1
+
+
+def test_simulate_makespan():
+    assert simulate_makespan([4, 3, 2, 1], 2) == 5
+    assert simulate_makespan([1, 2, 3, 4], 2) == 6
+    assert simulate_makespan([], 4) == 0
@@ -0,0 +1,52 @@
+"""Coalescing worker updates on the UpdateBus."""
+import threading
+
+from pdfcompressor.uibus import UpdateBus, apply_updates
+
+
+def test_only_newest_value_per_key():
+    bus = UpdateBus()
+    seen = []
+    for i in range(1000):
+        bus.post("progress", i / 1000)
+    bus.post("status", "done")
+    apply_updates(bus, {"progress": lambda v: seen.append(("progress", v)),
+                        "status": lambda v: seen.append(("status", v))})
+    assert sorted(seen) == [("progress", 0.999), ("status", "done")]
+    assert bus.merged == 999
+
+
+def test_calls_run_in_order_after_earlier_state():
+    bus = UpdateBus()
+    log = []
+    handlers = {"status": lambda v: log.append(v)}
+    bus.post("status", "working")
+    bus.call(log.append, "first")
+    bus.post("status", "between")
+    bus.call(log.append, "second")
+    bus.post("status", "last")
+    apply_updates(bus, handlers)
+    assert log == ["working", "first", "between", "second", "last"]
+    # Nothing is applied twice
+    apply_updates(bus, handlers)
+    assert len(log) == 5
+
+
+def test_posts_from_many_threads():
+    bus = UpdateBus()
+    calls = []
+
+    def worker(n):
+        for i in range(200):
+            bus.post(f"w{n}", i)
+        bus.call(calls.append, n)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    state = {}
+    apply_updates(bus, {f"w{n}": (lambda n: lambda v: state.__setitem__(n, v))(n) for n in range(8)})
+    assert sorted(calls) == list(range(8))
+    assert state == {n: 199 for n in range(8)}